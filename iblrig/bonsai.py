@@ -10,6 +10,7 @@ from pythonosc import udp_client
 
 import iblrig.params as params
 from iblrig import path_helper
+from iblrig.osc_client import BonsaiOscClient
 
 log = logging.getLogger("iblrig")
 
@@ -226,18 +227,28 @@ else:
             log.error("Can't send trial info to Bonsai osc_client = None")
             raise UnboundLocalError("Can't send trial info to Bonsai osc_client = None")
         # tph.position = tph.position  # (2/3)*t_position/180
-        tph.osc_client.send_message("/t", tph.trial_num)
-        tph.osc_client.send_message("/p", tph.position)
-        tph.osc_client.send_message("/h", tph.stim_phase)
-        if "training" in tph.task_protocol:
-            tph.osc_client.send_message("/c", tph.contrast.value)
-        else:
-            tph.osc_client.send_message("/c", tph.contrast)
-        tph.osc_client.send_message("/f", tph.stim_freq)
-        tph.osc_client.send_message("/a", tph.stim_angle)
-        tph.osc_client.send_message("/g", tph.stim_gain)
-        tph.osc_client.send_message("/s", tph.stim_sigma)
-        tph.osc_client.send_message("/r", tph.stim_reverse)
+        messages = {
+            "/t": tph.trial_num,
+            "/p": tph.position,
+            "/h": tph.stim_phase,
+            "/c": tph.contrast.value if "training" in tph.task_protocol else tph.contrast,
+            "/f": tph.stim_freq,
+            "/a": tph.stim_angle,
+            "/g": tph.stim_gain,
+            "/s": tph.stim_sigma,
+            "/r": tph.stim_reverse,
+        }
+        return _send_trial_messages(tph.osc_client, messages)
+
+    def _send_trial_messages(osc_client, messages):
+        """One bundle with a sequence number if the client supports it, a message per address otherwise"""
+        if not isinstance(osc_client, BonsaiOscClient):
+            [osc_client.send_message(address, value) for address, value in messages.items()]
+            return
+        seq = osc_client.send_bundle(messages)
+        # detect a dropped update before the stimulus is shown
+        osc_client.wait_ack(seq)
+        return seq
 
     def send_stim_info(
         osc_client,
@@ -255,16 +266,19 @@ else:
         if osc_client is None:
             log.error("Can't send trial info to Bonsai osc_client = None")
             raise UnboundLocalError("Can't send trial info to Bonsai osc_client = None")
-        osc_client.send_message("/t", trial_num)
-        osc_client.send_message("/p", position)
-        osc_client.send_message("/h", phase)
-        osc_client.send_message("/c", contrast)
-        # Consatants
-        osc_client.send_message("/f", freq)
-        osc_client.send_message("/a", angle)
-        osc_client.send_message("/g", gain)
-        osc_client.send_message("/s", sigma)
-        osc_client.send_message("/r", reverse)
+        messages = {
+            "/t": trial_num,
+            "/p": position,
+            "/h": phase,
+            "/c": contrast,
+            # Consatants
+            "/f": freq,
+            "/a": angle,
+            "/g": gain,
+            "/s": sigma,
+            "/r": reverse,
+        }
+        return _send_trial_messages(osc_client, messages)
 
     def start_frame2ttl_test(data_file, lengths_file, harp=False, display_idx=1):
         here = os.getcwd()
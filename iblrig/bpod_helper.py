@@ -89,6 +89,63 @@ class BpodMessageCreator(object):
         return self.bpod
 
 
+class StateMachineTemplate(object):
+    """
+    State machines built once per trial type and patched with the timers of each trial
+
+    The states of a trial type are added once by build(sma, *trial_type), and the part of the
+    message to Bpod that does not depend on the state timers is serialized at the same time.
+    For each trial only the state timers are set and serialized.
+
+    :param bpod: Bpod instance
+    :param build: function adding the states to a StateMachine, build(sma, *trial_type)
+    """
+
+    def __init__(self, bpod, build):
+        self.bpod = bpod
+        self.build = build
+        self._templates = {}  # {trial_type: (sma, serialized message without the state timers)}
+
+    def prebuild(self, trial_types: list) -> None:
+        for trial_type in trial_types:
+            self._get_template(trial_type)
+
+    def _get_template(self, trial_type: tuple):
+        if trial_type not in self._templates:
+            sma = StateMachine(self.bpod)
+            self.build(sma, *trial_type)
+            sma.update_state_numbers()
+            self._templates[trial_type] = (sma, sma.build_message() + sma.build_message_global_timer())
+        return self._templates[trial_type]
+
+    def get(self, trial_type: tuple, timers: dict) -> StateMachine:
+        """
+        State machine of a trial type, ready to be sent with the timers of the trial
+
+        :param trial_type: arguments of build after the state machine, ex: (first_trial, event_error, event_reward)
+        :param timers: {state_name: state timer in seconds} of the trial
+        :return: StateMachine
+        """
+        sma, _ = self._get_template(trial_type)
+        for state_name, state_timer in timers.items():
+            sma.state_timers[sma.manifest.index(state_name)] = state_timer
+        # the same instance runs several trials
+        sma.current_state = 0
+        sma.is_running = False
+        return sma
+
+    def send(self, sma: StateMachine, run_asap=None) -> None:
+        """Same as Bpod.send_state_machine, with the message serialized once per trial type"""
+        if not self.bpod.bpod_com_ready:
+            raise Exception("Bpod connection is closed")
+        if self.bpod._skip_all_trials is True:
+            return
+        message = next(msg for x, msg in self._templates.values() if x is sma)
+        body = message + sma.build_message_32_bits()
+        self.bpod._bpodcom_send_state_machine(sma.build_header(run_asap, len(body)) + body)
+        self.bpod._new_sma_sent = True
+
+
 def bpod_lights(comport: str, command: int):
     if not comport:
         comport = params.get_board_comport()
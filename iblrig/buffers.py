@@ -0,0 +1,136 @@
+"""
+Fixed size buffers and running statistics of the trial handlers, constant time per trial
+
+RingBuffer keeps the latest values in a preallocated array, a new value overwrites the oldest
+one instead of shifting all the others. Several buffers can be stacked, ex: the correct trials of
+the adaptive contrast, one buffer per side and contrast:
+    buffer = RingBuffer(50, shape=(2, 6), axis=1)
+    buffer.append(1, index=(side_idx, contrast_idx))
+    buffer.sum()  # (2, 6) sums of the buffers, updated on append
+    buffer.tolist()  # (2, 50, 6) nested list, oldest values first, as written to the data file
+
+RunningMedian is the median of all the values appended so far, and of the latest of them:
+    rt = RunningMedian(window=20)
+    rt.append(response_time)
+    rt.median(), rt.median(last=20)
+"""
+import heapq
+import math
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    Latest size values, appended in O(1)
+
+    :param size: number of values kept
+    :param shape: shape of the stack of buffers, () for a single buffer
+    :param axis: axis of the values in the arrays returned by to_numpy and tolist
+    :param fill: initial value
+    :param dtype: dtype of the values
+    """
+
+    def __init__(self, size: int, shape: tuple = (), axis: int = -1, fill=0, dtype=float):
+        self.size = size
+        self.axis = axis
+        self.count = 0  # number of values appended
+        self._data = np.full(tuple(shape) + (size,), fill, dtype=dtype)
+        self._head = np.zeros(shape, dtype=int)  # index of the oldest value of each buffer
+        self._sum = np.array(self._data.sum(axis=-1))
+
+    @classmethod
+    def from_list(cls, values, axis: int = -1, dtype=float):
+        """Buffer holding values as returned by tolist, oldest first"""
+        values = np.moveaxis(np.asarray(values, dtype=dtype), axis, -1)
+        buffer = cls(values.shape[-1], shape=values.shape[:-1], axis=axis, dtype=dtype)
+        buffer._data[...] = values
+        buffer._sum = np.array(buffer._data.sum(axis=-1))
+        return buffer
+
+    def append(self, value, index: tuple = ()) -> None:
+        """Replace the oldest value of the buffer at index by value"""
+        head = self._head[index]
+        self._sum[index] += value - self._data[index + (head,)]
+        self._data[index + (head,)] = value
+        self._head[index] = (head + 1) % self.size
+        self.count += 1
+
+    def sum(self) -> np.ndarray:
+        """Sum of the values of each buffer, kept up to date on append, exact for integer values"""
+        return self._sum.copy()
+
+    def to_numpy(self) -> np.ndarray:
+        """Values of the buffers, oldest first along axis"""
+        order = (self._head[..., np.newaxis] + np.arange(self.size)) % self.size
+        return np.moveaxis(np.take_along_axis(self._data, order, axis=-1), -1, self.axis)
+
+    def tolist(self) -> list:
+        return self.to_numpy().tolist()
+
+    def reprJSON(self):
+        return self.tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_numpy() if dtype is None else self.to_numpy().astype(dtype)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __repr__(self):
+        return f"RingBuffer({self.tolist()})"
+
+
+class RunningMedian(object):
+    """
+    Median of the values appended so far, in O(log n) per value with two heaps, and median of the
+    latest values of a window. NaN values make the median NaN, as with np.median.
+
+    :param window: number of latest values kept for median(last=n), n <= window
+    """
+
+    def __init__(self, window: int = 20):
+        self._low = []  # max heap of the lower half of the values, negated
+        self._high = []  # min heap of the upper half of the values
+        self._nans = 0
+        self._latest = RingBuffer(window)
+
+    def append(self, value: float) -> None:
+        self._latest.append(value)
+        if math.isnan(value):
+            self._nans += 1
+        elif self._low and value > -self._low[0]:
+            heapq.heappush(self._high, value)
+        else:
+            heapq.heappush(self._low, -value)
+        # the lower half holds the extra value when the count is odd
+        if len(self._low) > len(self._high) + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+        elif len(self._high) > len(self._low):
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+
+    def median(self, last: int = None) -> float:
+        """
+        :param last: if set, median of the last values only
+        :return: median, NaN if there are no values
+        """
+        if last is not None:
+            if last > self._latest.size:
+                raise ValueError(f"Only the latest {self._latest.size} values are kept")
+            n = min(last, self._latest.count)
+            return float(np.median(self._latest.to_numpy()[self._latest.size - n:])) if n else math.nan
+        if self._nans or not self._low:
+            return math.nan
+        if len(self._low) > len(self._high):
+            return float(-self._low[0])
+        return (-self._low[0] + self._high[0]) / 2
+
+    def reprJSON(self):
+        # only the statistics are written to the data file, not the values
+        return {"count": len(self), "median": self.median()}
+
+    def __len__(self):
+        return len(self._low) + len(self._high) + self._nans
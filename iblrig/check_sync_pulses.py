@@ -47,29 +47,22 @@ if __name__ == "__main__":
     if not session_data_file.exists():
         raise FileNotFoundError(f"{session_data_file}")
     if session_data_file.name.endswith(".jsonable"):
-        data = raw.load_data(session_data_file.parent.parent)
+        data = raw.load_data(session_data_file.parent.parent, format="columnar")
     else:
         try:
-            data = raw.load_data(session_data_file)
+            data = raw.load_data(session_data_file, format="columnar")
         except Exception:
             print("Not a file or a valid session folder")
-    unsynced_trial_count = 0
-    frame2ttl = []
-    sound = []
-    camera = []
-    trial_end = []
-    for trial_data in data:
-        tevents = trial_data["behavior_data"]["Events timestamps"]
-        ev_bnc1 = get_port_events(tevents, name="BNC1")
-        ev_bnc2 = get_port_events(tevents, name="BNC2")
-        ev_port1 = get_port_events(tevents, name="Port1")
-        if not ev_bnc1 or not ev_bnc2 or not ev_port1:
-            unsynced_trial_count += 1
-        frame2ttl.extend(ev_bnc1)
-        sound.extend(ev_bnc2)
-        camera.extend(ev_port1)
-        trial_end.append(trial_data["behavior_data"]["Trial end timestamp"])
-    print(f"Found {unsynced_trial_count} trials with bad sync data")
+    ntrials = data["trials_end"].size
+    unsynced = np.zeros(ntrials, dtype=bool)
+    fronts = {}
+    for name in ["BNC1", "BNC2", "Port1"]:
+        mask = raw.columnar_events_mask(data, name=name)
+        unsynced |= np.bincount(data["events_trial"][mask], minlength=ntrials) == 0
+        fronts[name] = np.sort(data["events_times"][mask])
+    frame2ttl, sound, camera = fronts["BNC1"], fronts["BNC2"], fronts["Port1"]
+    trial_end = data["trials_end"]
+    print(f"Found {np.sum(unsynced)} trials with bad sync data")
 
     f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
     ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
@@ -0,0 +1,147 @@
+"""
+Compression of the raw video and microphone files of the sessions before their transfer
+
+Sessions with a compress_me.flag file are compressed: the camera AVIs to mp4 (h264) and the
+microphone WAV to flac, with ffmpeg. A compressed file replaces the raw one only once its
+number of frames (samples for the audio) matches: the embedded frame counter of the camera
+for videos, the raw file otherwise. The compress_me.flag file is removed once all the files
+of the session are processed, and transfer_rig_data does not move a session before that.
+
+More file types are compressed by adding to COMPRESSORS.
+
+Usage:
+    compress_sessions("C:\\iblrig_data\\Subjects", max_workers=2, nice=10)
+"""
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from sys import platform
+from typing import Union
+
+import iblrig.raw_data_loaders as raw
+
+log = logging.getLogger("iblrig")
+
+FLAG_FILE_NAME = "compress_me.flag"
+TMP_SUFFIX = ".compressing"
+# glob pattern of the raw files, in the session folder: suffix of the compressed file, ffmpeg output options
+COMPRESSORS = {
+    "raw_video_data/_iblrig_*Camera.raw.avi": (".mp4", ["-codec:v", "libx264", "-preset", "slow", "-crf", "17"]),
+    "raw_behavior_data/_iblrig_micData.raw.wav": (".flac", ["-codec:a", "flac"]),
+}
+
+
+def _priority_kwargs(nice: int) -> dict:
+    """subprocess keyword arguments to run ffmpeg with a lower priority than the rig software"""
+    if not nice:
+        return {}
+    if platform == "win32":
+        return {"creationflags": subprocess.IDLE_PRIORITY_CLASS if nice >= 10 else subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    return {"preexec_fn": lambda: os.nice(nice)}
+
+
+def count_frames(file_path: Union[str, Path]):
+    """
+    Number of video frames, or of audio samples, of a media file, with ffprobe. The video
+    packets are counted without decoding them.
+
+    :return: int, None if ffprobe failed
+    """
+    cmd = ["ffprobe", "-v", "error", "-count_packets", "-show_entries", "stream=codec_type,nb_read_packets,duration_ts",
+           "-of", "default=noprint_wrappers=1", str(file_path)]
+    out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if out.returncode:
+        log.error(f"ffprobe failed on {file_path}: {out.stderr.decode(errors='replace')}")
+        return
+    info = dict(re.findall(r"(\w+)=(\S+)", out.stdout.decode()))
+    key = "nb_read_packets" if info.get("codec_type") == "video" else "duration_ts"
+    return int(info[key]) if info.get(key, "N/A").isdigit() else None
+
+
+def _expected_frames(session_path: Path, raw_file: Path):
+    label = re.match(r"_iblrig_(\w+)Camera\.raw", raw_file.name)
+    if label:
+        count = raw.load_camera_frame_count(session_path, label.group(1))
+        if count is not None:
+            return len(count)
+    return count_frames(raw_file)
+
+
+def compress_file(session_path: Union[str, Path], raw_file: Union[str, Path], suffix: str, options: list,
+                  nice: int = 10, threads: int = 2) -> Path:
+    """
+    Compress a raw file, and replace it by the compressed file if their number of frames match
+
+    :param session_path: session folder
+    :param raw_file: raw file to compress
+    :param suffix: suffix of the compressed file, ex: '.mp4'
+    :param options: ffmpeg output options, ex: ['-codec:a', 'flac']
+    :param nice: priority of the ffmpeg process, 0 for normal, up to 19 for the lowest
+    :param threads: threads used by ffmpeg
+    :return: compressed file, None if the compression failed and the raw file was kept
+    """
+    session_path, raw_file = Path(session_path), Path(raw_file)
+    out_file = raw_file.with_suffix(suffix)
+    tmp_file = raw_file.with_suffix(TMP_SUFFIX + suffix)
+    cmd = ["ffmpeg", "-y", "-nostdin", "-loglevel", "error", "-i", str(raw_file), "-threads", str(threads), *options,
+           str(tmp_file)]
+    log.info(f"Compressing {raw_file}")
+    out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **_priority_kwargs(nice))
+    if out.returncode:
+        log.error(f"ffmpeg failed to compress {raw_file}: {out.stderr.decode(errors='replace')}")
+        if tmp_file.exists():
+            tmp_file.unlink()
+        return
+    expected, compressed = _expected_frames(session_path, raw_file), count_frames(tmp_file)
+    if expected is None or expected != compressed:
+        log.error(f"{raw_file}: {compressed} frames compressed out of {expected}, keeping the raw file")
+        tmp_file.unlink()
+        return
+    os.replace(tmp_file, out_file)
+    raw_file.unlink()
+    log.info(f"Compressed {raw_file} to {out_file.name}, {expected} frames")
+    return out_file
+
+
+def compress_sessions(subjects_folder: Union[str, Path], max_workers: int = None, nice: int = 10,
+                      idle_secs: float = 120) -> list:
+    """
+    Compress the files of the sessions with a compress_me.flag file, several files at a time
+
+    :param subjects_folder: local Subjects folder
+    :param max_workers: number of ffmpeg processes at a time, defaults to a quarter of the CPUs
+    :param nice: priority of the ffmpeg processes, 0 for normal, up to 19 for the lowest
+    :param idle_secs: sessions with a file modified more recently are still being acquired, and
+     left for later
+    :return: list of the compressed files
+    """
+    now = time.time()
+    session_paths = [
+        f.parent for f in Path(subjects_folder).rglob(FLAG_FILE_NAME)
+        if not any(now - x.stat().st_mtime < idle_secs for x in f.parent.rglob("*") if x.is_file() and x != f)
+    ]
+    if not session_paths:
+        return []
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        log.warning("NOT FOUND: ffmpeg, sessions are transferred uncompressed")
+        for session_path in session_paths:
+            session_path.joinpath(FLAG_FILE_NAME).unlink()
+        return []
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // 4)
+    jobs = [
+        (session_path, raw_file, suffix, options)
+        for session_path in session_paths
+        for pattern, (suffix, options) in COMPRESSORS.items()
+        for raw_file in sorted(session_path.glob(pattern))
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # each job waits on its ffmpeg process, so that max_workers bounds the CPU used
+        compressed = list(executor.map(lambda job: compress_file(*job, nice=nice), jobs))
+    for session_path in session_paths:
+        session_path.joinpath(FLAG_FILE_NAME).unlink()
+    return [f for f in compressed if f is not None]
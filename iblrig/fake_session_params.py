@@ -39,15 +39,9 @@ class SessionParamHandler(object):
         }
         self.__dict__.update(us)
         self = iotasks.deserialize_pybpod_user_settings(self)
-        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make)
+        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make, previous_session=False)
         self.__dict__.update(spc.__dict__)
 
-        # =====================================================================
-        # SUBJECT
-        # =====================================================================
-        self.SUBJECT_WEIGHT = user.ask_subject_weight(self.PYBPOD_SUBJECTS[0])
-        self.SUBJECT_DISENGAGED_TRIGGERED = False
-        self.SUBJECT_DISENGAGED_TRIALNUM = None
         # =====================================================================
         # OSC CLIENT
         # =====================================================================
@@ -55,35 +49,10 @@ class SessionParamHandler(object):
         self.OSC_CLIENT_IP = "127.0.0.1"
         self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
         # =====================================================================
-        # PREVIOUS DATA FILES
-        # =====================================================================
-        self.LAST_TRIAL_DATA = iotasks.load_data(self.PREVIOUS_SESSION_PATH)
-        self.LAST_SETTINGS_DATA = iotasks.load_settings(self.PREVIOUS_SESSION_PATH)
-        # =====================================================================
-        # ADAPTIVE STUFF
-        # =====================================================================
-        self.AR_MIN_VALUE = 1.5 if "Sucrose" in self.REWARD_TYPE else 2.0
-        self.REWARD_AMOUNT = adaptive.init_reward_amount(self)
-        self.CALIB_FUNC = None
-        if self.AUTOMATIC_CALIBRATION:
-            self.CALIB_FUNC = adaptive.init_calib_func()
-        self.CALIB_FUNC_RANGE = adaptive.init_calib_func_range()
-        self.REWARD_VALVE_TIME = adaptive.init_reward_valve_time(self)
-        self.STIM_GAIN = adaptive.init_stim_gain(self)
-        self.IMPULSIVE_CONTROL = "OFF"
-        self = adaptive.impulsive_control(self)
-        # =====================================================================
         # frame2TTL
         # =====================================================================
         self.F2TTL_GET_AND_SET_THRESHOLDS = frame2TTL.get_and_set_thresholds()
         # =====================================================================
-        # ROTARY ENCODER
-        # =====================================================================
-        self.ALL_THRESHOLDS = self.STIM_POSITIONS + self.QUIESCENCE_THRESHOLDS
-        self.ROTARY_ENCODER = MyRotaryEncoder(
-            self.ALL_THRESHOLDS, self.STIM_GAIN, self.PARAMS["COM_ROTARY_ENCODER"]
-        )
-        # =====================================================================
         # SOUNDS
         # =====================================================================
         self.SOFT_SOUND = None if "ephys" in self.PYBPOD_BOARD else self.SOFT_SOUND
@@ -115,6 +84,37 @@ class SessionParamHandler(object):
         self.OUT_TONE = ("SoftCode", 1) if self.SOFT_SOUND else ("Serial3", 6)
         self.OUT_NOISE = ("SoftCode", 2) if self.SOFT_SOUND else ("Serial3", 7)
         # =====================================================================
+        # SUBJECT
+        # =====================================================================
+        self.SUBJECT_WEIGHT = user.ask_subject_weight(self.PYBPOD_SUBJECTS[0])
+        self.SUBJECT_DISENGAGED_TRIGGERED = False
+        self.SUBJECT_DISENGAGED_TRIALNUM = None
+        # =====================================================================
+        # PREVIOUS DATA FILES
+        # =====================================================================
+        # waits for the lookup started by the SessionPathCreator, which ran while the devices were set up
+        self.LAST_TRIAL_DATA, self.LAST_SETTINGS_DATA = iotasks.load_previous_session(self)
+        # =====================================================================
+        # ADAPTIVE STUFF
+        # =====================================================================
+        self.AR_MIN_VALUE = 1.5 if "Sucrose" in self.REWARD_TYPE else 2.0
+        self.REWARD_AMOUNT = adaptive.init_reward_amount(self)
+        self.CALIB_FUNC = None
+        if self.AUTOMATIC_CALIBRATION:
+            self.CALIB_FUNC = adaptive.init_calib_func()
+        self.CALIB_FUNC_RANGE = adaptive.init_calib_func_range()
+        self.REWARD_VALVE_TIME = adaptive.init_reward_valve_time(self)
+        self.STIM_GAIN = adaptive.init_stim_gain(self)
+        self.IMPULSIVE_CONTROL = "OFF"
+        self = adaptive.impulsive_control(self)
+        # =====================================================================
+        # ROTARY ENCODER
+        # =====================================================================
+        self.ALL_THRESHOLDS = self.STIM_POSITIONS + self.QUIESCENCE_THRESHOLDS
+        self.ROTARY_ENCODER = MyRotaryEncoder(
+            self.ALL_THRESHOLDS, self.STIM_GAIN, self.PARAMS["COM_ROTARY_ENCODER"]
+        )
+        # =====================================================================
         # RUN VISUAL STIM
         # =====================================================================
         bonsai.start_visual_stim(self)
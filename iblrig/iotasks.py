@@ -6,15 +6,24 @@
 """
 Saving, loading, and zip functionality
 """
+import datetime
+import itertools
 import json
 import logging
+import math
 import os
 import shutil
+import time
 import zipfile
 from pathlib import Path
 
 import numpy as np
 
+try:
+    import orjson
+except ImportError:  # the stdlib json encoder is used instead
+    orjson = None
+
 import iblrig.misc as misc
 import iblrig.path_helper as ph
 import iblrig.raw_data_loaders as raw
@@ -27,10 +36,198 @@ class ComplexEncoder(json.JSONEncoder):
     def default(self, obj):
         if hasattr(obj, "reprJSON"):
             return obj.reprJSON()
+        elif isinstance(obj, (np.ndarray, np.generic)):
+            return obj.tolist()
+        elif isinstance(obj, (datetime.date, datetime.time)):
+            return obj.isoformat()
         else:
             return json.JSONEncoder.default(self, obj)
 
 
+# orjson writes NaN and infinities as null, they are swapped for strings that are replaced in the output
+_NONFINITE = {"NaN": "\x00NaN\x00", "Infinity": "\x00Infinity\x00", "-Infinity": "\x00-Infinity\x00"}
+_NONFINITE_OUT = [(json.dumps(v).encode(), k.encode()) for k, v in _NONFINITE.items()]
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else None
+
+
+_SCALARS = (str, int, bool, type(None))
+# orjson writes numpy float32 scalars in their shortest form (0.1), unlike the stdlib encoder
+_PLAIN_NUMBERS = frozenset((float, int, bool))
+
+
+def _all_finite_numbers(seq) -> bool:
+    # lists of plain numbers, or of lists of plain numbers, are checked at C speed: their sum is finite if all of them are
+    types = set(map(type, seq))
+    if not types <= _PLAIN_NUMBERS:
+        if not types <= {list, tuple}:
+            return False
+        types = set(map(type, itertools.chain.from_iterable(seq)))
+        if not types <= _PLAIN_NUMBERS:
+            return False
+        seq = map(sum, seq)
+    try:
+        return math.isfinite(sum(seq, 0.0))
+    except OverflowError:
+        return False
+
+
+def _nonfinite_to_str(obj):
+    # obj ready for orjson, only the containers holding non finite floats are copied
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else _NONFINITE["NaN" if obj != obj else ("Infinity" if obj > 0 else "-Infinity")]
+    if hasattr(obj, "reprJSON"):
+        obj = obj.reprJSON()
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, (list, tuple)):
+        if _all_finite_numbers(obj):
+            return obj
+        items = enumerate(obj)
+    elif isinstance(obj, np.ndarray):
+        # orjson writes float32 arrays in their shortest form (0.1), the stdlib encoder writes the
+        # float64 value of each element (0.10000000149011612): only float64 arrays are left to orjson
+        if obj.dtype.kind in "biu" or (obj.dtype == np.float64 and np.isfinite(obj).all()):
+            return np.ascontiguousarray(obj)
+        return _nonfinite_to_str(obj.tolist())
+    elif isinstance(obj, np.floating):
+        return _nonfinite_to_str(float(obj))
+    else:
+        return obj
+    out = None
+    for k, v in items:
+        # most values are scalars, checked here rather than by a call
+        if type(v) in _SCALARS or (type(v) is float and v - v == 0):
+            continue
+        new = _nonfinite_to_str(v)
+        if new is not v:
+            if out is None:
+                out = dict(obj) if isinstance(obj, dict) else list(obj)
+            out[k] = new
+    return obj if out is None else out
+
+
+def to_json(obj) -> str:
+    """
+    Compact JSON of obj, as json.dumps(obj, cls=ComplexEncoder, separators=(",", ":"))
+
+    orjson is used when it is installed, its output decodes to the same values as the one of the
+    stdlib encoder, though floats may be formatted differently (1e-05 as 0.00001) and strings are
+    not escaped to ASCII. Objects with a reprJSON method, numpy arrays and scalars and datetimes
+    are supported by both encoders; arrays other than float64, integer and boolean ones are
+    converted to lists first so that float32 values are written as by the stdlib encoder.
+
+    :param obj: JSON serializable object
+    :return: str
+    """
+    if orjson is not None:
+        try:
+            out = orjson.dumps(_nonfinite_to_str(obj), default=ComplexEncoder().default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            log.debug("orjson could not serialize the object, falling back to the stdlib encoder")
+        else:
+            for encoded, nonfinite in _NONFINITE_OUT:
+                if encoded in out:
+                    out = out.replace(encoded, nonfinite)
+            return out.decode()
+    return json.dumps(obj, cls=ComplexEncoder, separators=(",", ":"))
+
+
+def recover_jsonable(file_path) -> int:
+    """
+    Repair the last line of a jsonable file left incomplete by a crash while it was written.
+    A last line that decodes only misses its newline, which is added; otherwise it is removed.
+
+    :param file_path: path of the jsonable file
+    :return: number of bytes removed
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return 0
+    with open(file_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return 0
+        # look for the start of the last line backwards, one block at a time
+        start = size
+        while start > 0:
+            step = min(start, 2 ** 16)
+            f.seek(start - step)
+            block = f.read(step)
+            start -= step
+            if b"\n" in block:
+                start += block.rindex(b"\n") + 1
+                break
+        f.seek(start)
+        last_line = f.read()
+        try:
+            json.loads(last_line)
+        except ValueError:
+            f.truncate(start)
+            log.warning(f"Removed an incomplete last trial of {size - start} bytes from {file_path}")
+            return size - start
+        f.seek(size)
+        f.write(b"\n")
+    return 0
+
+
+class TrialDataWriter(object):
+    """
+    Appends one JSON record per trial to the task data file, keeping the file open for the session
+
+    Each record is flushed to the OS when written, so that it is not lost if the task crashes,
+    and synced to the disk every fsync_trials trials or fsync_secs seconds, whichever comes first,
+    so that at most that much is lost on a power cut. An incomplete last line left by a previous
+    crash is repaired before appending.
+
+    :param file_path: path of the _iblrig_taskData.raw.jsonable file
+    :param fsync_trials: number of trials between two syncs to the disk, 1 to sync every trial
+    :param fsync_secs: maximum time between two syncs to the disk
+    :param delta: if True trials are written as changes from the previous trial,
+     see raw_data_loaders.TrialDeltaEncoder
+    """
+
+    def __init__(self, file_path, fsync_trials: int = 10, fsync_secs: float = 60, delta: bool = False):
+        self.file_path = Path(file_path)
+        self.fsync_trials = fsync_trials
+        self.fsync_secs = fsync_secs
+        self.encoder = raw.TrialDeltaEncoder() if delta else None
+        recover_jsonable(self.file_path)
+        self.file = open(self.file_path, "a", encoding="utf-8")
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def __str__(self):
+        return str(self.file_path)
+
+    def reprJSON(self):
+        return str(self.file_path)
+
+    def write(self, record: dict) -> str:
+        """Append the record as one line of JSON, returns the line"""
+        if self.encoder is not None:
+            record = self.encoder.encode(record)
+        line = to_json(record)
+        self.file.write(line + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_trials or time.monotonic() - self.last_sync >= self.fsync_secs:
+            self.sync()
+        return line
+
+    def sync(self) -> None:
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
 def deserialize_pybpod_user_settings(sph: object) -> object:
     sph.PYBPOD_CREATOR = json.loads(sph.PYBPOD_CREATOR)
     sph.PYBPOD_USER_EXTRA = json.loads(sph.PYBPOD_USER_EXTRA)
@@ -128,7 +325,8 @@ def zipit(dir_list: list, zip_name: str) -> None:
 
 
 def load_data(session_folder: str, i: int = -1) -> dict:
-    trial_data = raw.load_data(session_folder)
+    # negative indices only need the end of the file
+    trial_data = raw.load_data(session_folder, last=-i if i < 0 else None)
     return trial_data[i] if trial_data else None
 
 
@@ -136,6 +334,15 @@ def load_settings(session_folder: str) -> dict:
     return raw.load_settings(session_folder)
 
 
+def load_previous_session(sph: object) -> tuple:
+    """
+    Last trial data and settings of the previous session, as found by the SessionPathCreator.
+    Waits for the lookup if it still runs and sets the PREVIOUS_* attributes of sph.
+    """
+    previous_session = ph.set_previous_session(sph)
+    return previous_session["last_trial_data"], previous_session["settings_data"]
+
+
 def load_session_order_idx(last_settings_data: dict) -> tuple:
     if (
         (not last_settings_data)
@@ -6,8 +6,10 @@ and should, be broken out into their own files and/or classes as the organizatio
 repo change over time.
 """
 import datetime
+import itertools
 import json
 import logging
+import math
 import os
 import shutil
 import subprocess
@@ -17,6 +19,7 @@ from typing import Optional, Union
 
 import numpy as np
 
+import iblrig.transfer as transfer
 from iblrig.raw_data_loaders import load_settings
 
 FLAG_FILE_NAMES = [
@@ -24,6 +27,7 @@ FLAG_FILE_NAMES = [
     "create_me.flag",
     "poop_count.flag",
     "passive_data_for_ephys.flag",
+    "compress_me.flag",
 ]
 
 log = logging.getLogger("iblrig")
@@ -124,7 +128,9 @@ def transfer_folder(src: Path, dst: Path, force: bool = False) -> None:
         print(f"Removing {dst}")
         shutil.rmtree(dst, ignore_errors=True)
     print(f"Copying all files:\n{src}\n--> {dst}")
-    shutil.copytree(src, dst)
+    copied = transfer.transfer_sessions([(src, dst)])[Path(src)]
+    if isinstance(copied, Exception):
+        raise copied
     # If folder was created delete the src_flag_file
     if check_transfer(src, dst) is None:
         print("All files copied")
@@ -211,12 +217,6 @@ def get_port_events(events: dict, name: str = "") -> list:
     return out
 
 
-def update_buffer(buffer: list, val) -> list:
-    buffer = np.roll(buffer, -1, axis=0)
-    buffer[-1] = val
-    return buffer.tolist()
-
-
 def texp(factor: float = 0.35, min_: float = 0.2, max_: float = 0.5) -> float:
     """Truncated exponential
     mean = 0.35
@@ -276,7 +276,52 @@ def draw_contrast(
         return np.random.choice(contrast_set)
 
 
-def check_stop_criterions(init_datetime, rt_buffer, trial_num) -> int:
+# Minimum number of correct trials of the adaptive contrast staircase, see binomial_criterion
+# Keyed by (buffer_size, prob, alpha), so that scipy.stats is not imported to start a session
+BINOMIAL_CRITERIA = {
+    (20, 0.6, 0.05): 16, (20, 0.65, 0.05): 16, (20, 0.7, 0.05): 17, (20, 0.75, 0.05): 18,
+    (20, 0.8, 0.05): 19, (20, 0.85, 0.05): 19, (20, 0.9, 0.05): 20,
+    (30, 0.6, 0.05): 22, (30, 0.65, 0.05): 24, (30, 0.7, 0.05): 25, (30, 0.75, 0.05): 26,
+    (30, 0.8, 0.05): 27, (30, 0.85, 0.05): 28, (30, 0.9, 0.05): 29,
+    (40, 0.6, 0.05): 29, (40, 0.65, 0.05): 31, (40, 0.7, 0.05): 33, (40, 0.75, 0.05): 34,
+    (40, 0.8, 0.05): 36, (40, 0.85, 0.05): 37, (40, 0.9, 0.05): 39,
+    (50, 0.6, 0.05): 36, (50, 0.65, 0.05): 38, (50, 0.7, 0.05): 40, (50, 0.75, 0.05): 42,
+    (50, 0.8, 0.05): 44, (50, 0.85, 0.05): 46, (50, 0.9, 0.05): 48,
+    (60, 0.6, 0.05): 42, (60, 0.65, 0.05): 45, (60, 0.7, 0.05): 48, (60, 0.75, 0.05): 50,
+    (60, 0.8, 0.05): 53, (60, 0.85, 0.05): 55, (60, 0.9, 0.05): 58,
+    (80, 0.6, 0.05): 55, (80, 0.65, 0.05): 59, (80, 0.7, 0.05): 63, (80, 0.75, 0.05): 66,
+    (80, 0.8, 0.05): 70, (80, 0.85, 0.05): 73, (80, 0.9, 0.05): 76,
+    (100, 0.6, 0.05): 68, (100, 0.65, 0.05): 73, (100, 0.7, 0.05): 77, (100, 0.75, 0.05): 82,
+    (100, 0.8, 0.05): 86, (100, 0.85, 0.05): 91, (100, 0.9, 0.05): 95,
+}
+
+
+def binomial_criterion(buffer_size: int, prob: float, alpha: float = 0.05) -> int:
+    """Number of k in range(buffer_size) for which P(X > k) >= alpha, X ~ B(buffer_size, prob).
+    Over this number of correct trials out of buffer_size, the performance is significantly above
+    prob. Same as sum(1 - scipy.stats.binom.cdf(range(buffer_size), buffer_size, prob) >= alpha)
+
+    :param buffer_size: number of trials
+    :param prob: probability of a correct trial
+    :param alpha: significance level
+    :return: number of correct trials to exceed
+    """
+    key = (buffer_size, prob, alpha)
+    if key not in BINOMIAL_CRITERIA:
+        cdf = itertools.accumulate(
+            math.comb(buffer_size, k) * prob ** k * (1 - prob) ** (buffer_size - k) for k in range(buffer_size)
+        )
+        BINOMIAL_CRITERIA[key] = sum(1 - c >= alpha for c in cdf)
+    return BINOMIAL_CRITERIA[key]
+
+
+def check_stop_criterions(init_datetime, rt_median, trial_num) -> int:
+    """
+    :param init_datetime: start of the session
+    :param rt_median: buffers.RunningMedian of the response times, with a window of at least 20
+    :param trial_num: number of the current trial
+    :return: 1, 2 or 3 for the criterion met, False if none is
+    """
     # STOPPING CRITERIONS
     # < than 400 trials in 45 minutes
     time_up = init_datetime + datetime.timedelta(minutes=45)
@@ -286,9 +331,9 @@ def check_stop_criterions(init_datetime, rt_buffer, trial_num) -> int:
     # Median response time of latest N = 20 trials > than 5 times
     # the median response time and more than 400 trials performed
     N, T = 20, 400
-    if len(rt_buffer) >= N and trial_num > T:
-        latest_median = np.median(rt_buffer[-N:])
-        all_median = np.median(rt_buffer)
+    if len(rt_median) >= N and trial_num > T:
+        latest_median = rt_median.median(last=N)
+        all_median = rt_median.median()
 
         if latest_median > all_median * 5:
             return 2
@@ -321,6 +366,7 @@ def create_flags(data_file_path: str, poop_count: bool) -> None:
     session_folder_path = Path(data_file_path).parent.parent
     create_flag(session_folder_path, "transfer_me")
     create_flag(session_folder_path, "create_me")
+    create_flag(session_folder_path, "compress_me")
     if poop_count:
         create_flag(session_folder_path, "poop_count")
 
@@ -0,0 +1,136 @@
+"""
+OSC client sending the trial info to the Bonsai workflows in one bundle per trial
+
+The messages of a trial (/t, /p, /h, /c, ...) are packed in a single OSC bundle, one datagram,
+together with a /q message holding a sequence number. Workflows that do not read /q are not
+affected. A workflow can acknowledge each trial info by sending /ack with the sequence number
+back to the ack port: the round-trip latency is then logged for each trial, and an update not
+acknowledged in time is reported as dropped. The statistics of the latencies are kept for the
+whole session, the latencies themselves only for the latest bundles.
+
+Usage:
+    osc_client = BonsaiOscClient("127.0.0.1", 7110, ack_port=7111)
+    seq = osc_client.send_bundle({"/t": 1, "/p": -35, "/c": 1.0})
+    osc_client.wait_ack(seq, timeout=0.1)  # round-trip latency in seconds, None if dropped
+    osc_client.latency_stats()  # count, mean, max and median of the latest latencies
+"""
+import logging
+import math
+import socket
+import threading
+import time
+
+import numpy as np
+from pythonosc import osc_bundle_builder, osc_message, osc_message_builder, udp_client
+
+from iblrig.buffers import RingBuffer
+
+log = logging.getLogger("iblrig")
+
+SEQUENCE_ADDRESS = "/q"
+ACK_ADDRESS = "/ack"
+
+
+class BonsaiOscClient(udp_client.SimpleUDPClient):
+    """
+    SimpleUDPClient sending bundles with a sequence number, with an optional acknowledgement channel
+
+    :param address: IP of the Bonsai workflow
+    :param port: port of the Bonsai workflow
+    :param ack_port: local port where the workflow sends /ack messages, None for no acknowledgement
+    :param latency_window: number of latest round-trip latencies kept for their median
+    """
+
+    def __init__(self, address: str, port: int, ack_port: int = None, latency_window: int = 100):
+        super().__init__(address, port)
+        self.seq = 0
+        self.ack_port = ack_port
+        self.sent = {}  # {sequence number: time sent}, bundles awaiting acknowledgement
+        self.latencies = {}  # {sequence number: round-trip latency in seconds}, acknowledged and not waited for yet
+        self.recent_latencies = RingBuffer(latency_window)
+        self.latency_sum = self.latency_max = 0.0
+        self.acked = threading.Condition()
+        if ack_port is not None:
+            self.ack_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.ack_socket.bind(("127.0.0.1", ack_port))
+            threading.Thread(target=self._receive_acks, name="iblrig_osc_ack", daemon=True).start()
+
+    def send_bundle(self, messages: dict) -> int:
+        """
+        Send messages in one bundle, preceded by a /q message with the sequence number
+
+        :param messages: {address: value}, sent in this order
+        :return: sequence number of the bundle
+        """
+        self.seq += 1
+        bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+        for address, value in [(SEQUENCE_ADDRESS, self.seq), *messages.items()]:
+            msg = osc_message_builder.OscMessageBuilder(address=address)
+            msg.add_arg(value)
+            bundle.add_content(msg.build())
+        if self.ack_port is not None:
+            with self.acked:
+                self.sent[self.seq] = time.perf_counter()
+        self.send(bundle.build())
+        return self.seq
+
+    def _receive_acks(self) -> None:
+        while True:
+            dgram = self.ack_socket.recv(1024)
+            received = time.perf_counter()
+            try:
+                msg = osc_message.OscMessage(dgram)
+            except osc_message.ParseError:
+                continue
+            if msg.address != ACK_ADDRESS or not msg.params:
+                continue
+            with self.acked:
+                sent = self.sent.pop(msg.params[0], None)
+                if sent is not None:
+                    self.latencies[msg.params[0]] = received - sent
+                    self.recent_latencies.append(received - sent)
+                    self.latency_sum += received - sent
+                    self.latency_max = max(self.latency_max, received - sent)
+                    self.acked.notify_all()
+
+    def wait_ack(self, seq: int, timeout: float = 0.1):
+        """
+        Wait for the acknowledgement of a bundle by the workflow and log its round-trip latency
+
+        :param seq: sequence number returned by send_bundle
+        :param timeout: seconds to wait
+        :return: round-trip latency in seconds, None if the bundle was not acknowledged in time
+         or if there is no acknowledgement channel
+        """
+        if self.ack_port is None:
+            return
+        with self.acked:
+            self.acked.wait_for(lambda: seq in self.latencies, timeout=timeout)
+            latency = self.latencies.pop(seq, None)
+            # the latencies of the earlier bundles that were not waited for are in the statistics only
+            for k in [k for k in self.latencies if k < seq]:
+                del self.latencies[k]
+            # bundles not acknowledged in time are dropped, a late acknowledgement is ignored
+            expired = time.perf_counter() - timeout
+            for k in [k for k, sent in self.sent.items() if sent <= expired or k == seq]:
+                del self.sent[k]
+        if latency is None:
+            log.warning(f"Bonsai did not acknowledge trial info {seq} within {timeout * 1000:.0f} ms, update dropped?")
+        else:
+            log.debug(f"Bonsai trial info {seq} round-trip latency: {latency * 1000:.2f} ms")
+        return latency
+
+    def latency_stats(self) -> dict:
+        """
+        :return: dict with count of bundles acknowledged, mean and max round-trip latency in seconds,
+         and median of the latest latency_window latencies, NaN if no bundle was acknowledged
+        """
+        with self.acked:
+            count = self.recent_latencies.count
+            latest = self.recent_latencies.to_numpy()[self.recent_latencies.size - min(count, self.recent_latencies.size):]
+            return {
+                "count": count,
+                "mean": self.latency_sum / count if count else math.nan,
+                "max": self.latency_max if count else math.nan,
+                "median": float(np.median(latest)) if count else math.nan,
+            }
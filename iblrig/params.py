@@ -39,12 +39,16 @@ EMPTY_BOARD_PARAMS = {
     "DATA_FOLDER_LOCAL": None,  # str
     "DATA_FOLDER_REMOTE": None,  # str
     "DISPLAY_IDX": None,  # int
+    "TRANSFER_MAX_MB_PER_SEC": None,  # float, None for no bandwidth limit
+    "TRANSFER_PAUSE_WHILE_ACQUIRING": None,  # bool
+    "TRANSFER_VERIFY_READ_BACK": None,  # bool, read the copies back before removing the rig files
 }
 
 AUTO_UPDATABLE_PARAMS = dict.fromkeys(["NAME", "IBLRIG_VERSION", "COM_BPOD", "DATA_FOLDER_LOCAL", "DATA_FOLDER_REMOTE"])
 DEFAULT_PARAMS = {
     "SCREEN_FREQ_TARGET": 60,
     "DISPLAY_IDX": 1,
+    "TRANSFER_PAUSE_WHILE_ACQUIRING": True,
 }
 
 
@@ -1,11 +1,16 @@
 """
 Various get functions to return paths of folders and network drives
 """
+import copy
 import datetime
 import logging
 import os
 import re
+import sqlite3
 import subprocess
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
 from pathlib import Path
 
 import yaml
@@ -94,6 +99,12 @@ def get_iblrig_remote_server_data_path(subjects: bool = True) -> Path or None:
     return data_path / "Subjects" if subjects else data_path
 
 
+def get_remote_timeout() -> float:
+    """ Get the iblrig_remote_timeout_secs configured in the iblrig_params.yml file: how long the session startup waits
+    for lookups on the lab server before going on with the rig computer data only, defaults to 10 seconds """
+    return float(IBLRIG_PARAMS.get("iblrig_remote_timeout_secs", 10))
+
+
 def get_iblrig_path() -> Path or None:
     """ Get the iblrig_path configured in the iblrig_params.yml file, expecting something like "C:\\iblrig" """
     try:
@@ -219,7 +230,8 @@ def make_folder(str1: str or Path) -> None:
     log.debug(f"Created folder {path}")
 
 
-def get_previous_session_folders(subject_name: str, session_folder: str, remote_subject_folder: str = None) -> list:
+def get_previous_session_folders(subject_name: str, session_folder: str, remote_subject_folder: str = None,
+                                 local_only: bool = False) -> list:
     """Function to find the all previous session folders, evaluates the local and remote storage.
     Returned list will be sorted by date/number, this list will include duplicates if the same
     date is found on both remote and local. Returned list will be empty if no previous sessions
@@ -232,6 +244,8 @@ def get_previous_session_folders(subject_name: str, session_folder: str, remote_
     :type session_folder: str
     :param remote_subject_folder: override target folder for testing
     :type remote_subject_folder: str
+    :param local_only: do not look on the lab server, when it is slow or unreachable
+    :type local_only: bool
     :return: list of strings or an empty list
     :rtype: list
     """
@@ -244,7 +258,7 @@ def get_previous_session_folders(subject_name: str, session_folder: str, remote_
     # Set remote folder Path and verify it exists
     # Ensure returned value is not None for remote drive, important before using Path()
     remote_subject_folder = remote_subject_folder or str(get_iblrig_remote_server_data_path(subjects=True))
-    if remote_subject_folder is not None:
+    if remote_subject_folder is not None and not local_only:
         remote_subject_folder = Path(remote_subject_folder) / subject_name
         remote_subject_folder_exists = remote_subject_folder.exists()
     else:
@@ -355,47 +369,191 @@ def get_previous_data_files(protocol: str, subject_name: str, session_folder: st
     return data_out if typ == "data" else settings_out
 
 
-def get_previous_data_file(protocol: str, subject_name: str, session_folder: str):
-    log.debug("Getting previous data file")
-    out = sorted(get_previous_data_files(protocol, subject_name, session_folder))
-    if out:
-        log.debug(f"Previous data file: {out[-1]}")
-        return out[-1]
+# previous sessions found in this process, and lookups running on the lab server, by lookup arguments
+_previous_sessions = {}
+_prefetches = {}
+
+
+def _catalog_previous_session(protocol: str, subject_name: str, session_folder: str, local_only: bool = False):
+    """Latest session of the session catalog whose files are still there, None if there is none"""
+    from iblrig import session_catalog  # session_catalog uses this module
+
+    if not session_catalog.get_catalog_file().exists():
+        return
+    try:
+        records = session_catalog.get_previous_sessions(
+            subject_name, protocol=protocol, exclude=session_folder, location="local" if local_only else None)
+    except sqlite3.Error as e:
+        log.warning(f"Session catalog unavailable, looking for the previous session in the folders: {e}")
+        return
+    for record in records:
+        settings = raw_data_loaders.load_settings(record["session_path"])
+        data_file = Path(record["session_path"]) / "raw_behavior_data" / "_iblrig_taskData.raw.jsonable"
+        if not settings or not data_file.exists():
+            log.debug(f"Catalogued session {record['session_path']} is gone, skipping it")
+            continue
+        log.debug(f"Previous session found in the session catalog: {record['session_path']}")
+        return {
+            "data_file": str(data_file),
+            "settings_file": str(data_file.parent / "_iblrig_taskSettings.raw.json"),
+            "session_path": record["session_path"],
+            "last_trial_data": record["last_trial"],
+            "settings_data": settings,
+        }
+
+
+def _session_key(session_path) -> tuple:
+    # (date, number) of a <subject>/<date>/<number> session folder, to compare sessions across rigs
+    return Path(session_path).parts[-2:]
+
+
+def _find_previous_session(protocol: str, subject_name: str, session_folder: str, remote_subject_folder: str = None,
+                           local_only: bool = False):
+    data_fname = "_iblrig_taskData.raw.jsonable"
+    settings_fname = "_iblrig_taskSettings.raw.json"
+    previous_session = dict.fromkeys(["data_file", "settings_file", "session_path", "last_trial_data", "settings_data"])
+    # the subject folders are authoritative, sessions may have run on other rigs since the last one of the catalog
+    session_folders = get_previous_session_folders(subject_name, session_folder, remote_subject_folder, local_only)
+    # the catalog saves reading the settings and data of the sessions up to the catalogued one
+    catalogued = _catalog_previous_session(protocol, subject_name, session_folder, local_only)
+    if catalogued is not None:
+        session_folders = [x for x in session_folders if _session_key(x) > _session_key(catalogued["session_path"])]
+        log.debug(f"{len(session_folders)} sessions more recent than the catalogued one")
+    # non empty file pairs, latest first, the settings are only read until the protocol matches
+    candidates = []
+    for prev_sess_path in session_folders:
+        data_file = Path(prev_sess_path) / "raw_behavior_data" / data_fname
+        settings_file = Path(prev_sess_path) / "raw_behavior_data" / settings_fname
+        try:
+            if data_file.stat().st_size != 0 and settings_file.stat().st_size != 0:
+                candidates.append((str(data_file), str(settings_file)))
+        except FileNotFoundError:
+            continue
+    for data_file, settings_file in sorted(candidates, reverse=True):
+        settings = raw_data_loaders.load_settings(str(Path(data_file).parent.parent))
+        if not settings or protocol not in settings["PYBPOD_PROTOCOL"]:
+            continue
+        last_trial_data = raw_data_loaders.load_data(str(Path(data_file).parent.parent), last=1)
+        previous_session.update({
+            "data_file": data_file,
+            "settings_file": settings_file,
+            "session_path": str(Path(data_file).parent.parent),
+            "last_trial_data": last_trial_data[-1] if last_trial_data else None,
+            "settings_data": settings,
+        })
+        return previous_session
+    return previous_session if catalogued is None else catalogued
+
+
+def prefetch_previous_session(protocol: str, subject_name: str, session_folder: str,
+                              remote_subject_folder: str = None) -> Future:
+    """
+    Start looking for the previous session in a background thread, see get_previous_session.
+    The thread is a daemon so that an unreachable lab server does not prevent the task from exiting.
+
+    :return: future of the previous session dict
+    """
+    key = (protocol, subject_name, str(session_folder), remote_subject_folder)
+    if key not in _prefetches:
+        future = Future()
+
+        def lookup():
+            try:
+                future.set_result(_find_previous_session(*key))
+            except Exception as e:
+                future.set_exception(e)
+
+        log.debug("Looking for the previous session in the background")
+        threading.Thread(target=lookup, name="iblrig_previous_session", daemon=True).start()
+        _prefetches[key] = (future, time.time())
+    return _prefetches[key][0]
+
+
+def get_previous_session(protocol: str, subject_name: str, session_folder: str, remote_subject_folder: str = None,
+                         timeout: float = None) -> dict:
+    """
+    Find the latest previous session of a subject for a protocol, on the rig computer or the lab server.
+    The subject folders are listed, and only the settings of the sessions more recent than the
+    latest one of the session catalog are read: these were run on other rigs. The last trial data
+    of a session found in the catalog has no behavior_data key, the catalog does not keep it.
+    The result is kept for the life of the process, it is the same session as get_previous_data_file,
+    get_previous_settings_file and get_previous_session_path.
+    The lookup runs in the background (see prefetch_previous_session), if it does not complete
+    before the deadline only the rig computer data is used.
+
+    :param protocol: protocol name or part of it, ex: 'trainingChoiceWorld'
+    :param subject_name: name of the subject, ex: 'ZM_1098' or '_iblrig_test_mouse'
+    :param session_folder: session folder to be created, excluded from the search
+    :param remote_subject_folder: override remote Subjects folder for testing
+    :param timeout: seconds since the start of the lookup after which the lab server is given
+        up, defaults to get_remote_timeout()
+    :return: dict with keys data_file, settings_file, session_path, last_trial_data and
+        settings_data, all None if no previous session is found, and remote_consulted, False
+        if the lab server was given up
+    """
+    key = (protocol, subject_name, str(session_folder), remote_subject_folder)
+    if key not in _previous_sessions:
+        log.debug("Getting previous session")
+        future = prefetch_previous_session(*key)
+        timeout = get_remote_timeout() if timeout is None else timeout
+        try:
+            previous_session = future.result(timeout=max(_prefetches[key][1] + timeout - time.time(), 0))
+            previous_session["remote_consulted"] = True
+        except (TimeoutError, OSError) as e:
+            reason = f"{timeout} s timeout" if isinstance(e, TimeoutError) else e
+            log.warning(f"Lab server lookup of the previous session failed ({reason}), using rig computer data only")
+            previous_session = _find_previous_session(*key, local_only=True)
+            previous_session["remote_consulted"] = False
+        _previous_sessions[key] = previous_session
+    previous_session = copy.deepcopy(_previous_sessions[key])
+    if previous_session["session_path"] is None:
+        log.debug(f"NOT FOUND: Previous session for task {protocol}")
     else:
-        log.debug("NOT FOUND: Previous data file")
-        return None
+        log.debug(f"Previous session path: {previous_session['session_path']}")
+    return previous_session
+
+
+def set_previous_session(sph: object) -> dict:
+    """
+    Wait for the previous session lookup started by the SessionPathCreator and set the
+    PREVIOUS_DATA_FILE, PREVIOUS_SETTINGS_FILE, PREVIOUS_SESSION_PATH and
+    PREVIOUS_SESSION_REMOTE_CONSULTED attributes of sph
+
+    :param sph: SessionPathCreator or session parameter handler
+    :return: previous session, see get_previous_session
+    """
+    previous_session = get_previous_session(sph._PROTOCOL, sph.SUBJECT_NAME, sph.SESSION_FOLDER)
+    sph.PREVIOUS_DATA_FILE = previous_session["data_file"]
+    sph.PREVIOUS_SETTINGS_FILE = previous_session["settings_file"]
+    sph.PREVIOUS_SESSION_PATH = previous_session["session_path"]
+    sph.PREVIOUS_SESSION_REMOTE_CONSULTED = previous_session["remote_consulted"]
+    if not sph.PREVIOUS_DATA_FILE and "training" in sph._PROTOCOL:
+        msg = """
+        ##########################################
+            NOT FOUND: PREVIOUS_DATA_FILE
+        ##########################################
+                    USING INIT VALUES
+        ##########################################"""
+        log.warning(msg)
+    return previous_session
+
+
+def get_previous_data_file(protocol: str, subject_name: str, session_folder: str):
+    return get_previous_session(protocol, subject_name, session_folder)["data_file"]
 
 
 def get_previous_settings_file(protocol: str, subject_name: str, session_folder: str):
-    log.debug("Getting previous settings file")
-    out = sorted(get_previous_data_files(protocol, subject_name, session_folder, typ="settings"))
-    if out:
-        log.debug(f"Previous settings file: {out[-1]}")
-        return out[-1]
-    else:
-        log.debug("NOT FOUND: Previous settings file")
-        return None
+    return get_previous_session(protocol, subject_name, session_folder)["settings_file"]
 
 
 def get_previous_session_path(protocol: str, subject_name: str, session_folder: str):
-    log.debug("Getting previous session path")
-    previous_data_file = get_previous_data_file(protocol, subject_name, session_folder)
-    if previous_data_file is not None:
-        out = str(Path(previous_data_file).parent.parent)
-        log.debug(f"Previous session path: {out}")
-    else:
-        out = None
-        log.debug("NOT FOUND: Previous session path")
-
-    return out
+    return get_previous_session(protocol, subject_name, session_folder)["session_path"]
 
 
 def get_subfolder_paths(folder: str) -> str:
-    out = [
-        os.path.join(folder, x)
-        for x in os.listdir(folder)
-        if os.path.isdir(os.path.join(folder, x))
-    ]
+    # scandir gets the file type with the listing, no extra stat per entry on network drives
+    with os.scandir(folder) as it:
+        out = [os.path.join(folder, x.name) for x in it if x.is_dir()]
     log.debug(f"Found {len(out)} subfolders for folder {folder}")
 
     return out
@@ -476,23 +634,41 @@ def get_camera_setup_wrkfl() -> str:
 
 class SessionPathCreator(object):
     # add subject name and protocol (maybe have a metadata struct)
-    def __init__(self, subject_name, protocol=False, make=False):
-
+    def __init__(self, subject_name, protocol=False, make=False, previous_session=True):
+        """
+        :param previous_session: wait for the previous session and set the PREVIOUS_* attributes,
+            if False the lookup runs in the background until set_previous_session is called
+        """
         self.IBLRIG_FOLDER = str(get_iblrig_path())
         self.IBLRIG_EPHYS_SESSION_FOLDER = get_pregen_session_folder()
         self._BOARD = pybpod_params.get_board_name()
 
         self._PROTOCOL = protocol
 
+        self.IBLRIG_DATA_FOLDER = str(get_iblrig_local_data_path(subjects=False))
+        self.IBLRIG_DATA_SUBJECTS_FOLDER = str(get_iblrig_local_data_path(subjects=True))
+        self.SUBJECT_NAME = subject_name
+        self.SUBJECT_FOLDER = os.path.join(self.IBLRIG_DATA_SUBJECTS_FOLDER, self.SUBJECT_NAME)
+
+        self.SESSION_DATETIME = datetime.datetime.now().isoformat()
+        self.SESSION_DATE = datetime.datetime.now().date().isoformat()
+
+        self.SESSION_DATE_FOLDER = os.path.join(self.SUBJECT_FOLDER, self.SESSION_DATE)
+
+        # TODO: check server to see if a session has already run today, intention is to decide
+        #  what the next session number will be; this will occur in the get_session_number
+        #  function (will likely be a separate issue/branch)
+        self.SESSION_NUMBER = get_session_number(self.SESSION_DATE_FOLDER)
+
+        self.SESSION_FOLDER = str(Path(self.SESSION_DATE_FOLDER) / self.SESSION_NUMBER)
+        # the lab server may be slow, look for the previous session while the rest is set up
+        prefetch_previous_session(self._PROTOCOL, self.SUBJECT_NAME, self.SESSION_FOLDER)
+
         self.IBLRIG_COMMIT_HASH = get_commit_hash(self.IBLRIG_FOLDER)
         self.IBLRIG_VERSION_TAG = get_version_tag(self.IBLRIG_FOLDER)
         self.IBLRIG_PARAMS_FOLDER = str(get_iblrig_params_path())
-        self.IBLRIG_DATA_FOLDER = str(get_iblrig_local_data_path(subjects=False))
-        self.IBLRIG_DATA_SUBJECTS_FOLDER = str(get_iblrig_local_data_path(subjects=True))
 
         self.PARAMS = pybpod_params.load_params_file()
-        self.SUBJECT_NAME = subject_name
-        self.SUBJECT_FOLDER = os.path.join(self.IBLRIG_DATA_SUBJECTS_FOLDER, self.SUBJECT_NAME)
 
         self.BONSAI = get_bonsai_path(use_iblrig_bonsai=True)
         self.VISUAL_STIM_FOLDER = str(Path(self.IBLRIG_FOLDER) / "visual_stim")
@@ -514,17 +690,6 @@ class SessionPathCreator(object):
         self.MIC_RECORDING_FOLDER = os.path.join(self.IBLRIG_FOLDER, "devices", "microphone")
         self.MIC_RECORDING_FILE = os.path.join(self.MIC_RECORDING_FOLDER, "record_mic.bonsai")
 
-        self.SESSION_DATETIME = datetime.datetime.now().isoformat()
-        self.SESSION_DATE = datetime.datetime.now().date().isoformat()
-
-        self.SESSION_DATE_FOLDER = os.path.join(self.SUBJECT_FOLDER, self.SESSION_DATE)
-
-        # TODO: check server to see if a session has already run today, intention is to decide
-        #  what the next session number will be; this will occur in the get_session_number
-        #  function (will likely be a separate issue/branch)
-        self.SESSION_NUMBER = get_session_number(self.SESSION_DATE_FOLDER)
-
-        self.SESSION_FOLDER = str(Path(self.SESSION_DATE_FOLDER) / self.SESSION_NUMBER)
         self.SESSION_RAW_DATA_FOLDER = os.path.join(self.SESSION_FOLDER, "raw_behavior_data")
         self.SESSION_RAW_VIDEO_DATA_FOLDER = os.path.join(self.SESSION_FOLDER, "raw_video_data")
         self.SESSION_RAW_EPHYS_DATA_FOLDER = os.path.join(self.SESSION_FOLDER, "raw_ephys_data")
@@ -559,16 +724,8 @@ class SessionPathCreator(object):
             self.LATEST_WATER_CALIBRATION_FILE = None
             self.LATEST_WATER_CALIB_RANGE_FILE = None
         # Previous session files
-        # TODO: next 3 functions accept
-        self.PREVIOUS_DATA_FILE = get_previous_data_file(
-            self._PROTOCOL, self.SUBJECT_NAME, self.SESSION_FOLDER
-        )
-        self.PREVIOUS_SETTINGS_FILE = get_previous_settings_file(
-            self._PROTOCOL, self.SUBJECT_NAME, self.SESSION_FOLDER
-        )
-        self.PREVIOUS_SESSION_PATH = get_previous_session_path(
-            self._PROTOCOL, self.SUBJECT_NAME, self.SESSION_FOLDER
-        )
+        if previous_session:
+            set_previous_session(self)
 
         if make:
             self.make_missing_folders(make)
@@ -620,15 +777,6 @@ class SessionPathCreator(object):
         ##########################################"""
                     log.warning(msg)
 
-                if k == "PREVIOUS_DATA_FILE" and "training" in self._PROTOCOL:
-                    msg = """
-        ##########################################
-            NOT FOUND: PREVIOUS_DATA_FILE
-        ##########################################
-                    USING INIT VALUES
-        ##########################################"""
-                    log.warning(msg)
-
 
 if __name__ == "__main__":
     # spc = SessionPathCreator('C:\\iblrig', None, '_iblrig_test_mouse',
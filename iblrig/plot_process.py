@@ -0,0 +1,131 @@
+"""
+Online plots of the tasks drawn by a separate process, so that plotting never delays a trial
+
+The task sends a summary of the session after each trial, a JSON serializable dict made by
+the get_summary function of the online_plots module of the task. Summaries are queued and
+written to the stdin of the plotting process by a thread, so that the task never waits on
+the plots. The plotting process draws only the latest summary it received, updating the
+artists of the figure, and saves a PNG snapshot of the figure at most every snapshot_secs
+and when the session ends.
+
+The online_plots module of the task implements:
+    make_fig(title) -> (figure, artists)
+    get_summary(tph) -> dict
+    update_fig(figure, artists, summary)
+
+Usage:
+    plots = PlotProcess(op.__file__, op.fig_title(sph), png_file)
+    plots.update(op.get_summary(tph))
+    plots.set_facecolor("xkcd:red")
+    plots.close()
+"""
+import importlib.util
+import json
+import logging
+import queue
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+
+log = logging.getLogger("iblrig")
+
+
+def _to_json(obj):
+    # numpy arrays and scalars to lists and numbers, anything else (ex: timedelta) to str
+    return obj.tolist() if hasattr(obj, "tolist") else str(obj)
+
+
+class PlotProcess(object):
+    """
+    Process drawing the online plots of a task
+
+    :param plotter_file: path of the online_plots module of the task
+    :param title: title of the figure
+    :param png_file: path of the snapshot of the figure
+    :param snapshot_secs: minimum time between two snapshots
+    """
+
+    def __init__(self, plotter_file, title: str, png_file, snapshot_secs: float = 30):
+        cmd = [sys.executable, "-m", "iblrig.plot_process", str(plotter_file), title, str(png_file), str(snapshot_secs)]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        self.queue = queue.Queue()
+        self.feeder = threading.Thread(target=self._feed, name="iblrig_online_plots", daemon=True)
+        self.feeder.start()
+
+    def _feed(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.process.stdin.write(json.dumps(item, default=_to_json).encode() + b"\n")
+                self.process.stdin.flush()
+            except OSError:
+                log.warning("Online plots closed, they are not updated anymore")
+                return
+        self.process.stdin.close()
+
+    def update(self, summary: dict) -> None:
+        """Queue the summary of the session after a trial, returns immediately"""
+        if self.feeder.is_alive():
+            self.queue.put({"summary": summary})
+
+    def set_facecolor(self, color: str) -> None:
+        if self.feeder.is_alive():
+            self.queue.put({"facecolor": color})
+
+    def close(self, timeout: float = 10) -> None:
+        """Close the plots once the queued summaries are drawn and the last snapshot is saved"""
+        self.queue.put(None)
+        self.feeder.join(timeout)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            log.warning("Online plots still drawing, closing them")
+            self.process.kill()
+
+
+def _read_stdin(items: queue.Queue) -> None:
+    for line in sys.stdin.buffer:
+        items.put(json.loads(line))
+    items.put(None)
+
+
+def main(plotter_file, title: str, png_file, snapshot_secs: float = 30) -> None:
+    # the online_plots module of the task is imported from its file, task folders are not packages
+    spec = importlib.util.spec_from_file_location("online_plots", plotter_file)
+    op = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(op)
+    f, artists = op.make_fig(title)
+    items = queue.Queue()
+    threading.Thread(target=_read_stdin, args=(items,), daemon=True).start()
+    last_snapshot, unsaved, done = -float("inf"), False, False
+    while not done:
+        summary = None
+        while not items.empty():
+            item = items.get()
+            if item is None:
+                done = True
+            elif "facecolor" in item:
+                f.patch.set_facecolor(item["facecolor"])
+                unsaved = True
+            else:
+                # summaries are cumulative, only the latest one is drawn
+                summary = item["summary"]
+        if summary is not None:
+            op.update_fig(f, artists, summary)
+            unsaved = True
+        if unsaved and (done or time.monotonic() - last_snapshot > snapshot_secs):
+            f.savefig(png_file)
+            last_snapshot, unsaved = time.monotonic(), False
+        if not plt.fignum_exists(f.number):
+            return
+        plt.pause(0.1)
+
+
+if __name__ == "__main__":
+    main(Path(sys.argv[1]), sys.argv[2], Path(sys.argv[3]), float(sys.argv[4]))
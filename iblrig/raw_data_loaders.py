@@ -10,8 +10,14 @@ Module contains one loader function per raw datafile
 """
 import json
 import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
 import wave
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Union
@@ -28,11 +34,69 @@ log = logging.getLogger("iblrig")
 # class definition with no init is used as a namespace
 class jsonable(object):
     def read(file):
-        data = []
-        with open(file, "r") as f:
+        return list(jsonable.iter(file))
+
+    def iter(file, offset=0, return_offset=False):
+        """
+        Lazily yield one object per line of a jsonable file.
+
+        A last line without a newline is considered as being written and is only yielded if it
+        can be decoded, so a file that is still being appended to can be followed safely.
+
+        :param file: path of the jsonable file
+        :param offset: byte offset to start reading from, as returned by a previous iteration
+        :param return_offset: if True yields (obj, offset) tuples, where offset is the byte
+         position right after the line of obj; it can be used to resume reading later on
+        :return: generator of objects, or of (object, offset) tuples
+        """
+        with open(file, "rb") as f:
+            f.seek(offset)
             for line in f:
-                data.append(json.loads(line))
-        return data
+                if not line.endswith(b"\n"):
+                    try:
+                        obj = json.loads(line)
+                    except json.JSONDecodeError:
+                        log.warning(f"Incomplete last line at byte {offset} in {file}")
+                        return
+                else:
+                    obj = json.loads(line)
+                offset += len(line)
+                yield (obj, offset) if return_offset else obj
+
+    def tail(file, n=1, chunk_size=2 ** 16):
+        """
+        Read the last n objects of a jsonable file by seeking from the end of the file.
+        Only the chunks containing the last n lines are read from disk.
+
+        :param file: path of the jsonable file
+        :param n: number of objects to return
+        :param chunk_size: number of bytes read at each step backwards
+        :return: list of at most n objects, in file order
+        """
+        if n <= 0:
+            return []
+        with open(file, "rb") as f:
+            pos = f.seek(0, 2)
+            if pos == 0:
+                return []
+            f.seek(pos - 1)
+            # a last line being written may be incomplete, in which case we need one more line
+            nlines = n if f.read(1) == b"\n" else n + 1
+            buf = b""
+            # n newlines before the last byte guarantee n complete lines, unless at file start
+            while pos > 0 and buf.count(b"\n", 0, max(len(buf) - 1, 0)) < nlines:
+                step = min(chunk_size, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+        lines = [line for line in buf.splitlines() if line.strip()][-nlines:]
+        if not buf.endswith(b"\n"):
+            try:
+                json.loads(lines[-1])
+            except json.JSONDecodeError:
+                log.warning(f"Incomplete last line in {file}")
+                lines.pop()
+        return [json.loads(line) for line in lines[-n:]]
 
     def _write(file, data, mode):
         with open(file, mode) as f:
@@ -46,6 +110,117 @@ class jsonable(object):
         jsonable._write(file, data, "a")
 
 
+DELTA_KEY = "_delta"
+_MISSING = object()
+
+
+def _to_plain(obj):
+    # copy of obj made of the JSON types it is written as
+    if hasattr(obj, "reprJSON"):
+        obj = obj.reprJSON()
+    if isinstance(obj, dict):
+        return {k: _to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_plain(v) for v in obj]
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    return obj
+
+
+class TrialDeltaEncoder(object):
+    """
+    Delta encoding of the trials of a task data file
+
+    The first trial is written in full, the following ones as {"_delta": changes} with the
+    changes from the previous trial:
+        "set": {key: value} of the keys that are new or whose value changed
+        "extend": {key: items} appended to the lists that grew, ex: position_buffer
+        "remove": [keys] that are gone
+    so that the size of a trial does not grow with the number of trials of the session.
+    A line without the "_delta" key is a full trial, files of full trials are read unchanged.
+    """
+
+    def __init__(self):
+        self.previous = None
+
+    def encode(self, trial: dict) -> dict:
+        """
+        :param trial: trial dict, values may be objects with a reprJSON method
+        :return: JSON serializable record of the trial
+        """
+        if self.previous is None:
+            self.previous = _to_plain(trial)
+            # the lists kept for the next trial are extended in place, the records do not share them
+            return {k: list(v) if isinstance(v, list) else v for k, v in self.previous.items()}
+        changes, current = {}, {}
+        for k, v in trial.items():
+            p = self.previous.get(k, _MISSING)
+            # lists that grew are taken as append only, ex: position_buffer, only their new items
+            # and their last previous item are compared, then the previous list is extended in place
+            if (isinstance(v, list) and isinstance(p, list) and len(v) > len(p)
+                    and (not p or _to_plain(v[len(p) - 1]) == p[-1])):
+                items = _to_plain(v[len(p):])
+                p.extend(items)
+                current[k] = p
+                changes.setdefault("extend", {})[k] = items
+                continue
+            current[k] = _to_plain(v)
+            if p is _MISSING or current[k] != p:
+                changes.setdefault("set", {})[k] = list(current[k]) if isinstance(current[k], list) else current[k]
+        removed = [k for k in self.previous if k not in current]
+        if removed:
+            changes["remove"] = removed
+        self.previous = current
+        return {DELTA_KEY: changes}
+
+
+def decode_trial_deltas(records, previous: dict = None):
+    """
+    Full trials of the records of a task data file, delta encoded or not (see TrialDeltaEncoder).
+    The values that did not change are shared between consecutive trials.
+
+    :param records: iterable of records as read from the task data file
+    :param previous: trial preceding the first record, to decode records read from an offset
+    :return: generator of trial dicts
+    """
+    for record in records:
+        if DELTA_KEY in record:
+            if previous is None:
+                raise ValueError("Delta encoded trial found without the previous trial")
+            changes = record[DELTA_KEY]
+            removed = changes.get("remove", [])
+            trial = {k: v for k, v in previous.items() if k not in removed}
+            trial.update(changes.get("set", {}))
+            for k, items in changes.get("extend", {}).items():
+                trial[k] = previous[k] + items
+            record = trial
+        previous = record
+        yield record
+
+
+def convert_task_data_file(file_path: Union[str, Path], delta: bool = True, out_file=None) -> Path:
+    """
+    Rewrite a task data file with delta encoded trials, or with full trials. Files written with
+    full trials are read by any version of the loaders, ex: before extraction by ibllib.
+
+    :param file_path: _iblrig_taskData.raw.jsonable file
+    :param delta: True to delta encode the trials, False to write full trials
+    :param out_file: output file, by default the file is replaced
+    :return: path of the output file
+    """
+    file_path = Path(file_path)
+    out_file = Path(out_file) if out_file else file_path
+    tmp_file = out_file.with_name(out_file.name + ".tmp")
+    trials = decode_trial_deltas(jsonable.iter(file_path))
+    if delta:
+        trials = map(TrialDeltaEncoder().encode, trials)
+    with open(tmp_file, "w") as f:
+        for record in trials:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+    os.replace(tmp_file, out_file)
+    return out_file
+
+
 def assert_valid_video_label(label):
     """
     Raises a value error is the provided label is not supported.
@@ -104,6 +279,89 @@ def trial_times_to_times(raw_trial):
     return raw_trial
 
 
+def trials_to_columnar(data, time="absolute"):
+    """
+    Convert a list of raw trials into a columnar table of flat numpy arrays.
+
+    Python only walks the dictionary keys of each trial, all timestamps are gathered in a single
+    list per table and converted to "absolute" time in one vectorized operation.
+
+    >>> table.keys()
+    >>> ['event_names',     # Unique event names, the codes index this array      'numpy.str_'
+         'events_name',     # Event name code                                      'numpy.int64'
+         'events_times',    # Event timestamp (s)                                  'numpy.float64'
+         'events_trial',    # Trial index of the event                             'numpy.int64'
+         'state_names',     # Unique state names, the codes index this array      'numpy.str_'
+         'states_name',     # State name code                                      'numpy.int64'
+         'states_start',    # State start timestamp (s)                            'numpy.float64'
+         'states_stop',     # State stop timestamp (s)                             'numpy.float64'
+         'states_trial',    # Trial index of the state                             'numpy.int64'
+         'trials_start',    # Trial start timestamp (s)                            'numpy.float64'
+         'trials_end']      # Trial end timestamp (s)                              'numpy.float64'
+
+    :param data: raw trial data as returned by load_data(..., time="raw")
+    :type data: list of dicts
+    :param time: "absolute" for seconds from session start, otherwise seconds from trial start
+    :return: dictionary of numpy arrays
+    :rtype: dict
+    """
+    ntrials = len(data)
+    bpod_start, trials_start, trials_end = (np.zeros(ntrials) for _ in range(3))
+    ev_names, ev_counts, ev_times = [], [], []
+    st_names, st_counts, st_times = [], [], []
+    ev_ntrial, st_ntrial = np.zeros(ntrials, dtype=np.int64), np.zeros(ntrials, dtype=np.int64)
+    for i, tr in enumerate(data):
+        bd = tr["behavior_data"]
+        bpod_start[i] = bd["Bpod start timestamp"]
+        trials_start[i] = bd["Trial start timestamp"]
+        trials_end[i] = bd["Trial end timestamp"]
+        for k, v in bd["Events timestamps"].items():
+            ev_names.append(k)
+            ev_counts.append(len(v))
+            ev_times.extend(v)
+        ev_ntrial[i] = len(bd["Events timestamps"])
+        for k, v in bd["States timestamps"].items():
+            st_names.append(k)
+            st_counts.append(len(v))
+            st_times.extend(v)
+        st_ntrial[i] = len(bd["States timestamps"])
+
+    def _codes(names, counts, ntrial):
+        unames, inames = np.unique(np.array(names, dtype=str), return_inverse=True)
+        trial = np.repeat(np.repeat(np.arange(ntrials), ntrial), counts)
+        return unames, np.repeat(inames.astype(np.int64), counts), trial
+
+    event_names, events_name, events_trial = _codes(ev_names, ev_counts, ev_ntrial)
+    state_names, states_name, states_trial = _codes(st_names, st_counts, st_ntrial)
+    events_times = np.array(ev_times, dtype=np.float64)
+    states_times = np.array(st_times, dtype=np.float64).reshape(-1, 2)
+    if time == "absolute":
+        # abs_ts = ts + TrialStart - BpodStart, see trial_times_to_times
+        offset = trials_start - bpod_start
+        events_times += offset[events_trial]
+        states_times += offset[states_trial][:, np.newaxis]
+        trials_start = trials_start - bpod_start
+        trials_end = trials_end - bpod_start
+    return {
+        "event_names": event_names,
+        "events_name": events_name,
+        "events_times": events_times,
+        "events_trial": events_trial,
+        "state_names": state_names,
+        "states_name": states_name,
+        "states_start": states_times[:, 0],
+        "states_stop": states_times[:, 1],
+        "states_trial": states_trial,
+        "trials_start": trials_start,
+        "trials_end": trials_end,
+    }
+
+
+def is_columnar(data) -> bool:
+    """Returns True if data is a columnar trial table as returned by trials_to_columnar"""
+    return isinstance(data, dict) and "events_times" in data
+
+
 def load_bpod(session_path):
     """
     Load both settings and data from bpod (.json and .jsonable)
@@ -114,7 +372,120 @@ def load_bpod(session_path):
     return load_settings(session_path), load_data(session_path)
 
 
-def load_data(session_path: Union[str, Path], time="absolute"):
+def _get_task_data_file(session_path: Union[str, Path]):
+    if session_path is None:
+        log.warning("No data loaded: session_path is None")
+        return
+    path = Path(session_path).joinpath("raw_behavior_data")
+    path = next(path.glob("_iblrig_taskData.raw*.jsonable"), None)
+    if not path:
+        log.warning("No data loaded: could not find raw data file")
+    return path
+
+
+CACHE_FOLDER = ".iblrig_cache"
+
+
+def _cache_folder(source: Path, name: str) -> Path:
+    # <session>/<raw_data_folder>/<file> -> <session>/.iblrig_cache/<file>.<name>
+    return source.parents[1].joinpath(CACHE_FOLDER, f"{source.name}.{name}")
+
+
+def _cache_key(source: Path) -> dict:
+    stat = source.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_cache(source: Union[str, Path], name: str):
+    """
+    Read parsed data from the sidecar cache of a raw data file.
+
+    The cached arrays are memory mapped, read only. The cache is only served if the size and
+    modification time of the source file are the ones recorded when the cache was written.
+
+    :param source: raw data file the cached data was parsed from
+    :param name: name of the cached object, e.g. "trials_absolute"
+    :return: dict of numpy arrays, pandas.DataFrame or None if there is no valid cache
+    """
+    source = Path(source)
+    meta_file = _cache_folder(source, name).joinpath("_meta.json")
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta["key"] != _cache_key(source):
+            log.debug(f"Outdated cache for {source.name}: {name}")
+            return None
+        columns = {
+            k: np.load(meta_file.parent.joinpath(f"{k}.npy"), mmap_mode="r") for k in meta["columns"]
+        }
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if meta["kind"] == "dataframe":
+        df = pd.DataFrame(columns, copy=False)
+        for k, dtype in meta["restore"].items():
+            df[k] = df[k].astype(dtype)
+        df.attrs.update(meta.get("attrs", {}))
+        return df
+    return columns
+
+
+def write_cache(source: Union[str, Path], name: str, data) -> None:
+    """
+    Write parsed data to the sidecar cache of a raw data file, as one .npy file per column.
+
+    :param source: raw data file the data was parsed from
+    :param name: name of the cached object, e.g. "trials_absolute"
+    :param data: dict of numpy arrays or pandas.DataFrame, the attrs of a DataFrame are kept in
+     the meta file and must be JSON serializable
+    :return: None
+    """
+    source = Path(source)
+    folder = _cache_folder(source, name)
+    meta = {"key": _cache_key(source), "kind": "dict", "columns": list(data.keys()), "restore": {}}
+    if isinstance(data, pd.DataFrame):
+        # attrs hold the parsing reports, e.g. the timestamp repairs of the wheel data
+        meta["kind"], meta["attrs"] = "dataframe", data.attrs
+    try:
+        folder.mkdir(parents=True, exist_ok=True)
+        # the meta file validates the cache: remove it first and write it last
+        folder.joinpath("_meta.json").unlink(missing_ok=True)
+        for k in meta["columns"]:
+            arr = np.asarray(data[k])
+            if arr.dtype == object:
+                # strings are stored with a fixed width so they can be memory mapped
+                meta["restore"][k] = str(data[k].dtype)
+                arr = arr.astype(str)
+            np.save(folder.joinpath(f"{k}.npy"), arr, allow_pickle=False)
+        with open(folder.joinpath("_meta.json"), "w") as f:
+            json.dump(meta, f)
+    except (OSError, TypeError, ValueError) as e:
+        log.warning(f"Could not write cache for {source.name}: {name}, {e}")
+
+
+def _cached(source: Path, name: str, parse, cache: bool):
+    if not cache:
+        return parse()
+    data = read_cache(source, name)
+    if data is None:
+        data = parse()
+        if data is not None:
+            write_cache(source, name, data)
+    return data
+
+
+def _read_trials(path: Path, last: int = None) -> list:
+    if last is not None:
+        records = jsonable.tail(path, n=last)
+        # a delta encoded trial needs all the trials before it
+        if not records or DELTA_KEY not in records[0]:
+            return list(decode_trial_deltas(records))
+        return list(deque(decode_trial_deltas(jsonable.iter(path)), maxlen=last))
+    return list(decode_trial_deltas(jsonable.iter(path)))
+
+
+def load_data(
+    session_path: Union[str, Path], time="absolute", last: int = None, format="dicts", cache=False
+):
     """
     Load PyBpod data files (.jsonable).
 
@@ -124,30 +495,144 @@ def load_data(session_path: Union[str, Path], time="absolute"):
     :param session_path: Absolute path of session folder
     :type session_path: str, Path
     :param time: used to help define the return format of the data
-    :return: A list of len ntrials each trial being a dictionary
-    :rtype: list of dicts
+    :param last: if set, only the last n trials are loaded by reading the file from the end
+    :type last: int, optional
+    :param format: "dicts" for a list of trial dictionaries, "columnar" for a table of flat
+     numpy arrays of events and states (see trials_to_columnar)
+    :type format: str, optional
+    :param cache: if True the columnar table is served from and saved to the session cache
+    :type cache: bool, optional
+    :return: A list of len ntrials each trial being a dictionary, or a dict of arrays
+    :rtype: list of dicts, dict
     """
-    if session_path is None:
-        log.warning("No data loaded: session_path is None")
-        return
-    path = Path(session_path).joinpath("raw_behavior_data")
-    path = next(path.glob("_iblrig_taskData.raw*.jsonable"), None)
+    path = _get_task_data_file(session_path)
     if not path:
-        log.warning("No data loaded: could not find raw data file")
         return None
-    data = jsonable.read(path)
+    if format == "columnar" and last is None:
+        return _cached(path, f"trials_{time}", lambda: trials_to_columnar(_read_trials(path), time=time), cache)
+    data = _read_trials(path, last=last)
+    if format == "columnar":
+        return trials_to_columnar(data, time=time)
     if time == "absolute":
         data = [trial_times_to_times(t) for t in data]
     return data
 
 
-def load_camera_frame_data(session_path, camera: str = "left", raw: bool = False) -> pd.DataFrame:
+def iter_data(
+    session_path: Union[str, Path], time="absolute", offset: int = 0, return_offset=False, previous: dict = None
+):
+    """
+    Lazily iterate over the trials of PyBpod data files (.jsonable), one trial at a time.
+
+    :param session_path: Absolute path of session folder
+    :type session_path: str, Path
+    :param time: used to help define the return format of the data
+    :param offset: byte offset in the data file to resume reading from
+    :type offset: int, optional
+    :param return_offset: if True yields (trial, offset) tuples, the offset pointing after the trial
+    :param previous: last trial read before offset, needed to resume reading delta encoded trials
+    :type previous: dict, optional
+    :return: generator of trial dictionaries
+    """
+    path = _get_task_data_file(session_path)
+    if not path:
+        return
+    for record, end in jsonable.iter(path, offset=offset, return_offset=True):
+        trial = previous = next(decode_trial_deltas([record], previous=previous))
+        if time == "absolute":
+            trial = trial_times_to_times(trial)
+        yield (trial, end) if return_offset else trial
+
+
+FRAME_DATA_FIELDS = ["Timestamp", "embeddedTimeStamp", "embeddedFrameCounter", "embeddedGPIOPinState"]
+
+
+def _get_camera_frame_data_file(session_path, camera: str):
+    camera = assert_valid_video_label(camera)
+    return next(Path(session_path).joinpath("raw_video_data").glob(f"_iblrig_{camera}Camera.frameData*.bin"), None)
+
+
+def read_camera_frame_data(session_path, camera: str = "left", raw: bool = False) -> np.ndarray:
+    """
+    Read binary frame data from Bonsai camera recording workflow as a numpy structured array.
+
+    The file is memory mapped, so that the raw array is read from disk only when accessed. The
+    parsed array is meant to be read once and shared between the camera loaders, see the
+    frame_data argument of load_camera_frame_count and load_camera_gpio.
+
+    :param session_path: Absolute path of session folder
+    :param camera: Name of the camera to load, e.g. 'left'
+    :param raw: If True returns the memory mapped file, all fields float64
+    :return: structured array with fields {
+                Timestamp,              # float64 (seconds from first frame)
+                embeddedTimeStamp,      # float64 (seconds from first frame)
+                embeddedFrameCounter,   # int64 (Frame number from first frame)
+                embeddedGPIOPinState    # uint8 (State of the 4 GPIO pins packed in the 4 low bits,
+                                        # pin 1 is the 4th bit, see unpack_gpio)
+            }
+    """
+    fpath = _get_camera_frame_data_file(session_path, camera)
+    assert fpath, f"{fpath}\nFile not Found: Could not find bin file for cam <{camera}>"
+    rdata = _memmap_camera_frame_data(fpath)
+    return rdata if raw else _parse_camera_frame_data(rdata)
+
+
+def _memmap_camera_frame_data(fpath):
+    dtype = np.dtype([(name, np.float64) for name in FRAME_DATA_FIELDS])
+    size = Path(fpath).stat().st_size
+    assert size % dtype.itemsize == 0, "Dimension mismatch: bin file length is not mod 4"
+    if size == 0:  # an empty file can't be memory mapped
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(fpath, dtype=dtype, mode="r")
+
+
+def _parse_camera_frame_data(rdata):
+    parsed = np.zeros(
+        rdata.size,
+        dtype=[
+            ("Timestamp", np.float64),
+            ("embeddedTimeStamp", np.float64),
+            ("embeddedFrameCounter", np.int64),
+            ("embeddedGPIOPinState", np.uint8),
+        ],
+    )
+    if rdata.size == 0:
+        return parsed
+    timestamps = rdata["Timestamp"].astype(np.int64)
+    parsed["Timestamp"] = (timestamps - timestamps[0]) / 10_000_000  # in seconds from first frame
+    camerats = uncycle_pgts(convert_pgts(rdata["embeddedTimeStamp"].astype(np.int64)))
+    parsed["embeddedTimeStamp"] = camerats - camerats[0]  # in seconds from first frame
+    counter = rdata["embeddedFrameCounter"].astype(np.int64)
+    parsed["embeddedFrameCounter"] = counter - counter[0]  # from start
+    # the 4 pins are the 4 high bits of a uint32
+    parsed["embeddedGPIOPinState"] = np.right_shift(rdata["embeddedGPIOPinState"].astype(np.uint32), 28)
+    return parsed
+
+
+def unpack_gpio(packed: np.ndarray) -> np.ndarray:
+    """
+    Decode the packed GPIO states of read_camera_frame_data
+
+    :param packed: uint8 array of n frames, the state of pin 1 to 4 in bits 3 to 0
+    :return: An nx4 boolean array where columns represent state of GPIO pins 1-4
+    """
+    return np.unpackbits(np.asarray(packed, dtype=np.uint8)[:, np.newaxis], axis=1)[:, 4:].astype(bool)
+
+
+def load_camera_frame_data(
+    session_path, camera: str = "left", raw: bool = False, cache: bool = False
+) -> pd.DataFrame:
     """Loads binary frame data from Bonsai camera recording workflow.
 
+    Builds a dataframe with a list of GPIO arrays from read_camera_frame_data, which should be
+    preferred to avoid creating one array per frame.
+
     Args:
         session_path (StrPath): Path to session folder
         camera (str, optional): Load FramesData for specific camera. Defaults to 'left'.
         raw (bool, optional): Whether to return raw or parsed data. Defaults to False.
+        cache (bool, optional): Whether to serve the parsed data from the session cache.
+            Defaults to False.
 
     Returns:
         parsed: (raw=False, Default)
@@ -168,28 +653,17 @@ def load_camera_frame_data(session_path, camera: str = "left", raw: bool = False
                 embeddedGPIOPinState    # GPIO pin state integer representation of 4 pins
             }
     """
-    camera = assert_valid_video_label(camera)
-    fpath = Path(session_path).joinpath("raw_video_data")
-    fpath = next(fpath.glob(f"_iblrig_{camera}Camera.frameData*.bin"), None)
-    assert fpath, f"{fpath}\nFile not Found: Could not find bin file for cam <{camera}>"
-    rdata = np.fromfile(fpath, dtype=np.float64)
-    assert rdata.size % 4 == 0, "Dimension mismatch: bin file length is not mod 4"
-    rows = int(rdata.size / 4)
-    data = np.reshape(rdata.astype(np.int64), (rows, 4))
-    df_dict = dict.fromkeys(
-        ["Timestamp", "embeddedTimeStamp", "embeddedFrameCounter", "embeddedGPIOPinState"]
-    )
-    df = pd.DataFrame(data, columns=df_dict.keys())
     if raw:
-        return df
+        rdata = read_camera_frame_data(session_path, camera=camera, raw=True)
+        return pd.DataFrame({k: rdata[k].astype(np.int64) for k in FRAME_DATA_FIELDS})
 
-    df_dict["Timestamp"] = (data[:, 0] - data[0, 0]) / 10_000_000  # in seconds from first frame
-    camerats = uncycle_pgts(convert_pgts(data[:, 1]))
-    df_dict["embeddedTimeStamp"] = camerats - camerats[0]  # in seconds from first frame
-    df_dict["embeddedFrameCounter"] = data[:, 2] - data[0, 2]  # from start
-    gpio = (np.right_shift(np.tile(data[:, 3], (4, 1)).T, np.arange(31, 27, -1)) & 0x1) == 1
-    df_dict["embeddedGPIOPinState"] = [np.array(x) for x in gpio.tolist()]
+    def parse():
+        data = read_camera_frame_data(session_path, camera=camera)
+        return {k: data[k] for k in FRAME_DATA_FIELDS}
 
+    fpath = _get_camera_frame_data_file(session_path, camera)
+    df_dict = dict(_cached(fpath, "parsed", parse, cache and fpath is not None))
+    df_dict["embeddedGPIOPinState"] = list(unpack_gpio(df_dict["embeddedGPIOPinState"]))
     parsed_df = pd.DataFrame.from_dict(df_dict)
     return parsed_df
 
@@ -206,9 +680,9 @@ def load_camera_ssv_times(session_path, camera: str):
     """
     camera = assert_valid_video_label(camera)
     video_path = Path(session_path).joinpath("raw_video_data")
-    if next(video_path.glob(f"_iblrig_{camera}Camera.frameData*.bin"), None):
-        df = load_camera_frame_data(session_path, camera=camera)
-        return df["Timestamp"].values, df["embeddedTimeStamp"].values
+    if _get_camera_frame_data_file(session_path, camera):
+        frame_data = read_camera_frame_data(session_path, camera=camera)
+        return frame_data["Timestamp"], frame_data["embeddedTimeStamp"]
 
     file = next(video_path.glob(f"_iblrig_{camera.lower()}Camera.timestamps*.ssv"), None)
     if not file:
@@ -245,12 +719,15 @@ def load_embedded_frame_data(session_path, label: str, raw=False):
     returned starting from 0 and the GPIO is returned as a dict of indices
     :return: The frame count, GPIO
     """
-    count = load_camera_frame_count(session_path, label, raw=raw)
-    gpio = load_camera_gpio(session_path, label, as_dicts=not raw)
+    frame_data = None
+    if session_path is not None and _get_camera_frame_data_file(session_path, label):
+        frame_data = read_camera_frame_data(session_path, camera=label)
+    count = load_camera_frame_count(session_path, label, raw=raw, frame_data=frame_data)
+    gpio = load_camera_gpio(session_path, label, as_dicts=not raw, frame_data=frame_data)
     return count, gpio
 
 
-def load_camera_frame_count(session_path, label: str, raw=True):
+def load_camera_frame_count(session_path, label: str, raw=True, frame_data=None):
     """
     Load the embedded frame count for a given session.  If the file doesn't exist, or is empty,
     a None value is returned.
@@ -258,6 +735,7 @@ def load_camera_frame_count(session_path, label: str, raw=True):
     :param label: The specific video to load, one of ('left', 'right', 'body')
     :param raw: If True the raw data are returned without preprocessing, otherwise frame count is
     returned starting from 0
+    :param frame_data: frame data already read by read_camera_frame_data
     :return: The frame count
     """
     if session_path is None:
@@ -265,9 +743,10 @@ def load_camera_frame_count(session_path, label: str, raw=True):
 
     label = assert_valid_video_label(label)
     video_path = Path(session_path).joinpath("raw_video_data")
-    if next(video_path.glob(f"_iblrig_{label}Camera.frameData*.bin"), None):
-        df = load_camera_frame_data(session_path, camera=label)
-        return df["embeddedFrameCounter"].values
+    if frame_data is None and _get_camera_frame_data_file(session_path, label):
+        frame_data = read_camera_frame_data(session_path, camera=label)
+    if frame_data is not None:
+        return frame_data["embeddedFrameCounter"]
 
     # Load frame count
     glob = video_path.glob(f"_iblrig_{label}Camera.frame_counter*.bin")
@@ -280,7 +759,7 @@ def load_camera_frame_count(session_path, label: str, raw=True):
     return count
 
 
-def load_camera_gpio(session_path, label: str, as_dicts=False):
+def load_camera_gpio(session_path, label: str, as_dicts=False, frame_data=None):
     """
     Load the GPIO for a given session.  If the file doesn't exist, or is empty, a None value is
     returned.
@@ -296,6 +775,7 @@ def load_camera_gpio(session_path, label: str, as_dicts=False):
     :return: An nx4 boolean array where columns represent state of GPIO pins 1-4.
      If as_dicts is True, a list of dicts is returned with keys ('indices', 'polarities'),
      or None if the dictionary is empty.
+    :param frame_data: frame data already read by read_camera_frame_data
     """
     if session_path is None:
         return
@@ -303,9 +783,10 @@ def load_camera_gpio(session_path, label: str, as_dicts=False):
     label = assert_valid_video_label(label)
 
     # Load pin state
-    if next(raw_path.glob(f"_iblrig_{label}Camera.frameData*.bin"), False):
-        df = load_camera_frame_data(session_path, camera=label, raw=False)
-        gpio = np.array([x for x in df["embeddedGPIOPinState"].values])
+    if frame_data is None and _get_camera_frame_data_file(session_path, label):
+        frame_data = read_camera_frame_data(session_path, camera=label)
+    if frame_data is not None:
+        gpio = unpack_gpio(frame_data["embeddedGPIOPinState"])
         if len(gpio) == 0:
             return [None] * 4 if as_dicts else None
     else:
@@ -339,6 +820,55 @@ def load_camera_gpio(session_path, label: str, as_dicts=False):
     return gpio
 
 
+def load_all_cameras(session_path, labels=("left", "right", "body"), max_workers=None) -> dict:
+    """
+    Load the timestamps, frame counts and GPIO of several cameras at once.
+
+    The video folder is scanned once and the cameras are loaded in parallel threads, reading
+    each frameData file a single time.
+
+    >>> cameras["left"].keys()
+    >>> ['bonsai_times',   # Bonsai timestamps, see load_camera_ssv_times
+         'camera_times',   # Camera timestamps (s), see load_camera_ssv_times
+         'count',          # Frame count from 0, see load_camera_frame_count
+         'gpio']           # GPIO edges, list of dicts, see load_camera_gpio(as_dicts=True)
+
+    :param session_path: Absolute path of session folder
+    :param labels: The videos to load, any of ('left', 'right', 'body')
+    :param max_workers: maximum number of threads, defaults to one per camera
+    :return: dict of bundles per label, None for the cameras without files
+    """
+    labels = assert_valid_video_label(labels)
+    labels = (labels,) if isinstance(labels, str) else labels
+    video_path = Path(session_path).joinpath("raw_video_data")
+    files = {label: {} for label in labels}
+    pattern = re.compile(r"_iblrig_(left|right|body)Camera\.(frameData|timestamps|frame_counter|GPIO)")
+    if video_path.exists():
+        with os.scandir(video_path) as it:
+            for entry in it:
+                match = pattern.match(entry.name)
+                if match and match.group(1) in files:
+                    files[match.group(1)].setdefault(match.group(2), Path(entry.path))
+
+    def load(label):
+        if "frameData" in files[label]:
+            frame_data = _parse_camera_frame_data(_memmap_camera_frame_data(files[label]["frameData"]))
+            return {
+                "bonsai_times": frame_data["Timestamp"],
+                "camera_times": frame_data["embeddedTimeStamp"],
+                "count": frame_data["embeddedFrameCounter"],
+                "gpio": load_camera_gpio(session_path, label, as_dicts=True, frame_data=frame_data),
+            }
+        elif files[label]:
+            # older sessions have one file per dataset
+            bonsai_times, camera_times = load_camera_ssv_times(session_path, label)
+            count, gpio = load_embedded_frame_data(session_path, label)
+            return {"bonsai_times": bonsai_times, "camera_times": camera_times, "count": count, "gpio": gpio}
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(labels), 1)) as executor:
+        return dict(zip(labels, executor.map(load, labels)))
+
+
 def load_settings(session_path: Union[str, Path]):
     """
     Load PyBpod Settings files (.json).
@@ -375,7 +905,7 @@ def load_stim_position_screen(session_path):
     return data
 
 
-def load_encoder_events(session_path, settings=False):
+def load_encoder_events(session_path, settings=False, cache=False):
     """
     Load Rotary Encoder (RE) events raw data file.
 
@@ -395,6 +925,8 @@ def load_encoder_events(session_path, settings=False):
 
     :param session_path: [description]
     :type session_path: [type]
+    :param cache: if True the parsed data is served from and saved to the session cache
+    :type cache: bool, optional
     :return: dataframe w/ 3 cols and (ntrials * 3) lines
     :rtype: Pandas.DataFrame
     """
@@ -414,17 +946,141 @@ def load_encoder_events(session_path, settings=False):
     if not path:
         return None
     if version.parse(settings["IBLRIG_VERSION_TAG"]) >= version.parse("5.0.0"):
-        return _load_encoder_events_file_ge5(path)
+        return _cached(path, "ge5", lambda: _load_encoder_events_file_ge5(path), cache)
     else:
-        return _load_encoder_events_file_lt5(path)
+        return _cached(path, "lt5", lambda: _load_encoder_events_file_lt5(path), cache)
 
 
-def _load_encoder_ssv_file(file_path, **kwargs):
+def _read_encoder_ssv_file(file_path, names, usecols, strings=(), chunk_size=2 ** 24):
+    """
+    Parse a space separated rotary encoder file into typed columns without pandas.read_csv
+
+    The file is scanned in chunks of bytes that are tokenized with numpy. The output is the one
+    of pandas.read_csv with usecols followed by numeric coercion, dropna and drop_duplicates:
+    rows with missing or non integer values in the used columns and duplicated rows are dropped.
+    Malformed lines are logged by row number, which is also the index of the dataframe as it is
+    for read_csv. As for read_csv with usecols, extra fields at the end of a line are ignored.
+
+    :param file_path: path of the .ssv file
+    :param names: names of all the fields of a line
+    :param usecols: names of the fields to return, integer columns unless in strings
+    :param strings: names of the fields to return as strings
+    :param chunk_size: number of bytes read at once
+    :return: pandas.DataFrame of the usecols
+    """
     file_path = Path(file_path)
     if file_path.stat().st_size == 0:
         log.error(f"{file_path.name} is an empty file. ")
         raise ValueError(f"{file_path.name} is an empty file. ABORT EXTRACTION. ")
-    return pd.read_csv(file_path, sep=" ", header=None, error_bad_lines=False, **kwargs)
+    values = {c: [] for c in usecols}
+    valids = {c: [] for c in usecols}
+    nrows, long_rows, tail = 0, [], b""
+    with open(file_path, "rb") as fid:
+        while True:
+            chunk = fid.read(chunk_size)
+            eof = not chunk
+            chunk, tail = tail + chunk, b""
+            if not eof:
+                # process whole lines only, the incomplete last line goes to the next chunk
+                cut = chunk.rfind(b"\n") + 1
+                chunk, tail = chunk[:cut], chunk[cut:]
+            elif chunk and not chunk.endswith(b"\n"):
+                chunk += b"\n"
+            if chunk:
+                buf, lines, ntoks, start, stop = _tokenize_ssv_chunk(chunk)
+                # blank lines are not rows
+                keep = np.flatnonzero(~((ntoks == 1) & (stop[lines] == start[lines])))
+                long_rows.extend((nrows + np.flatnonzero(ntoks[keep] > len(names))).tolist())
+                nrows += keep.size
+                for c in usecols:
+                    field = names.index(c)
+                    has = ntoks[keep] > field
+                    itok = lines[keep[has]] + field
+                    valid = np.zeros(keep.size, dtype=bool)
+                    if c in strings:
+                        val = np.full(keep.size, "", dtype=object)
+                        val[has] = [chunk[i:j].decode() for i, j in zip(start[itok], stop[itok])]
+                        valid[has] = stop[itok] > start[itok]
+                    else:
+                        val = np.zeros(keep.size, dtype=np.int64)
+                        val[has], valid[has] = _parse_int_tokens(buf, start[itok], stop[itok])
+                    values[c].append(val)
+                    valids[c].append(valid)
+            if eof:
+                break
+    if long_rows:
+        log.warning(f"{file_path.name} has records with too many fields at rows {long_rows}\n {file_path}")
+    values = {c: np.concatenate(values[c]) for c in usecols}
+    valids = {c: np.concatenate(valids[c]) for c in usecols}
+    valid = np.logical_and.reduce([valids[c] for c in usecols])
+    if not np.all(valid):
+        log.warning(
+            f"{file_path.name} has missing/incomplete records at rows {np.flatnonzero(~valid).tolist()}"
+            f"\n {file_path}"
+        )
+    index = np.flatnonzero(valid)
+    # drop duplicated rows, keeping the first occurrence. Rows can't be duplicated if a column is
+    # strictly increasing, as timestamps normally are
+    if not any(c not in strings and np.all(np.diff(values[c][index]) > 0) for c in usecols):
+        keys = np.stack(
+            [
+                np.unique(values[c][index].astype(str), return_inverse=True)[1].ravel()
+                if c in strings
+                else values[c][index]
+                for c in usecols
+            ],
+            axis=1,
+        )
+        index = index[np.sort(np.unique(keys, axis=0, return_index=True)[1])]
+    data = {}
+    for c in usecols:
+        # as for read_csv, a numeric column with missing values is a float column
+        dtype = object if c in strings else np.int64 if np.all(valids[c]) else np.float64
+        data[c] = values[c][index].astype(dtype)
+    return pd.DataFrame(data, index=index)
+
+
+def _tokenize_ssv_chunk(chunk: bytes):
+    """
+    Split a chunk of whole lines in space separated tokens
+
+    :param chunk: bytes ending with a new line
+    :return: buffer, index of the first token of each line, number of tokens of each line,
+     start and stop byte of each token
+    """
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    is_nl = buf == 10
+    # \r of \r\n line endings are separators closing the last token of a line
+    stop = np.flatnonzero(is_nl | (buf == 32) | (buf == 13))
+    start = np.r_[0, stop[:-1] + 1]
+    # a \r followed by \n does not start a token
+    cr = buf[stop] == 13
+    if np.any(cr):
+        stop, start = stop[~np.r_[False, cr[:-1]]], start[~np.r_[False, cr[:-1]]]
+    eol = np.flatnonzero(buf[stop] != 32)
+    lines = np.r_[0, eol[:-1] + 1]
+    ntoks = np.diff(np.r_[-1, eol])
+    return buf, lines, ntoks, start, stop
+
+
+def _parse_int_tokens(buf: np.ndarray, start: np.ndarray, stop: np.ndarray):
+    """
+    Parse tokens of a byte buffer as integers, one digit position at a time for all tokens
+
+    :return: int64 values, boolean validity: 1 to 18 digits with an optional leading minus sign
+    """
+    neg = (stop > start) & (buf[np.minimum(start, buf.size - 1)] == 45)
+    length = stop - start - neg
+    value = np.zeros(start.size, dtype=np.int64)
+    valid = (length > 0) & (length < 19)
+    # digits are read right to left, all tokens at once: the units, then the tens etc.
+    for k in range(min(int(np.max(length, initial=0)), 18)):
+        has = length > k
+        digit = buf[np.maximum(stop - 1 - k, 0)] - np.uint8(48)  # non digits wrap above 9
+        valid &= ~has | (digit <= 9)
+        value += np.where(has, digit, 0) * np.int64(10 ** k)
+    value[neg] *= -1
+    return value, valid
 
 
 def _load_encoder_positions_file_lt5(file_path):
@@ -433,12 +1089,15 @@ def _load_encoder_positions_file_lt5(file_path):
     :param file_path:
     :return: dataframe of encoder events
     """
-    data = _load_encoder_ssv_file(
+    data = _read_encoder_ssv_file(
         file_path,
         names=["_", "re_ts", "re_pos", "bns_ts", "__"],
         usecols=["re_ts", "re_pos", "bns_ts"],
+        strings=["bns_ts"],
+    )
+    return _groom_wheel_data_lt5(
+        data, label="_iblrig_encoderPositions.raw.ssv", path=file_path, parsed=True
     )
-    return _groom_wheel_data_lt5(data, label="_iblrig_encoderPositions.raw.ssv", path=file_path)
 
 
 def _load_encoder_positions_file_ge5(file_path):
@@ -447,10 +1106,12 @@ def _load_encoder_positions_file_ge5(file_path):
     :param file_path:
     :return: dataframe of encoder events
     """
-    data = _load_encoder_ssv_file(
+    data = _read_encoder_ssv_file(
         file_path, names=["re_ts", "re_pos", "_"], usecols=["re_ts", "re_pos"]
     )
-    return _groom_wheel_data_ge5(data, label="_iblrig_encoderPositions.raw.ssv", path=file_path)
+    return _groom_wheel_data_ge5(
+        data, label="_iblrig_encoderPositions.raw.ssv", path=file_path, parsed=True
+    )
 
 
 def _load_encoder_events_file_lt5(file_path):
@@ -459,12 +1120,15 @@ def _load_encoder_events_file_lt5(file_path):
     :param file_path:
     :return: dataframe of encoder events
     """
-    data = _load_encoder_ssv_file(
+    data = _read_encoder_ssv_file(
         file_path,
         names=["_", "re_ts", "__", "sm_ev", "bns_ts", "___"],
         usecols=["re_ts", "sm_ev", "bns_ts"],
+        strings=["bns_ts"],
+    )
+    return _groom_wheel_data_lt5(
+        data, label="_iblrig_encoderEvents.raw.ssv", path=file_path, parsed=True
     )
-    return _groom_wheel_data_lt5(data, label="_iblrig_encoderEvents.raw.ssv", path=file_path)
 
 
 def _load_encoder_events_file_ge5(file_path):
@@ -473,13 +1137,15 @@ def _load_encoder_events_file_ge5(file_path):
     :param file_path:
     :return: dataframe of encoder events
     """
-    data = _load_encoder_ssv_file(
+    data = _read_encoder_ssv_file(
         file_path, names=["re_ts", "sm_ev", "_"], usecols=["re_ts", "sm_ev"]
     )
-    return _groom_wheel_data_ge5(data, label="_iblrig_encoderEvents.raw.ssv", path=file_path)
+    return _groom_wheel_data_ge5(
+        data, label="_iblrig_encoderEvents.raw.ssv", path=file_path, parsed=True
+    )
 
 
-def load_encoder_positions(session_path, settings=False):
+def load_encoder_positions(session_path, settings=False, cache=False):
     """
     Load Rotary Encoder (RE) positions from raw data file within a session path.
 
@@ -503,7 +1169,10 @@ def load_encoder_positions(session_path, settings=False):
 
     :param session_path: Absolute path of session folder
     :type session_path: str
-    :return: dataframe w/ 3 cols and N positions
+    :param cache: if True the parsed data is served from and saved to the session cache
+    :type cache: bool, optional
+    :return: dataframe w/ 3 cols and N positions, the counts of timestamp repairs are in
+     data.attrs["repairs"] (see repair_wheel_timestamps)
     :rtype: Pandas.DataFrame
     """
     if session_path is None:
@@ -523,9 +1192,9 @@ def load_encoder_positions(session_path, settings=False):
         log.warning("No data loaded: could not find raw encoderPositions file")
         return None
     if version.parse(settings["IBLRIG_VERSION_TAG"]) > version.parse("5.0.0"):
-        return _load_encoder_positions_file_ge5(path)
+        return _cached(path, "ge5", lambda: _load_encoder_positions_file_ge5(path), cache)
     else:
-        return _load_encoder_positions_file_lt5(path)
+        return _cached(path, "lt5", lambda: _load_encoder_positions_file_lt5(path), cache)
 
 
 def load_encoder_trial_info(session_path):
@@ -609,87 +1278,151 @@ def load_ambient_sensor(session_path):
     return data
 
 
+def _read_wav(path: Path):
+    fp = wave.open(str(path))
+    nchan = fp.getnchannels()
+    N = fp.getnframes()
+    dstr = fp.readframes(N * nchan)
+    fp.close()
+    data = np.frombuffer(dstr, np.int16)
+    data = np.reshape(data, (-1, nchan))
+    return data
+
+
+def _read_flac(path: Path):
+    # the flac file of the compression stage is decoded by ffmpeg to a temporary wav file
+    if shutil.which("ffmpeg") is None:
+        log.error(f"NOT FOUND: ffmpeg, could not decode the compressed microphone data {path}")
+        return None
+    with tempfile.TemporaryDirectory() as tdir:
+        wav_path = Path(tdir).joinpath(path.stem + ".wav")
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", str(path), "-codec:a", "pcm_s16le", str(wav_path)]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if out.returncode:
+            log.error(f"ffmpeg failed to decode {path}: {out.stderr.decode(errors='replace')}")
+            return None
+        return _read_wav(wav_path)
+
+
 def load_mic(session_path):
     """
     Load Microphone wav file to np.array of len nSamples
+    The flac file of a compressed session is decoded with ffmpeg.
 
     :param session_path: Absoulte path of session folder
     :type session_path: str
-    :return: An array of values of the sound waveform
+    :return: An array of values of the sound waveform, None if there is no file or the flac
+     file could not be decoded
     :rtype: numpy.array
     """
     if session_path is None:
         return
     path = Path(session_path).joinpath("raw_behavior_data")
-    path = next(path.glob("_iblrig_micData.raw*.wav"), None)
-    if not path:
-        return None
-    fp = wave.open(path)
-    nchan = fp.getnchannels()
-    N = fp.getnframes()
-    dstr = fp.readframes(N * nchan)
-    data = np.frombuffer(dstr, np.int16)
-    data = np.reshape(data, (-1, nchan))
-    return data
-
-
-def _clean_wheel_dataframe(data, label, path):
-    if np.any(data.isna()):
-        log.warning(label + " has missing/incomplete records \n %s", path)
-    # first step is to re-interpret as numeric objects if not already done
-    for col in data.columns:
-        if data[col].dtype == object and col not in ["bns_ts"]:
-            data[col] = pd.to_numeric(data[col], errors="coerce")
-    # then drop Nans and duplicates
-    data.dropna(inplace=True)
-    data.drop_duplicates(keep="first", inplace=True)
+    wav_path = next(path.glob("_iblrig_micData.raw*.wav"), None)
+    if wav_path:
+        return _read_wav(wav_path)
+    flac_path = next(path.glob("_iblrig_micData.raw*.flac"), None)
+    if flac_path:
+        return _read_flac(flac_path)
+    return None
+
+
+def _clean_wheel_dataframe(data, label, path, parsed=False):
+    # data parsed by _read_encoder_ssv_file is already numeric without Nans and duplicates
+    if not parsed:
+        if np.any(data.isna()):
+            log.warning(label + " has missing/incomplete records \n %s", path)
+        # first step is to re-interpret as numeric objects if not already done
+        for col in data.columns:
+            if data[col].dtype == object and col not in ["bns_ts"]:
+                data[col] = pd.to_numeric(data[col], errors="coerce")
+        # then drop Nans and duplicates
+        data.dropna(inplace=True)
+        data.drop_duplicates(keep="first", inplace=True)
     data.reset_index(inplace=True)
     # handle the clock resets when microseconds exceed uint32 max value
-    drop_first = False
-    data["re_ts"] = data["re_ts"].astype(np.double, copy=False)
-    if any(np.diff(data["re_ts"]) < 0):
-        ind = np.where(np.diff(data["re_ts"]) < 0)[0]
-        for i in ind:
-            # the first sample may be corrupt, in this case throw away
-            if i <= 1:
-                drop_first = i
-                log.warning(
-                    label + " rotary encoder positions timestamps"
-                    " first sample corrupt " + str(path)
-                )
-            # if it's an uint32 wraparound, the diff should be close to 2 ** 32
-            elif 32 - np.log2(data["re_ts"][i] - data["re_ts"][i + 1]) < 0.2:
-                data.loc[i + 1:, "re_ts"] = data.loc[i + 1:, "re_ts"] + 2 ** 32
-            # there is also the case where 2 positions are swapped and need to be swapped back
-
-            elif data["re_ts"][i] > data["re_ts"][i + 1] > data["re_ts"][i - 1]:
-                log.warning(
-                    label
-                    + " rotary encoder timestamps swapped at index: "
-                    + str(i)
-                    + "  "
-                    + str(path)
-                )
-                a, b = data.iloc[i].copy(), data.iloc[i + 1].copy()
-                data.iloc[i], data.iloc[i + 1] = b, a
-            # if none of those 3 cases apply, raise an error
-            else:
-                log.error(label + " Rotary encoder timestamps are not sorted." + str(path))
-                data.sort_values("re_ts", inplace=True)
-                data.reset_index(inplace=True)
+    re_ts, order, drop_first, report = repair_wheel_timestamps(data["re_ts"].values)
+    if order is not None:
+        data = data.iloc[order].reset_index(drop=True)
+    data["re_ts"] = re_ts
+    if report["swaps"]:
+        log.warning(f"{label} rotary encoder timestamps swapped {report['swaps']} times {path}")
+    if report["unsorted"]:
+        log.error(f"{label} Rotary encoder timestamps are not sorted. {path}")
     if drop_first is not False:
+        log.warning(label + " rotary encoder positions timestamps" " first sample corrupt " + str(path))
         data.drop(data.loc[:drop_first].index, inplace=True)
-        data = data.reindex()
+    data.attrs["repairs"] = report
     return data
 
 
-def _groom_wheel_data_lt5(data, label="file ", path=""):
+def repair_wheel_timestamps(re_ts):
+    """
+    Classify and repair the decreasing steps of rotary encoder timestamps, in a single pass
+
+    Each negative difference between consecutive timestamps i, i + 1 is one of:
+     - corrupt_first: i <= 1, the first samples are corrupt and should be dropped
+     - wraps: uint32 clock wraparound, the step is close to -2 ** 32. All following timestamps
+      are offset by 2 ** 32
+     - swaps: ts[i - 1] < ts[i + 1] < ts[i], the 2 samples are swapped back
+     - unsorted: none of the above, the samples are sorted by timestamp
+
+    :param re_ts: rotary encoder timestamps (us)
+    :type re_ts: numpy.array
+    :return: repaired timestamps (float64) in the new order, order of the samples or None if unchanged,
+     last index of the corrupt first samples or False, repair report dict of counts per category
+    :rtype: tuple
+    """
+    re_ts = np.array(re_ts, dtype=np.double)
+    ind = np.flatnonzero(np.diff(re_ts) < 0)
+    first, ind = ind[ind <= 1], ind[ind > 1]
+    drop_first = int(first[-1]) if first.size else False
+    # wraps are detected on the raw timestamps, the offset of each wrap applies to all later samples
+    wrap = 32 - np.log2(re_ts[ind] - re_ts[ind + 1]) < 0.2
+    if np.any(wrap):
+        offsets = np.zeros_like(re_ts)
+        offsets[ind[wrap] + 1] = 2 ** 32
+        re_ts += np.cumsum(offsets)
+    # swaps are detected on the unwrapped timestamps
+    ind = ind[~wrap]
+    swap = (re_ts[ind] > re_ts[ind + 1]) & (re_ts[ind + 1] > re_ts[ind - 1])
+    # a swap changes the neighbours of the steps that follow within 2 samples, those are
+    # few and re-evaluated in order
+    dependent = np.zeros(ind.size, dtype=bool)
+    dependent[1:] = np.diff(ind) <= 2
+    swap[dependent] = False
+    order = np.arange(re_ts.size)
+    order[ind[swap]] += 1
+    order[ind[swap] + 1] -= 1
+    for j in np.flatnonzero(dependent):
+        i = ind[j]
+        prev, cur, nxt = re_ts[order[i - 1:i + 2]]
+        swap[j] = cur > nxt > prev
+        if swap[j]:
+            order[i], order[i + 1] = order[i + 1], order[i]
+    if not np.any(swap):
+        order = None
+    unsorted = np.sum(~swap)
+    if unsorted:
+        order = np.argsort(re_ts, kind="stable") if order is None else order[np.argsort(re_ts[order], kind="stable")]
+    if order is not None:
+        re_ts = re_ts[order]
+    report = {
+        "corrupt_first": int(first.size),
+        "wraps": int(np.sum(wrap)),
+        "swaps": int(np.sum(swap)),
+        "unsorted": int(unsorted),
+    }
+    return re_ts, order, drop_first, report
+
+
+def _groom_wheel_data_lt5(data, label="file ", path="", parsed=False):
     """
     The whole purpose of this function is to account for variability and corruption in
     the wheel position files. There are many possible errors described below, but
     nothing excludes getting new ones.
     """
-    data = _clean_wheel_dataframe(data, label, path)
+    data = _clean_wheel_dataframe(data, label, path, parsed=parsed)
     data.drop(data.loc[data.bns_ts.apply(len) != 33].index, inplace=True)
     # check if the time scale is in ms
     sess_len_sec = (
@@ -705,13 +1438,13 @@ def _groom_wheel_data_lt5(data, label="file ", path=""):
     return data
 
 
-def _groom_wheel_data_ge5(data, label="file ", path=""):
+def _groom_wheel_data_ge5(data, label="file ", path="", parsed=False):
     """
     The whole purpose of this function is to account for variability and corruption in
     the wheel position files. There are many possible errors described below, but
     nothing excludes getting new ones.
     """
-    data = _clean_wheel_dataframe(data, label, path)
+    data = _clean_wheel_dataframe(data, label, path, parsed=parsed)
     # check if the time scale is in ms
     if (data["re_ts"].iloc[-1] - data["re_ts"].iloc[0]) / 1e6 < 20:
         log.warning(
@@ -733,108 +1466,134 @@ def save_bool(save, dataset_type):
 
 
 def sync_trials_robust(
-    t0, t1, diff_threshold=0.001, drift_threshold_ppm=200, max_shift=5, return_index=False,
+    t0,
+    t1,
+    diff_threshold=0.001,
+    drift_threshold_ppm=200,
+    max_shift=5,
+    return_index=False,
+    return_model=False,
 ):
     """
     Attempts to find matching timestamps in 2 time-series that have an offset, are drifting,
     and are most likely incomplete: sizes don't have to match, some pulses may be missing
     in any series.
     Only works with irregular time series as it relies on the derivative to match sync.
+
+    The series are merged in a single pass: for each interval of t0, the first of the next
+    max_shift intervals of t1 whose duration matches within diff_threshold, and whose offset
+    drifted less than drift_threshold_ppm from the previous match, is matched.
     :param t0:
     :param t1:
     :param diff_threshold:
     :param drift_threshold_ppm: (150)
     :param max_shift: (200)
     :param return_index (False)
-    :return:
+    :param return_model (False): also return the clock model fitted to the matches, see fit_clock
+    :return: t0 and t1 matched times, [indices of t0 and t1], [clock model dict]
     """
     nsync = min(t0.size, t1.size)
-    dt0 = np.diff(t0)
-    dt1 = np.diff(t1)
-    ind = np.zeros_like(dt0) * np.nan
-    i0 = 0
+    # python floats: the merge looks at a few values at a time, far too few for numpy calls
+    t0_, t1_ = np.asarray(t0, dtype=np.float64).tolist(), np.asarray(t1, dtype=np.float64).tolist()
+    dt0, dt1 = np.diff(t0).tolist(), np.diff(t1).tolist()
+    it0, it1 = [], []
     i1 = 0
-    cdt = np.nan  # the current time difference between the two series to compute drift
-    while i0 < (nsync - 1):
+    cdt = None  # the current time difference between the two series to compute drift
+    for i0 in range(nsync - 1):
         # look in the next max_shift events the ones whose derivative match
-        isearch = np.arange(i1, min(max_shift + i1, dt1.size))
-        dec = np.abs(dt0[i0] - dt1[isearch]) < diff_threshold
-        # another constraint is to check the dt for the maximum drift
-        if ~np.isnan(cdt):
-            drift_ppm = np.abs((cdt - (t0[i0] - t1[isearch])) / dt1[isearch]) * 1e6
-            dec = np.logical_and(dec, drift_ppm <= drift_threshold_ppm)
-        # if one is found
-        if np.any(dec):
-            ii1 = np.where(dec)[0][0]
-            ind[i0] = i1 + ii1
-            i1 += ii1 + 1
-            cdt = t0[i0 + 1] - t1[i1 + ii1]
-        i0 += 1
-    it0 = np.where(~np.isnan(ind))[0]
-    it1 = ind[it0].astype(int)
+        for i in range(i1, min(max_shift + i1, len(dt1))):
+            if not abs(dt0[i0] - dt1[i]) < diff_threshold:
+                continue
+            # another constraint is to check the dt for the maximum drift
+            if cdt is not None:
+                if dt1[i] == 0 or not abs((cdt - (t0_[i0] - t1_[i])) / dt1[i]) * 1e6 <= drift_threshold_ppm:
+                    continue
+            it0.append(i0)
+            it1.append(i)
+            i1 = i + 1
+            cdt = t0_[i0 + 1] - t1_[i + 1]
+            break
+    it0, it1 = np.array(it0, dtype=int), np.array(it1, dtype=int)
     ind0 = np.unique(np.r_[it0, it0 + 1])
     ind1 = np.unique(np.r_[it1, it1 + 1])
-    if return_index:
-        return t0[ind0], t1[ind1], ind0, ind1
-    else:
-        return t0[ind0], t1[ind1]
+    out = (t0[ind0], t1[ind1]) + ((ind0, ind1) if return_index else ())
+    if return_model:
+        out += (fit_clock(t0[ind0], t1[ind1]),)
+    return out
+
 
+def fit_clock(t0, t1):
+    """
+    Fits a linear clock model between matched timestamps of two clocks:
+        t1 = offset + (1 + drift_ppm * 1e-6) * t0
+
+    :param t0: timestamps in the first clock (s)
+    :param t1: matched timestamps in the second clock (s)
+    :return: dict with keys offset (s), drift_ppm, and residuals (s) of t1 to the model
+    """
+    if t0.size < 2:
+        return {"offset": np.nan, "drift_ppm": np.nan, "residuals": np.full(t0.size, np.nan)}
+    slope, offset = np.polyfit(t0, t1, 1)
+    return {
+        "offset": offset,
+        "drift_ppm": (slope - 1) * 1e6,
+        "residuals": t1 - (offset + slope * t0),
+    }
 
-def load_bpod_fronts(session_path: str, data: list = False) -> list:
+
+def load_bpod_fronts(session_path: str, data: list = False, channels=("BNC1", "BNC2")) -> list:
     """load_bpod_fronts
-    Loads BNC1 and BNC2 bpod channels times and polarities from session_path
+    Loads bpod channels times and polarities from session_path, BNC1 and BNC2 by default
+
+    Input channels Port<n> fronts are <channel>In (1) and <channel>Out (-1) events, all others
+    (BNC<n>, Wire<n>) are <channel>High (1) and <channel>Low (-1) events.
+    Trials without any front of a polarity contribute a NaN time of that polarity.
 
     :param session_path: a valid session_path
     :type session_path: str
-    :param data: pre-loaded raw data dict, defaults to False
-    :type data: list, optional
-    :return: List of dicts BNC1 and BNC2 {"times": np.array, "polarities":np.array}
+    :param data: pre-loaded raw data list of trials or columnar table, defaults to False
+    :type data: list, dict, optional
+    :param channels: channel names, defaults to ("BNC1", "BNC2")
+    :type channels: tuple, optional
+    :return: List of dicts, one per channel {"times": np.array, "polarities":np.array}
     :rtype: list
     """
-    if not data:
+    if data is False or data is None:
         data = load_data(session_path)
+    if not is_columnar(data):
+        # the trial times are already converted, gather them as they are in a single pass
+        data = trials_to_columnar(data, time="raw")
+    return [_columnar_fronts(data, ch) for ch in channels]
 
-    BNC1_fronts = np.array([[np.nan, np.nan]])
-    BNC2_fronts = np.array([[np.nan, np.nan]])
-    for tr in data:
-        BNC1_fronts = np.append(
-            BNC1_fronts,
-            np.array(
-                [[x, 1] for x in tr["behavior_data"]["Events timestamps"].get("BNC1High", [np.nan])]
-            ),
-            axis=0,
-        )
-        BNC1_fronts = np.append(
-            BNC1_fronts,
-            np.array(
-                [[x, -1] for x in tr["behavior_data"]["Events timestamps"].get("BNC1Low", [np.nan])]
-            ),
-            axis=0,
-        )
-        BNC2_fronts = np.append(
-            BNC2_fronts,
-            np.array(
-                [[x, 1] for x in tr["behavior_data"]["Events timestamps"].get("BNC2High", [np.nan])]
-            ),
-            axis=0,
-        )
-        BNC2_fronts = np.append(
-            BNC2_fronts,
-            np.array(
-                [[x, -1] for x in tr["behavior_data"]["Events timestamps"].get("BNC2Low", [np.nan])]
-            ),
-            axis=0,
-        )
 
-    BNC1_fronts = BNC1_fronts[1:, :]
-    BNC1_fronts = BNC1_fronts[BNC1_fronts[:, 0].argsort()]
-    BNC2_fronts = BNC2_fronts[1:, :]
-    BNC2_fronts = BNC2_fronts[BNC2_fronts[:, 0].argsort()]
+def columnar_events_mask(table: dict, name: str = "") -> np.ndarray:
+    """
+    Boolean mask of the events of a columnar table whose name contains 'name'
+
+    :param table: columnar trial table as returned by trials_to_columnar
+    :type table: dict
+    :param name: name of event, defaults to ''
+    :type name: str, optional
+    :return: boolean array of the size of table['events_times']
+    :rtype: numpy.array
+    """
+    codes = np.flatnonzero(np.char.find(table["event_names"], name) >= 0)
+    return np.isin(table["events_name"], codes)
 
-    BNC1 = {"times": BNC1_fronts[:, 0], "polarities": BNC1_fronts[:, 1]}
-    BNC2 = {"times": BNC2_fronts[:, 0], "polarities": BNC2_fronts[:, 1]}
 
-    return [BNC1, BNC2]
+def _columnar_fronts(table: dict, channel: str) -> dict:
+    ntrials = table["trials_end"].size
+    times, polarities = [], []
+    suffixes = ("In", "Out") if channel.startswith("Port") else ("High", "Low")
+    for suffix, polarity in zip(suffixes, (1, -1)):
+        mask = np.isin(table["events_name"], np.flatnonzero(table["event_names"] == channel + suffix))
+        # trials without any front contribute a NaN, as the per trial implementation always did
+        nmissing = np.sum(np.bincount(table["events_trial"][mask], minlength=ntrials) == 0)
+        times.append(np.r_[table["events_times"][mask], np.full(nmissing, np.nan)])
+        polarities.append(np.full(times[-1].size, polarity, dtype=np.float64))
+    times, polarities = np.concatenate(times), np.concatenate(polarities)
+    isort = np.argsort(times, kind="stable")
+    return {"times": times[isort], "polarities": polarities[isort]}
 
 
 def get_port_events(trial: dict, name: str = "") -> list:
@@ -842,7 +1601,7 @@ def get_port_events(trial: dict, name: str = "") -> list:
     Return all event timestamps from bpod raw data trial that match 'name'
     --> looks in trial['behavior_data']['Events timestamps']
 
-    :param trial: raw trial dict
+    :param trial: raw trial dict, or columnar table in which case all trials are considered
     :type trial: dict
     :param name: name of event, defaults to ''
     :type name: str, optional
@@ -850,6 +1609,8 @@ def get_port_events(trial: dict, name: str = "") -> list:
     :rtype: list
     TODO: add polarities?
     """
+    if is_columnar(trial):
+        return np.sort(trial["events_times"][columnar_events_mask(trial, name)]).tolist()
     out: list = []
     events = trial["behavior_data"]["Events timestamps"]
     for k in events:
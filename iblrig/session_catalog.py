@@ -0,0 +1,202 @@
+"""
+Persistent catalog of the sessions of the rig, to find previous sessions without listing folders
+
+The catalog is a SQLite database in the iblrig_params folder. It records for each session the
+subject, date, number, protocol, size of the raw data files and a summary of the last trial.
+It is updated when a session ends and when it is transferred to the lab server, older sessions
+can be added by indexing the local and remote subjects folders.
+
+Usage:
+    update_session("C:\\iblrig_data\\Subjects\\ZM_1098\\2022-02-11\\001")
+    index_subjects_folder(get_iblrig_remote_server_data_path(), location="remote")
+    get_last_session("ZM_1098", protocol="trainingChoiceWorld")
+"""
+import json
+import logging
+import re
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Union
+
+import iblrig.path_helper as ph
+import iblrig.raw_data_loaders as raw
+
+log = logging.getLogger("iblrig")
+
+CATALOG_FILE_NAME = "iblrig_session_catalog.db"
+DATA_FILE_NAME = "_iblrig_taskData.raw.jsonable"
+SETTINGS_FILE_NAME = "_iblrig_taskSettings.raw.json"
+COLUMNS = [
+    "session_path",  # str, absolute path of the session folder
+    "subject",  # str
+    "date",  # str, yyyy-mm-dd
+    "number",  # int
+    "protocol",  # str, PYBPOD_PROTOCOL of the settings
+    "location",  # str, "local" or "remote"
+    "data_file_size",  # int, bytes
+    "data_file_mtime",  # float, modification time of the data file
+    "settings_file_size",  # int, bytes
+    "ntrials",  # int, trial number of the last trial
+    "last_trial",  # str, json of the last trial without its behavior data
+]
+
+
+def get_catalog_file() -> Path:
+    return Path(ph.get_iblrig_params_path()).joinpath(CATALOG_FILE_NAME)
+
+
+def connect(db_file: Union[str, Path] = None) -> sqlite3.Connection:
+    """
+    Open the catalog, creating its table and index if needed
+
+    :param db_file: catalog file, defaults to the one in the iblrig_params folder
+    :return: sqlite3 connection, rows returned as sqlite3.Row
+    """
+    db_file = Path(db_file or get_catalog_file())
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(db_file))
+    con.row_factory = sqlite3.Row
+    with con:
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_path TEXT PRIMARY KEY, subject TEXT, date TEXT, number INTEGER, protocol TEXT, "
+            "location TEXT, data_file_size INTEGER, data_file_mtime REAL, settings_file_size INTEGER, "
+            "ntrials INTEGER, last_trial TEXT)"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS subject_date ON sessions (subject, date, number)")
+    return con
+
+
+def _session_record(session_path: Path, location: str) -> dict:
+    data_file = session_path.joinpath("raw_behavior_data", DATA_FILE_NAME)
+    settings_file = session_path.joinpath("raw_behavior_data", SETTINGS_FILE_NAME)
+    if not (data_file.exists() and settings_file.exists()):
+        return None
+    data_stat, settings_stat = data_file.stat(), settings_file.stat()
+    record = dict.fromkeys(COLUMNS)
+    record.update({
+        "session_path": str(session_path),
+        "subject": session_path.parents[1].name,
+        "date": session_path.parent.name,
+        "number": int(session_path.name),
+        "location": location,
+        "data_file_size": data_stat.st_size,
+        "data_file_mtime": data_stat.st_mtime,
+        "settings_file_size": settings_stat.st_size,
+    })
+    if settings_stat.st_size:
+        record["protocol"] = (raw.load_settings(session_path) or {}).get("PYBPOD_PROTOCOL")
+    if data_stat.st_size:
+        last_trial = raw.load_data(session_path, time="raw", last=1)
+        if last_trial:
+            last_trial = {k: v for k, v in last_trial[-1].items() if k != "behavior_data"}
+            record["ntrials"] = last_trial.get("trial_num")
+            record["last_trial"] = json.dumps(last_trial)
+    return record
+
+
+def update_session(session_path: Union[str, Path], location: str = "local", db_file=None) -> dict:
+    """
+    Add or update a session of the catalog, typically when it ends or once transferred
+
+    :param session_path: session folder: .../subject/yyyy-mm-dd/nnn
+    :param location: "local" for the rig computer, "remote" for the lab server
+    :param db_file: catalog file, defaults to the one in the iblrig_params folder
+    :return: the session record, None if the session has no data and settings files
+    """
+    record = _session_record(Path(session_path), location)
+    if record is None:
+        log.debug(f"NOT FOUND: data and settings files of {session_path}, session not catalogued")
+        return
+    with closing(connect(db_file)) as con, con:
+        con.execute(
+            f"INSERT OR REPLACE INTO sessions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            [record[k] for k in COLUMNS],
+        )
+    log.debug(f"Catalogued session {session_path}")
+    return record
+
+
+def index_subjects_folder(subjects_folder: Union[str, Path], location: str = "local", db_file=None) -> int:
+    """
+    Add the sessions of a Subjects folder missing from the catalog, or whose data file changed
+
+    :param subjects_folder: folder with subject/yyyy-mm-dd/nnn session folders
+    :param location: "local" for the rig computer, "remote" for the lab server
+    :param db_file: catalog file, defaults to the one in the iblrig_params folder
+    :return: number of sessions added or updated
+    """
+    subjects_folder = Path(subjects_folder)
+    if not subjects_folder.exists():
+        log.warning(f"NOT FOUND: {subjects_folder}, no sessions catalogued")
+        return 0
+    with closing(connect(db_file)) as con:
+        known = {
+            row["session_path"]: (row["data_file_size"], row["data_file_mtime"])
+            for row in con.execute("SELECT session_path, data_file_size, data_file_mtime FROM sessions")
+        }
+    records = []
+    for session_path in subjects_folder.glob("*/*/*"):
+        if not (re.match(r"^\d{4}-\d{2}-\d{2}$", session_path.parent.name) and session_path.name.isdigit()):
+            continue
+        data_file = session_path.joinpath("raw_behavior_data", DATA_FILE_NAME)
+        if not data_file.exists():
+            continue
+        stat = data_file.stat()
+        if known.get(str(session_path)) == (stat.st_size, stat.st_mtime):
+            continue
+        record = _session_record(session_path, location)
+        if record is not None:
+            records.append(record)
+    with closing(connect(db_file)) as con, con:
+        con.executemany(
+            f"INSERT OR REPLACE INTO sessions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            [[r[k] for k in COLUMNS] for r in records],
+        )
+    log.info(f"Catalogued {len(records)} new or updated sessions from {subjects_folder}")
+    return len(records)
+
+
+def get_previous_sessions(subject: str, protocol: str = None, exclude: str = None, non_empty=True,
+                          db_file=None, limit: int = None, location: str = None) -> list:
+    """
+    Catalogued sessions of a subject, most recent first, the rig computer copy before the lab server one
+
+    :param subject: subject name
+    :param protocol: only sessions whose protocol contains this string, e.g. 'trainingChoiceWorld'
+    :param exclude: session folder to leave out, typically the current one
+    :param non_empty: only sessions with non empty data and settings files
+    :param db_file: catalog file, defaults to the one in the iblrig_params folder
+    :param limit: maximum number of sessions returned
+    :param location: only sessions stored there, "local" or "remote"
+    :return: list of session records, dicts with the keys of COLUMNS and the last trial decoded
+    """
+    query, args = "SELECT * FROM sessions WHERE subject = ?", [subject]
+    if protocol:
+        query, args = query + " AND instr(protocol, ?) > 0", args + [protocol]
+    if exclude:
+        # the session folder may be given relative to any root, as in get_previous_session_folders
+        query, args = query + " AND instr(session_path, ?) = 0", args + [str(Path(exclude))]
+    if location:
+        query, args = query + " AND location = ?", args + [location]
+    if non_empty:
+        query += " AND data_file_size > 0 AND settings_file_size > 0"
+    query += " ORDER BY date DESC, number DESC, location = 'remote'"
+    if limit:
+        query, args = query + " LIMIT ?", args + [limit]
+    with closing(connect(db_file)) as con:
+        rows = [dict(row) for row in con.execute(query, args)]
+    for row in rows:
+        row["last_trial"] = json.loads(row["last_trial"]) if row["last_trial"] else None
+    return rows
+
+
+def get_last_session(subject: str, protocol: str = None, exclude: str = None, db_file=None) -> dict:
+    """
+    Most recent catalogued session of a subject with non empty data and settings files
+
+    :return: session record, see get_previous_sessions, or None
+    """
+    sessions = get_previous_sessions(subject, protocol=protocol, exclude=exclude, db_file=db_file, limit=1)
+    return sessions[0] if sessions else None
@@ -72,6 +72,7 @@ POSITIONS = None
 PREGENERATED_SESSION_NUM = None
 PREVIOUS_DATA_FILE = None
 PREVIOUS_SESSION_PATH = None
+PREVIOUS_SESSION_REMOTE_CONSULTED = None
 PREVIOUS_SETTINGS_FILE = None
 PROBE_DATA = None
 PYBPOD_API_ACCEPT_STDIN = None
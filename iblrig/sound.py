@@ -4,7 +4,6 @@ import sys
 
 import numpy as np
 from pybpod_soundcard_module.module_api import DataType, SampleRate, SoundCardModule
-from scipy.signal import chirp
 
 log = logging.getLogger("iblrig")
 
@@ -115,6 +114,8 @@ def make_chirp(f0=80, f1=160, length=0.1, amp=0.1, fade=0.01, sf=96000):
     t0 = 0
     t1 = length
     t = np.linspace(t0, t1, sf)
+    # scipy.signal imports scipy.stats, which is slow to import: it is left out of the session start
+    from scipy.signal import chirp
 
     c = amp * chirp(t, f0=f0, f1=f1, t1=t1, method="linear")
 
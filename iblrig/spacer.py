@@ -16,8 +16,10 @@ Usage:
                 output_actions=[("BNC1", 255)],  # To FPGA
             )
 """
+from functools import lru_cache
 
 import numpy as np
+import scipy.signal
 
 
 class Spacer(object):
@@ -60,13 +62,7 @@ class Spacer(object):
         from a DAQ to detect a voltage trace
         :return:
         """
-        t = self.times
-        ns = int((t[-1] + self.tup * 10) * fs)
-        sig = np.zeros(ns, )
-        sig[(t * fs).astype(np.int32)] = 1
-        sig[((t + self.tup) * fs).astype(np.int32)] = -1
-        sig = np.cumsum(sig)
-        return sig
+        return _template(self.dt_start, self.dt_end, self.n_pulses, self.tup, fs).copy()
 
     def add_spacer_states(self, sma=None, next_state="exit"):
         """
@@ -96,22 +92,62 @@ class Spacer(object):
                 output_actions=[],
             )
 
-    def find_spacers(self, signal, threshold=0.9, fs=1000):
+    def find_spacers(self, signal, threshold=0.9, fs=1000, chunk_size=2 ** 20):
         """
         Find spacers in a voltage time serie. Assumes that the signal is a digital signal between 0 and 1
-        :param signal:
+        The signal is cross-correlated with the template by FFT, one chunk at a time so that
+        memory mapped signals are never fully loaded in memory.
+        :param signal: 1D array, possibly memory mapped
         :param threshold:
         :param fs:
-        :return:
+        :param chunk_size: number of samples correlated at once
+        :return: spacer start times (s), interpolated between samples
         """
-        template = self.generate_template(fs=fs)
-        xcor = np.correlate(signal, template, mode="full") / np.sum(template)
-        idetect = np.where(xcor > threshold)[0]
-        iidetect = np.cumsum(np.diff(idetect, prepend=0) > 1)
-        nspacers = iidetect[-1]
+        template = _template(self.dt_start, self.dt_end, self.n_pulses, self.tup, fs)
+        norm = np.sum(template)
+        # xcor[s] is the correlation of the template starting at sample s, s < 0 for a spacer
+        # starting before the signal as for np.correlate(signal, template, mode="full")
+        idetect, xdetect = [], []
+        for first in range(-template.size + 1, signal.size, chunk_size):
+            last = min(first + chunk_size, signal.size)
+            xcor = _correlate(signal, template, first, last) / norm
+            idetect.append(np.flatnonzero(xcor > threshold) + first)
+            xdetect.append(xcor[idetect[-1] - first])
+        idetect, xdetect = np.concatenate(idetect), np.concatenate(xdetect)
+        # consecutive samples above threshold are one spacer
+        iidetect = np.cumsum(np.diff(idetect, prepend=idetect[:1] - 2) > 1)
+        nspacers = iidetect[-1] if iidetect.size else 0
         tspacer = np.zeros(nspacers)
         for i in range(nspacers):
-            ispacer = idetect[iidetect == i + 1]
-            imax = np.argmax(xcor[ispacer])
-            tspacer[i] = (ispacer[imax] - template.size + 1) / fs
+            ispacer = np.flatnonzero(iidetect == i + 1)
+            imax = idetect[ispacer[np.argmax(xdetect[ispacer])]]
+            # parabolic interpolation of the peak
+            y = _correlate(signal, template, imax - 1, imax + 2)
+            denominator = y[0] - 2 * y[1] + y[2]
+            delta = 0.5 * (y[0] - y[2]) / denominator if denominator < 0 else 0
+            tspacer[i] = (imax + delta) / fs
         return tspacer
+
+
+@lru_cache(maxsize=16)
+def _template(dt_start, dt_end, n_pulses, tup, fs):
+    spacer = Spacer(dt_start=dt_start, dt_end=dt_end, n_pulses=n_pulses, tup=tup)
+    t = spacer.times
+    ns = int((t[-1] + spacer.tup * 10) * fs)
+    sig = np.zeros(ns, )
+    sig[(t * fs).astype(np.int32)] = 1
+    sig[((t + spacer.tup) * fs).astype(np.int32)] = -1
+    sig = np.cumsum(sig)
+    sig.flags.writeable = False
+    return sig
+
+
+def _correlate(signal, template, first, last):
+    """
+    Correlation of the template starting at samples first to last - 1 of the signal, the
+    signal being zero outside of its bounds
+    """
+    i0, i1 = max(first, 0), min(last + template.size - 1, signal.size)
+    chunk = np.zeros(last - first + template.size - 1)
+    chunk[i0 - first: i1 - first] = signal[i0:i1]
+    return scipy.signal.fftconvolve(chunk, template[::-1], mode="valid")
@@ -0,0 +1,406 @@
+"""
+Copy of session folders to the lab server, concurrent, resumable and checksummed
+
+Files are copied by chunks. Each chunk is hashed with blake2b as it is read. Every few chunks
+the partial copy is synced to the disk and the chunk digests are written to a manifest next to
+it, so that an interrupted transfer resumes after the last chunks recorded instead of starting
+over. The digest of a file is the blake2b of its chunk digests. Once a session is copied, the
+size, modification time and digest of its source files are written to a checksum file in the
+destination session. A source file can only be removed from the rig once its copy matches them,
+see verify_copy.
+
+The throughput of a transfer is logged as it goes (see TransferMonitor). It can be limited
+by a token bucket and paused while a session is being acquired on the rig.
+
+Usage:
+    results = transfer_sessions([(src_session_path, dst_session_path)], ignore=["transfer_me.flag"])
+    results[src_session_path]  # {relative file path: digest}, or the exception raised
+    verify_copy(src_session_path, dst_session_path, "raw_video_data/_iblrig_leftCamera.raw.mp4")
+"""
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Union
+
+log = logging.getLogger("iblrig")
+
+CHUNK_SIZE = 2 ** 24  # bytes, 16 MB
+MANIFEST_CHUNKS = 16  # chunks copied between two manifest updates, 256 MB
+PART_SUFFIX = ".iblrig_part"
+MANIFEST_SUFFIX = ".iblrig_manifest.json"
+CHECKSUM_FILE_NAME = "_iblrig_transferChecksums.json"
+
+
+class TokenBucket(object):
+    """
+    Bandwidth limiter shared by the copy threads. Each chunk takes its size in tokens and the
+    bucket refills at rate bytes/s, up to one second worth of tokens. A chunk larger than the
+    bucket is let through and the debt is slept off.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes: int) -> float:
+        """Take nbytes tokens, sleeping until the bucket is not in debt anymore. Returns the seconds slept"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate) - nbytes
+            self.last = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class TransferMonitor(object):
+    """
+    Live throughput of a transfer: bytes/s per file being copied, overall bytes/s, number of
+    files waiting and ETA. It also applies the bandwidth limit and the pause condition, its
+    on_chunk method is called by the copy threads after each chunk.
+
+    :param sizes: {source file: size in bytes} of the files to copy
+    :param max_bytes_per_sec: bandwidth limit, None for no limit
+    :param pause_if: callable returning True when the transfer should wait, checked every
+     pause_check_secs at most
+    :param log_interval: seconds between throughput logs
+    """
+
+    def __init__(self, sizes: dict, max_bytes_per_sec: float = None, pause_if: Callable = None,
+                 pause_check_secs: float = 10, log_interval: float = 30):
+        self.sizes = {str(k): v for k, v in sizes.items()}
+        self.bucket = TokenBucket(max_bytes_per_sec) if max_bytes_per_sec else None
+        self.pause_if = pause_if
+        self.pause_check_secs = pause_check_secs
+        self.log_interval = log_interval
+        self.lock = threading.Lock()
+        self.start = self.last_log = time.monotonic()
+        self.last_pause_check = -float("inf")
+        self.paused_secs = 0.0
+        self.checking = False  # a copy thread is polling pause_if
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.copied = 0  # bytes copied by this transfer
+        self.done = 0  # bytes of the files completed
+        self.running = {}  # {source file: [start time, bytes copied]}
+        self.waiting = set(self.sizes)
+
+    def file_started(self, src) -> None:
+        with self.lock:
+            self.waiting.discard(str(src))
+            self.running[str(src)] = [time.monotonic(), 0]
+
+    def file_done(self, src) -> None:
+        with self.lock:
+            self.running.pop(str(src), None)
+            self.done += self.sizes.get(str(src), 0)
+
+    def on_chunk(self, src, nbytes: int) -> None:
+        with self.lock:
+            self.copied += nbytes
+            self.running[str(src)][1] += nbytes
+            log_now = time.monotonic() - self.last_log > self.log_interval
+            if log_now:
+                self.last_log = time.monotonic()
+        if log_now:
+            stats = self.stats()
+            log.info(
+                f"Transfer: {stats['bytes_per_sec'] / 2 ** 20:.1f} MB/s, {stats['bytes_done'] / 2 ** 30:.2f} of "
+                f"{stats['bytes_total'] / 2 ** 30:.2f} GB, {stats['queue_depth']} files waiting, "
+                f"ETA {stats['eta_secs'] / 60:.0f} min"
+            )
+        if self.bucket is not None:
+            self.bucket.consume(nbytes)
+        self._wait_while_paused()
+
+    def _wait_while_paused(self) -> None:
+        if self.pause_if is None:
+            return
+        with self.lock:
+            check = not self.checking and time.monotonic() - self.last_pause_check >= self.pause_check_secs
+            self.checking |= check
+        if not check:
+            # another copy thread may be polling the pause condition, wait for it to resume
+            self.resumed.wait()
+            return
+        paused = False
+        try:
+            while self.pause_if():
+                if not paused:
+                    log.info("Session acquisition in progress, pausing the transfer")
+                    self.resumed.clear()
+                    paused = True
+                time.sleep(self.pause_check_secs)
+                with self.lock:
+                    self.paused_secs += self.pause_check_secs
+        finally:
+            with self.lock:
+                self.checking = False
+                self.last_pause_check = time.monotonic()
+            self.resumed.set()
+        if paused:
+            log.info("Resuming the transfer")
+
+    def stats(self) -> dict:
+        """
+        :return: dict with bytes_per_sec overall since the start, not counting pauses, bytes_done,
+         bytes_total, queue_depth (files not started), eta_secs and files: {source file: bytes_per_sec}
+        """
+        with self.lock:
+            now = time.monotonic()
+            bytes_per_sec = self.copied / max(now - self.start - self.paused_secs, 1e-9)
+            files = {k: v[1] / max(now - v[0], 1e-9) for k, v in self.running.items()}
+            bytes_done = self.done + sum(v[1] for v in self.running.values())
+            bytes_total = sum(self.sizes.values())
+            queue_depth = len(self.waiting)
+        return {
+            "bytes_per_sec": bytes_per_sec,
+            "bytes_done": bytes_done,
+            "bytes_total": bytes_total,
+            "queue_depth": queue_depth,
+            "eta_secs": (bytes_total - bytes_done) / bytes_per_sec if bytes_per_sec else float("inf"),
+            "files": files,
+        }
+
+
+def is_acquiring(subjects_folder: Union[str, Path], idle_secs: float = 120) -> bool:
+    """
+    Whether a session is being acquired on the rig: a session of today or yesterday without a
+    transfer_me.flag file, with a file modified less than idle_secs ago
+
+    :param subjects_folder: local Subjects folder
+    """
+    now = time.time()
+    dates = {time.strftime("%Y-%m-%d", time.localtime(now - d * 86400)) for d in (0, 1)}
+    for date_folder in Path(subjects_folder).glob("*/*"):
+        if date_folder.name not in dates:
+            continue
+        for session_path in date_folder.iterdir():
+            if not session_path.is_dir() or session_path.joinpath("transfer_me.flag").exists():
+                continue
+            if any(now - f.stat().st_mtime < idle_secs for f in session_path.rglob("*") if f.is_file()):
+                return True
+    return False
+
+
+def _manifest_file(dst: Path) -> Path:
+    return dst.with_name(dst.name + MANIFEST_SUFFIX)
+
+
+def _write_json(json_file: Path, data: dict) -> None:
+    # atomic replace, an interruption leaves the previous file
+    tmp_file = json_file.with_name(json_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, json_file)
+
+
+def _file_digest(chunk_digests: list) -> str:
+    return hashlib.blake2b("".join(chunk_digests).encode()).hexdigest()
+
+
+def file_digest(file_path: Union[str, Path], chunk_size: int = CHUNK_SIZE) -> str:
+    """Digest of a file as computed by copy_file, read by chunks"""
+    chunk_digests = []
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            chunk_digests.append(hashlib.blake2b(chunk).hexdigest())
+    return _file_digest(chunk_digests)
+
+
+def _checkpoint(fdst, manifest_file: Path, manifest: dict) -> None:
+    # the chunks are on the disk before the manifest lists them, ex: in case of a power cut
+    fdst.flush()
+    os.fsync(fdst.fileno())
+    _write_json(manifest_file, manifest)
+
+
+def copy_file(src: Union[str, Path], dst: Union[str, Path], chunk_size: int = CHUNK_SIZE,
+              on_chunk: Callable = None, manifest_chunks: int = MANIFEST_CHUNKS) -> str:
+    """
+    Copy a file by chunks, resuming a previous partial copy of the same source file
+
+    :param src: source file
+    :param dst: destination file, written as dst.iblrig_part and renamed once complete
+    :param chunk_size: bytes per chunk, a partial copy with another chunk size starts over
+    :param on_chunk: called with the source file and the number of bytes after each chunk copied
+    :param manifest_chunks: chunks copied between two syncs of the partial copy and updates of
+     its manifest, at most as many chunks are copied again when an interrupted copy resumes
+    :return: digest of the file, the blake2b hex digest of the blake2b digests of its chunks
+    """
+    src, dst = Path(src), Path(dst)
+    stat = src.stat()
+    source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "chunk_size": chunk_size}
+    manifest_file = _manifest_file(dst)
+    part_file = dst.with_name(dst.name + PART_SUFFIX)
+    manifest = None
+    if manifest_file.exists():
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        if {k: manifest.get(k) for k in source} != source:
+            log.info(f"{src} changed since its partial copy, starting over")
+            manifest = None
+    if manifest is not None and manifest.get("digest") and dst.exists() and dst.stat().st_size == stat.st_size:
+        log.debug(f"{dst} already copied")
+        return manifest["digest"]
+    if manifest is None or not part_file.exists() or part_file.stat().st_size < len(manifest["chunks"]) * chunk_size:
+        manifest = dict(source, chunks=[], digest=None)
+    offset = len(manifest["chunks"]) * chunk_size
+    if offset:
+        log.info(f"Resuming copy of {src} at {offset / 2 ** 20:.0f} MB")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    with open(src, "rb") as fsrc, open(part_file, "r+b" if offset else "wb") as fdst:
+        fsrc.seek(offset)
+        fdst.seek(offset)
+        fdst.truncate()
+        while True:
+            chunk = fsrc.read(chunk_size)
+            if not chunk:
+                break
+            fdst.write(chunk)
+            manifest["chunks"].append(hashlib.blake2b(chunk).hexdigest())
+            if len(manifest["chunks"]) % manifest_chunks == 0:
+                _checkpoint(fdst, manifest_file, manifest)
+            if on_chunk is not None:
+                on_chunk(src, len(chunk))
+        _checkpoint(fdst, manifest_file, manifest)
+    stat = src.stat()
+    if (stat.st_size, stat.st_mtime_ns) != (source["size"], source["mtime_ns"]):
+        raise IOError(f"{src} changed during its copy")
+    if part_file.stat().st_size != source["size"]:
+        raise IOError(f"{dst} size mismatch: {part_file.stat().st_size} bytes copied out of {source['size']}")
+    os.replace(part_file, dst)
+    manifest["digest"] = _file_digest(manifest["chunks"])
+    _write_json(manifest_file, manifest)
+    return manifest["digest"]
+
+
+def _list_files(src: Path, ignore: list) -> list:
+    return sorted(
+        f for f in src.rglob("*")
+        if f.is_file() and not any(fnmatch.fnmatch(part, pat) for part in f.relative_to(src).parts for pat in ignore)
+        and not f.name.endswith((PART_SUFFIX, MANIFEST_SUFFIX, MANIFEST_SUFFIX + ".tmp"))
+    )
+
+
+def load_checksums(dst_session_path: Union[str, Path]) -> dict:
+    """
+    :param dst_session_path: destination session path
+    :return: {file path relative to the session: {"size", "mtime_ns", "digest", "chunk_size"}},
+     size and modification time of the source file, empty if there is no checksum file
+    """
+    checksum_file = Path(dst_session_path).joinpath(CHECKSUM_FILE_NAME)
+    if not checksum_file.exists():
+        return {}
+    with open(checksum_file) as f:
+        return json.load(f)
+
+
+def _write_checksums(dst: Path, rel_paths: list) -> None:
+    if not rel_paths:
+        return
+    # merged with the files of previous transfers of the session
+    checksums = load_checksums(dst)
+    for rel_path in rel_paths:
+        # the source file as it was hashed during the copy
+        with open(_manifest_file(dst.joinpath(rel_path))) as f:
+            manifest = json.load(f)
+        checksums[rel_path] = {k: manifest[k] for k in ("size", "mtime_ns", "digest", "chunk_size")}
+    _write_json(dst.joinpath(CHECKSUM_FILE_NAME), checksums)
+
+
+def verify_copy(src_session_path: Union[str, Path], dst_session_path: Union[str, Path], rel_path: str,
+                read_back: bool = False) -> bool:
+    """
+    Whether the copy of a file matches the checksum file of the destination session, the source
+    file can be removed if True. The digest recorded was computed from the source file during the
+    copy: the source file must not have changed since and the copy must have the same size.
+
+    :param src_session_path: source session path
+    :param dst_session_path: destination session path
+    :param rel_path: file path relative to the session, ex: "raw_video_data/_iblrig_leftCamera.raw.mp4"
+    :param read_back: also read the copy back and compare its digest, to detect the corruption of
+     the data written, at the cost of reading the whole file from the lab server
+    """
+    record = load_checksums(dst_session_path).get(rel_path)
+    src_file, dst_file = Path(src_session_path).joinpath(rel_path), Path(dst_session_path).joinpath(rel_path)
+    if record is None or not all(record.get(k) is not None for k in ("size", "mtime_ns", "digest")):
+        log.warning(f"{rel_path} has no checksum in {dst_session_path}, not verified")
+        return False
+    stat = src_file.stat()
+    if (stat.st_size, stat.st_mtime_ns) != (record["size"], record["mtime_ns"]):
+        log.warning(f"{src_file} changed since its copy, not verified")
+        return False
+    if not dst_file.exists() or dst_file.stat().st_size != record["size"]:
+        log.warning(f"{dst_file} size does not match its checksum file, not verified")
+        return False
+    if read_back and file_digest(dst_file, record["chunk_size"]) != record["digest"]:
+        log.error(f"{dst_file} digest does not match its checksum file, not verified")
+        return False
+    return True
+
+
+def _remove_manifests(dst: Path, rel_paths: list) -> None:
+    for rel_path in rel_paths:
+        _manifest_file(dst.joinpath(rel_path)).unlink()
+
+
+def transfer_sessions(session_pairs: list, ignore: list = (), max_workers: int = 4, chunk_size: int = CHUNK_SIZE,
+                      max_bytes_per_sec: float = None, pause_if: Callable = None) -> dict:
+    """
+    Copy several session folders, the files of all sessions are copied concurrently
+
+    :param session_pairs: list of (source session path, destination session path)
+    :param ignore: glob patterns of file or folder names not to copy, as shutil.ignore_patterns
+    :param max_workers: number of files copied at the same time
+    :param chunk_size: bytes per chunk, see copy_file
+    :param max_bytes_per_sec: bandwidth limit of the whole transfer, None for no limit
+    :param pause_if: callable returning True while the transfer should wait, ex:
+     functools.partial(is_acquiring, local_subjects_folder)
+    :return: dict keyed by source session path of {file path relative to the session: digest},
+     or of the exception raised if any file of the session failed to copy. The digests of the
+     sessions copied are also written to their checksum file, see verify_copy
+    """
+    session_pairs = [(Path(src), Path(dst)) for src, dst in session_pairs]
+    files = [(src, f, dst / f.relative_to(src)) for src, dst in session_pairs for f in _list_files(src, list(ignore))]
+    monitor = TransferMonitor({f: f.stat().st_size for _, f, _ in files}, max_bytes_per_sec, pause_if)
+
+    def copy(src_file, dst_file):
+        monitor.file_started(src_file)
+        try:
+            return copy_file(src_file, dst_file, chunk_size, on_chunk=monitor.on_chunk)
+        finally:
+            monitor.file_done(src_file)
+
+    results = {src: {} for src, _ in session_pairs}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(src, f.relative_to(src).as_posix(), executor.submit(copy, f, dst_file)) for src, f, dst_file in files]
+        for src, rel_path, future in futures:
+            try:
+                digest = future.result()
+            except Exception as e:
+                log.error(f"Failed to copy {src / rel_path}: {e}")
+                results[src] = e
+                continue
+            if isinstance(results[src], dict):
+                results[src][rel_path] = digest
+    for src, dst in session_pairs:
+        # the manifests are kept if the session failed, for the next transfer to resume
+        if isinstance(results[src], dict):
+            _write_checksums(dst, list(results[src]))
+            _remove_manifests(dst, results[src])
+            log.info(f"Copied {len(results[src])} files from {src} to {dst}")
+    stats = monitor.stats()
+    log.info(f"Transferred {stats['bytes_done'] / 2 ** 30:.2f} GB at {stats['bytes_per_sec'] / 2 ** 20:.1f} MB/s")
+    return results
@@ -0,0 +1,94 @@
+"""
+Timing of the phases of the trial loop of the tasks, to see what eats into the ITI
+
+Each phase of a trial is timed with a monotonic clock, by a span:
+    timer = TrialTimer()
+    for i in range(sph.NTRIALS):
+        with timer.span("next_trial"):
+            tph.next_trial()
+        ...
+        timer.end_trial()
+    timer.save(sph.SESSION_RAW_DATA_FOLDER)
+    log.info(timer.summary())
+
+The durations are saved as a structured array of float32 seconds, one row per trial and one
+field per phase, NaN for the phases not run in a trial, in _iblrig_taskTiming.raw.npy.
+"""
+import logging
+import math
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+log = logging.getLogger("iblrig")
+
+TIMING_FILE_NAME = "_iblrig_taskTiming.raw.npy"
+PHASES = (
+    "next_trial",
+    "state_machine",
+    "send_state_machine",
+    "run_state_machine",
+    "trial_completed",
+    "ambient_sensor",
+    "update_fig",
+    "check_sync_pulses",
+)
+
+
+class TrialTimer(object):
+    def __init__(self, phases: tuple = PHASES):
+        self.phases = tuple(phases)
+        self._index = {name: i for i, name in enumerate(self.phases)}
+        self._trials = []
+        self._current = [float("nan")] * len(self.phases)
+        self._starts = {}
+
+    def start(self, name: str) -> None:
+        self._starts[name] = time.perf_counter()
+
+    def stop(self, name: str) -> None:
+        elapsed = time.perf_counter() - self._starts.pop(name)
+        i = self._index[name]
+        # a phase run several times in a trial adds up
+        self._current[i] = elapsed if math.isnan(self._current[i]) else self._current[i] + elapsed
+
+    @contextmanager
+    def span(self, name: str):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def end_trial(self) -> None:
+        self._trials.append(tuple(self._current))
+        self._current = [float("nan")] * len(self.phases)
+
+    def to_numpy(self) -> np.ndarray:
+        """Durations in seconds, structured array with a float32 field per phase and a row per trial"""
+        return np.array(self._trials, dtype=[(name, np.float32) for name in self.phases])
+
+    def save(self, session_raw_data_folder) -> Path:
+        file_path = Path(session_raw_data_folder).joinpath(TIMING_FILE_NAME)
+        np.save(file_path, self.to_numpy())
+        return file_path
+
+    def summary(self) -> str:
+        """Median, 95th percentile and maximum duration of each phase, in ms"""
+        timing = self.to_numpy()
+        lines = [f"Trial loop timing over {timing.size} trials (ms):", f"{'':>20} {'median':>9} {'p95':>9} {'max':>9}"]
+        overhead = np.zeros(timing.size)
+        for name in self.phases:
+            durations = timing[name].astype(float) * 1000
+            if name != "run_state_machine":
+                overhead += np.nan_to_num(durations)
+            if np.all(np.isnan(durations)):
+                continue
+            median, p95, max_ = np.nanpercentile(durations, [50, 95, 100])
+            lines.append(f"{name:>20} {median:9.2f} {p95:9.2f} {max_:9.2f}")
+        if timing.size:
+            median, p95, max_ = np.percentile(overhead, [50, 95, 100])
+            lines.append(f"{'inter-trial overhead':>20} {median:9.2f} {p95:9.2f} {max_:9.2f}")
+        return "\n".join(lines)
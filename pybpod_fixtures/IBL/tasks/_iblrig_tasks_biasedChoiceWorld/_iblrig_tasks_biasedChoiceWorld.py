@@ -3,13 +3,16 @@
 # @Author: Niccolò Bonacchi
 # @Date:   2018-02-02 12:31:13
 import logging
+from pathlib import Path
 
 import iblrig.bonsai as bonsai
-import matplotlib.pyplot as plt
+import iblrig.session_catalog as session_catalog
 import user_settings
-from iblrig.bpod_helper import BpodMessageCreator
+from iblrig.bpod_helper import BpodMessageCreator, StateMachineTemplate
+from iblrig.plot_process import PlotProcess
+from iblrig.trial_timing import TrialTimer
 from iblrig.user_input import ask_session_delay
-from pybpodapi.protocol import Bpod, StateMachine
+from pybpodapi.protocol import Bpod
 
 import online_plots as op
 import task_settings
@@ -22,10 +25,6 @@ global sph
 sph = SessionParamHandler(task_settings, user_settings)
 
 
-def bpod_loop_handler():
-    f.canvas.flush_events()  # 100µs
-
-
 def softcode_handler(data):
     """
     Soft codes should work with resasonable latency considering our limiting
@@ -54,8 +53,6 @@ def softcode_handler(data):
 # =============================================================================
 bpod = Bpod()
 
-# Loop handler function is used to flush events for the online plotting
-bpod.loop_handler = bpod_loop_handler
 # Soft code handler function can run arbitrary code from within state machine
 bpod.softcode_handler_function = softcode_handler
 # Bpod message creator
@@ -70,36 +67,12 @@ sc_play_noise = msg.sound_card_play_idx(sph.WHITE_NOISE_IDX)
 bpod = msg.return_bpod()
 
 
-# Delay initiation
-sph.SESSION_START_DELAY_SEC = ask_session_delay(sph.SETTINGS_FILE_PATH)
-
-# =============================================================================
-# TRIAL PARAMETERS AND STATE MACHINE
-# =============================================================================
-global tph
-tph = TrialParamHandler(sph)
-
-f, axes = op.make_fig(sph)
-plt.pause(1)
-
-# =====================================================================
-# RUN CAMERA SETUP
-# =====================================================================
-if bonsai.launch_cameras():
-    bonsai.start_camera_setup()
-
-for i in range(sph.NTRIALS):  # Main loop
-    tph.next_trial()
-    log.info(f"Starting trial: {i + 1}")
-    # =============================================================================
-    #     Start state machine definition
-    # =============================================================================
-    sma = StateMachine(bpod)
-
-    if i == 0:  # First trial exception start camera
-        log.info("First trial initializing, will move to next trial only if:")
-        log.info("1. camera is detected")
-        log.info(f"2. {sph.SESSION_START_DELAY_SEC} sec have elapsed")
+def build_state_machine(sma, first_trial, event_error, event_reward):
+    """
+    States of a trial type, built once per session by sma_template. The state timers
+    of each trial are set by sma_template.get in the main loop
+    """
+    if first_trial:  # First trial exception start camera
         sma.add_state(
             state_name="trial_start",
             state_timer=0,
@@ -180,8 +153,8 @@ for i in range(sph.NTRIALS):  # Main loop
         output_actions=[("Serial1", bonsai_close_loop)],
         state_change_conditions={
             "Tup": "no_go",
-            tph.event_error: "freeze_error",
-            tph.event_reward: "freeze_reward",
+            event_error: "freeze_error",
+            event_reward: "freeze_reward",
         },
     )
 
@@ -245,36 +218,94 @@ for i in range(sph.NTRIALS):  # Main loop
         state_change_conditions={"Tup": "exit"},
     )
 
+
+# Delay initiation
+sph.SESSION_START_DELAY_SEC = ask_session_delay(sph.SETTINGS_FILE_PATH)
+
+# =============================================================================
+# TRIAL PARAMETERS AND STATE MACHINE
+# =============================================================================
+global tph
+tph = TrialParamHandler(sph)
+
+plots = PlotProcess(op.__file__, op.fig_title(sph), Path(sph.SESSION_RAW_DATA_FOLDER).joinpath("online_plot.png"))
+
+# =====================================================================
+# RUN CAMERA SETUP
+# =====================================================================
+if bonsai.launch_cameras():
+    bonsai.start_camera_setup()
+
+# The state machines of the first and following trials, for each side, are built once
+sma_template = StateMachineTemplate(bpod, build_state_machine)
+sma_template.prebuild([
+    (first_trial, tph.threshold_events_dict[pos], tph.threshold_events_dict[-pos])
+    for first_trial in (True, False)
+    for pos in tph.position_set
+])
+timer = TrialTimer()
+for i in range(sph.NTRIALS):  # Main loop
+    with timer.span("next_trial"):
+        tph.next_trial()
+    log.info(f"Starting trial: {i + 1}")
+    # =============================================================================
+    #     Start state machine definition
+    # =============================================================================
+    if i == 0:
+        log.info("First trial initializing, will move to next trial only if:")
+        log.info("1. camera is detected")
+        log.info(f"2. {sph.SESSION_START_DELAY_SEC} sec have elapsed")
+    timer.start("state_machine")
+    trial_type = (i == 0, tph.event_error, tph.event_reward)
+    sma = sma_template.get(trial_type, timers={
+        "delay_initiation": tph.session_start_delay_sec,
+        "quiescent_period": tph.quiescent_period,
+        "interactive_delay": tph.interactive_delay,
+        "closed_loop": tph.response_window,
+        "no_go": tph.iti_error,
+        "error": tph.iti_error,
+        "reward": tph.reward_valve_time,
+        "correct": tph.iti_correct,
+    })
+    timer.stop("state_machine")
     # Send state machine description to Bpod device
-    bpod.send_state_machine(sma)
+    with timer.span("send_state_machine"):
+        sma_template.send(sma)
     # Run state machine
-    if not bpod.run_state_machine(sma):  # Locks until state machine 'exit' is reached
+    with timer.span("run_state_machine"):
+        running = bpod.run_state_machine(sma)  # Locks until state machine 'exit' is reached
+    if not running:
         break
 
-    tph = tph.trial_completed(bpod.session.current_trial.export())
+    with timer.span("trial_completed"):
+        tph = tph.trial_completed(bpod.session.current_trial.export())
 
-    as_data = tph.save_ambient_sensor_data(bpod, sph.SESSION_RAW_DATA_FOLDER)
+    with timer.span("ambient_sensor"):
+        as_data = tph.save_ambient_sensor_data(bpod, sph.SESSION_RAW_DATA_FOLDER)
     tph.show_trial_log()
 
     # Update online plots
-    op.update_fig(f, axes, tph)
+    with timer.span("update_fig"):
+        plots.update(op.get_summary(tph))
 
-    tph.check_sync_pulses()
+    with timer.span("check_sync_pulses"):
+        tph.check_sync_pulses()
+    timer.end_trial()
     stop_crit = tph.check_stop_criterions()
 
     if stop_crit and sph.USE_AUTOMATIC_STOPPING_CRITERIONS:
         if stop_crit == 1:
             msg = "STOPPING CRITERIA Nº1: PLEASE STOP TASK AND REMOVE MOUSE\
             \n < 400 trials in 45min"
-            f.patch.set_facecolor("xkcd:mint green")
+            plots.set_facecolor("xkcd:mint green")
         elif stop_crit == 2:
             msg = "STOPPING CRITERIA Nº2: PLEASE STOP TASK AND REMOVE MOUSE\
             \nMouse seems to be inactive"
-            f.patch.set_facecolor("xkcd:yellow")
+            plots.set_facecolor("xkcd:yellow")
         elif stop_crit == 3:
             msg = "STOPPING CRITERIA Nº3: PLEASE STOP TASK AND REMOVE MOUSE\
             \n> 90 minutes have passed since session start"
-            f.patch.set_facecolor("xkcd:red")
+            plots.set_facecolor("xkcd:red")
 
         if not sph.SUBJECT_DISENGAGED_TRIGGERED and stop_crit:
             patch = {
@@ -284,7 +315,12 @@ for i in range(sph.NTRIALS):  # Main loop
             sph.patch_settings_file(patch)
         [log.warning(msg) for x in range(5)]
 
+timer.save(sph.SESSION_RAW_DATA_FOLDER)
+log.info(timer.summary())
+plots.close()
+tph.data_file.close()
 bpod.close()
+session_catalog.update_session(sph.SESSION_FOLDER)
 
 
 if __name__ == "__main__":
@@ -7,8 +7,6 @@ import os
 from pathlib import Path
 from sys import platform
 
-from pythonosc import udp_client
-
 import iblrig.adaptive as adaptive
 import iblrig.ambient_sensor as ambient_sensor
 import iblrig.bonsai as bonsai
@@ -17,6 +15,7 @@ import iblrig.iotasks as iotasks
 import iblrig.misc as misc
 import iblrig.sound as sound
 import iblrig.user_input as user
+from iblrig.osc_client import BonsaiOscClient
 from iblrig.path_helper import SessionPathCreator
 from iblrig.rotary_encoder import MyRotaryEncoder
 
@@ -48,7 +47,7 @@ class SessionParamHandler(object):
             make = True  # True makes only raw_behavior_data folder
         else:
             make = ["video"]  # besides behavior which folders to creae
-        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make)
+        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make, previous_session=False)
         self.__dict__.update(spc.__dict__)
 
         # =====================================================================
@@ -71,21 +70,8 @@ class SessionParamHandler(object):
         # =====================================================================
         self.OSC_CLIENT_PORT = 7110
         self.OSC_CLIENT_IP = "127.0.0.1"
-        self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
-        # =====================================================================
-        # PREVIOUS DATA FILES
-        # =====================================================================
-        self.LAST_TRIAL_DATA = iotasks.load_data(self.PREVIOUS_SESSION_PATH)
-        self.LAST_SETTINGS_DATA = iotasks.load_settings(self.PREVIOUS_SESSION_PATH)
-        # =====================================================================
-        # ADAPTIVE STUFF
-        # =====================================================================
-        self.CALIB_FUNC = None
-        if self.AUTOMATIC_CALIBRATION:
-            self.CALIB_FUNC = adaptive.init_calib_func()
-        self.CALIB_FUNC_RANGE = adaptive.init_calib_func_range()
-        self.REWARD_VALVE_TIME = adaptive.init_reward_valve_time(self)
-
+        self.OSC_ACK_PORT = None  # port where Bonsai acknowledges the trial info, None for no acknowledgement
+        self.OSC_CLIENT = BonsaiOscClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT, ack_port=self.OSC_ACK_PORT)
         # =====================================================================
         # ROTARY ENCODER
         # =====================================================================
@@ -128,6 +114,20 @@ class SessionParamHandler(object):
         self.OUT_NOISE = ("SoftCode", 2) if self.SOFT_SOUND else ("Serial3", 7)
         self.OUT_STOP_SOUND = ("SoftCode", 0) if self.SOFT_SOUND else ("Serial3", ord("X"))
 
+        # =====================================================================
+        # PREVIOUS DATA FILES
+        # =====================================================================
+        # waits for the lookup started by the SessionPathCreator, which ran while the devices were set up
+        self.LAST_TRIAL_DATA, self.LAST_SETTINGS_DATA = iotasks.load_previous_session(self)
+        # =====================================================================
+        # ADAPTIVE STUFF
+        # =====================================================================
+        self.CALIB_FUNC = None
+        if self.AUTOMATIC_CALIBRATION:
+            self.CALIB_FUNC = adaptive.init_calib_func()
+        self.CALIB_FUNC_RANGE = adaptive.init_calib_func_range()
+        self.REWARD_VALVE_TIME = adaptive.init_reward_valve_time(self)
+
         # =====================================================================
         # SAVE SETTINGS FILE AND TASK CODE
         # =====================================================================
@@ -56,3 +56,7 @@ GO_TONE_FREQUENCY = 5000  # 5KHz
 GO_TONE_AMPLITUDE = 0.0272  # [0->1] 0.0272 for 70dB SPL Xonar
 # POOP COUNT LOGGING
 POOP_COUNT = True  # Whether to ask for a poop count at the end of the session
+# TRIAL DATA FILE
+DATA_FSYNC_TRIALS = 10  # Sync the trial data to the disk every n trials
+DATA_FSYNC_SECS = 60  # or at most every n seconds
+DATA_FILE_DELTA = False  # Write the changes from the previous trial, see scripts/convert_task_data.py
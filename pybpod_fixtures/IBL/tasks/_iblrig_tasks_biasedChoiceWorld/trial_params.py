@@ -3,7 +3,6 @@
 # @Author: Niccolò Bonacchi
 # @Date:   2018-02-02 14:06:34
 import datetime
-import json
 import logging
 import math
 import random
@@ -16,8 +15,9 @@ import iblrig.ambient_sensor as ambient_sensor
 import iblrig.blocks as blocks
 import iblrig.bonsai as bonsai
 import iblrig.misc as misc
+from iblrig.buffers import RunningMedian
 from iblrig.check_sync_pulses import sync_check
-from iblrig.iotasks import ComplexEncoder
+from iblrig.iotasks import TrialDataWriter
 
 log = logging.getLogger("iblrig")
 
@@ -38,7 +38,12 @@ class TrialParamHandler(object):
         )
         self.task_protocol = sph.PYBPOD_PROTOCOL
         self.data_file_path = sph.DATA_FILE_PATH
-        self.data_file = open(self.data_file_path, "a")
+        self.data_file = TrialDataWriter(
+            self.data_file_path,
+            fsync_trials=sph.DATA_FSYNC_TRIALS,
+            fsync_secs=sph.DATA_FSYNC_SECS,
+            delta=sph.DATA_FILE_DELTA,
+        )
         self.position_set = sph.STIM_POSITIONS
         self.contrast_set = sph.CONTRAST_SET
         self.contrast_set_probability_type = sph.CONTRAST_SET_PROBABILITY_TYPE
@@ -102,6 +107,7 @@ class TrialParamHandler(object):
         self.behavior_data = []
         self.response_time = None
         self.response_time_buffer = []
+        self.response_time_median = RunningMedian(window=20)
         self.response_side_buffer = []
         self.trial_correct = None
         self.trial_correct_buffer = []
@@ -110,7 +116,7 @@ class TrialParamHandler(object):
 
     def check_stop_criterions(self):
         return misc.check_stop_criterions(
-            self.init_datetime, self.response_time_buffer, self.trial_num
+            self.init_datetime, self.response_time_median, self.trial_num
         )
 
     def check_sync_pulses(self):
@@ -165,7 +171,6 @@ RELATIVE HUMIDITY:    {self.as_data['RelativeHumidity']} %
             # Send next trial info to Bonsai
             bonsai.send_current_trial_info(self)
             return
-        self.data_file = str(self.data_file)
         # Increment trial number
         self.trial_num += 1
         # Update quiescent period
@@ -193,8 +198,6 @@ RELATIVE HUMIDITY:    {self.as_data['RelativeHumidity']} %
         self.event_reward = self.threshold_events_dict[-self.position]
         # Reset outcome variables for next trial
         self.trial_correct = None
-        # Open the data file to append the next trial
-        self.data_file = open(self.data_file_path, "a")
         # Send next trial info to Bonsai
         bonsai.send_current_trial_info(self)
 
@@ -211,6 +214,7 @@ RELATIVE HUMIDITY:    {self.as_data['RelativeHumidity']} %
         # Add trial's response time to the buffer
         self.response_time = misc.get_trial_rt(self.behavior_data)
         self.response_time_buffer.append(self.response_time)
+        self.response_time_median.append(self.response_time)
         # Update response buffer -1 for left, 0 for nogo, and 1 for rightward
         if (correct and self.position < 0) or (error and self.position > 0):
             self.response_side_buffer.append(1)
@@ -245,10 +249,7 @@ RELATIVE HUMIDITY:    {self.as_data['RelativeHumidity']} %
         params["response_side_buffer"] = ""
         params["trial_correct_buffer"] = ""
         # Dump and save
-        out = json.dumps(params, cls=ComplexEncoder)
-        self.data_file.write(out)
-        self.data_file.write("\n")
-        self.data_file.close()
+        self.data_file.write(params)
         # If more than 42 trials save transfer_me.flag
         if self.trial_num == 42:
             misc.create_flags(self.data_file_path, self.poop_count)
@@ -775,7 +776,7 @@ if __name__ == "__main__":
     next_trial_times = []
     trial_completed_times = []
 
-    f, axes = op.make_fig(sph)
+    f, axes = op.make_fig(op.fig_title(sph))
     plt.pause(1)
 
     for x in range(1000):
@@ -789,7 +790,8 @@ if __name__ == "__main__":
         )
 
         if not x % 50:
-            op.update_fig(f, axes, tph)
+            op.update_fig(f, axes, op.get_summary(tph))
+            plt.pause(0.001)
         # op.update_fig(f, axes, tph)
 
         tph.show_trial_log()
@@ -802,7 +804,8 @@ if __name__ == "__main__":
 
         if x == 90:
             print("break")
-    op.update_fig(f, axes, tph)
+    op.update_fig(f, axes, op.get_summary(tph))
+    plt.pause(0.001)
 
     print("\nAverage next_trial times:", sum(next_trial_times) / len(next_trial_times))
     print(
@@ -3,14 +3,17 @@
 # @Author: Niccolò Bonacchi
 # @Date:   2018-02-02 12:31:13
 import logging
+from pathlib import Path
 
-import matplotlib.pyplot as plt
+import iblrig.session_catalog as session_catalog
 import user_settings
-from pybpodapi.protocol import Bpod, StateMachine
+from pybpodapi.protocol import Bpod
 
 import online_plots as op
 import task_settings
-from iblrig.bpod_helper import BpodMessageCreator
+from iblrig.bpod_helper import BpodMessageCreator, StateMachineTemplate
+from iblrig.plot_process import PlotProcess
+from iblrig.trial_timing import TrialTimer
 from session_params import SessionParamHandler
 from trial_params import TrialParamHandler
 
@@ -20,18 +23,11 @@ global sph
 sph = SessionParamHandler(task_settings, user_settings)
 
 
-def bpod_loop_handler():
-    f.canvas.flush_events()  # 100µs
-
-
 # =============================================================================
 # CONNECT TO BPOD
 # =============================================================================
 bpod = Bpod()
 
-# Loop handler function is used to flush events for the online plotting
-bpod.loop_handler = bpod_loop_handler
-
 # Bpod message creator
 msg = BpodMessageCreator(bpod)
 re_reset = msg.rotary_encoder_reset()
@@ -43,29 +39,13 @@ sc_play_tone = msg.sound_card_play_idx(sph.GO_TONE_IDX)
 sc_play_noise = msg.sound_card_play_idx(sph.WHITE_NOISE_IDX)
 bpod = msg.return_bpod()
 
-# =============================================================================
-# TRIAL PARAMETERS AND STATE MACHINE
-# =============================================================================
-global tph
-log.debug("Call tph creation")
-tph = TrialParamHandler(sph)
-log.debug("TPH CREATED!")
 
-log.debug("make fig")
-f, axes = op.make_fig(sph)
-log.debug("pause")
-plt.pause(1)
-
-log.debug("start SM definition")
-for i in range(sph.NTRIALS):  # Main loop
-    tph.next_trial()
-    log.info(f"Starting trial: {i + 1}")
-    # =============================================================================
-    #     Start state machine definition
-    # =============================================================================
-    sma = StateMachine(bpod)
-    if i == 0:
-        log.info("Waiting for camera pulses...")
+def build_state_machine(sma, first_trial, event_error, event_reward):
+    """
+    States of a trial type, built once per session by sma_template. The state timers
+    of each trial are set by sma_template.get in the main loop
+    """
+    if first_trial:
         sma.add_state(
             state_name="trial_start",
             state_timer=3600,  # ~100µs hardware irreducible delay
@@ -138,8 +118,8 @@ for i in range(sph.NTRIALS):  # Main loop
         state_timer=tph.response_window,
         state_change_conditions={
             "Tup": "no_go",
-            tph.event_error: "freeze_error",
-            tph.event_reward: "freeze_reward",
+            event_error: "freeze_error",
+            event_reward: "freeze_reward",
         },
         output_actions=[("Serial1", bonsai_close_loop)],
     )
@@ -204,37 +184,87 @@ for i in range(sph.NTRIALS):  # Main loop
         output_actions=[("BNC1", 255)],
     )
 
+
+# =============================================================================
+# TRIAL PARAMETERS AND STATE MACHINE
+# =============================================================================
+global tph
+log.debug("Call tph creation")
+tph = TrialParamHandler(sph)
+log.debug("TPH CREATED!")
+
+log.debug("start online plots")
+plots = PlotProcess(op.__file__, op.fig_title(sph), Path(sph.SESSION_RAW_DATA_FOLDER).joinpath("online_plot.png"))
+
+log.debug("start SM definition")
+# The state machines of the first and following trials, for each side, are built once
+sma_template = StateMachineTemplate(bpod, build_state_machine)
+sma_template.prebuild([
+    (first_trial, tph.threshold_events_dict[pos], tph.threshold_events_dict[-pos])
+    for first_trial in (True, False)
+    for pos in tph.position_set
+])
+timer = TrialTimer()
+for i in range(sph.NTRIALS):  # Main loop
+    with timer.span("next_trial"):
+        tph.next_trial()
+    log.info(f"Starting trial: {i + 1}")
+    # =============================================================================
+    #     Start state machine definition
+    # =============================================================================
+    if i == 0:
+        log.info("Waiting for camera pulses...")
+    timer.start("state_machine")
+    trial_type = (i == 0, tph.event_error, tph.event_reward)
+    sma = sma_template.get(trial_type, timers={
+        "quiescent_period": tph.quiescent_period,
+        "interactive_delay": tph.interactive_delay,
+        "closed_loop": tph.response_window,
+        "no_go": tph.iti_error,
+        "error": tph.iti_error,
+        "reward": tph.reward_valve_time,
+        "correct": tph.iti_correct,
+    })
     # if i == 0:
     #     sph.warn_ephys()
+    timer.stop("state_machine")
     # Send state machine description to Bpod device
-    bpod.send_state_machine(sma)
+    with timer.span("send_state_machine"):
+        sma_template.send(sma)
     # Run state machine
-    if not bpod.run_state_machine(sma):  # Locks until state machine 'exit' is reached
+    with timer.span("run_state_machine"):
+        running = bpod.run_state_machine(sma)  # Locks until state machine 'exit' is reached
+    if not running:
         break
 
-    tph = tph.trial_completed(bpod.session.current_trial.export())
+    with timer.span("trial_completed"):
+        tph = tph.trial_completed(bpod.session.current_trial.export())
 
-    as_data = tph.save_ambient_sensor_data(bpod, sph.SESSION_RAW_DATA_FOLDER)
+    with timer.span("ambient_sensor"):
+        as_data = tph.save_ambient_sensor_data(bpod, sph.SESSION_RAW_DATA_FOLDER)
     tph.show_trial_log()
 
     # Update online plots
-    op.update_fig(f, axes, tph)
+    with timer.span("update_fig"):
+        plots.update(op.get_summary(tph))
 
-    tph.check_sync_pulses()
+    with timer.span("check_sync_pulses"):
+        tph.check_sync_pulses()
+    timer.end_trial()
     stop_crit = tph.check_stop_criterions()
     if stop_crit and sph.USE_AUTOMATIC_STOPPING_CRITERIONS:
         if stop_crit == 1:
             msg = "STOPPING CRITERIA Nº1: PLEASE STOP TASK AND REMOVE MOUSE\
             \n < 400 trials in 45min"
-            f.patch.set_facecolor("xkcd:mint green")
+            plots.set_facecolor("xkcd:mint green")
         elif stop_crit == 2:
             msg = "STOPPING CRITERIA Nº2: PLEASE STOP TASK AND REMOVE MOUSE\
             \nMouse seems to be inactive"
-            f.patch.set_facecolor("xkcd:yellow")
+            plots.set_facecolor("xkcd:yellow")
         elif stop_crit == 3:
             msg = "STOPPING CRITERIA Nº3: PLEASE STOP TASK AND REMOVE MOUSE\
             \n> 90 minutes have passed since session start"
-            f.patch.set_facecolor("xkcd:red")
+            plots.set_facecolor("xkcd:red")
 
         if not sph.SUBJECT_DISENGAGED_TRIGGERED and stop_crit:
             patch = {
@@ -244,7 +274,12 @@ for i in range(sph.NTRIALS):  # Main loop
             sph.patch_settings_file(patch)
         [log.warning(msg) for x in range(5)]
 
+timer.save(sph.SESSION_RAW_DATA_FOLDER)
+log.info(timer.summary())
+plots.close()
+tph.data_file.close()
 bpod.close()
+session_catalog.update_session(sph.SESSION_FOLDER)
 
 
 if __name__ == "__main__":
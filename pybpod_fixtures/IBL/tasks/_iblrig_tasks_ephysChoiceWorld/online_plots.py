@@ -3,13 +3,15 @@
 # @Author: Niccolò Bonacchi
 # @Date:   2018-02-20 14:46:10
 # matplotlib.use('Qt5Agg')
-from pathlib import Path
-
 import matplotlib.pyplot as plt
 import numpy as np
 
 
-def make_fig(sph):
+def fig_title(sph):
+    return f"{sph.SUBJECT_NAME} - {sph.SUBJECT_WEIGHT}gr - {sph.SESSION_DATETIME}"
+
+
+def make_fig(title):
     plt.ion()
     f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
     ax_bars = plt.subplot2grid((2, 2), (0, 0), rowspan=1, colspan=1)
@@ -17,32 +19,36 @@ def make_fig(sph):
     ax_chron = plt.subplot2grid((2, 2), (1, 0), rowspan=1, colspan=1)
     ax_vars = plt.subplot2grid((2, 2), (1, 1), rowspan=1, colspan=1)
     ax_vars2 = ax_vars.twinx()
+    f.suptitle(title)
+
+    # the artists are created once and updated after each trial
+    artists = {
+        "bars": init_bars(ax_bars),
+        "psych": init_psych(ax_psych),
+        "chron": init_chron(ax_chron),
+        "vars": init_vars(ax_vars, ax_vars2),
+    }
     f.canvas.draw_idle()
-    #     plt.show()
-
-    f.suptitle(f"{sph.SUBJECT_NAME} - {sph.SUBJECT_WEIGHT}gr - {sph.SESSION_DATETIME}")  # noqa
-
-    axes = (ax_bars, ax_psych, ax_chron, ax_vars, ax_vars2)
-    plt.pause(0.001)
-    return (f, axes)
+    plt.show()
+    return (f, artists)
 
 
-def update_fig(f, axes, tph):
-    ax_bars, ax_psych, ax_chron, ax_vars, ax_vars2 = axes
+def get_summary(tph):
+    """Data of the plots after a trial, sent to the plotting process"""
+    return {
+        "bars": get_barplot_data(tph),
+        "psych": get_psych_data(tph),
+        "chron": get_chron_data(tph),
+        "vars": get_vars_data(tph),
+    }
 
-    bar_data = get_barplot_data(tph)
-    psych_data = get_psych_data(tph)
-    chron_data = get_chron_data(tph)
-    vars_data = get_vars_data(tph)
 
-    plot_bars(bar_data, ax=ax_bars)
-    plot_psych(psych_data, ax=ax_psych)
-    plot_chron(chron_data, ax=ax_chron)
-    plot_vars(vars_data, ax=ax_vars, ax2=ax_vars2)
-    plt.pause(0.001)
-
-    fname = Path(tph.data_file_path).parent / "online_plot.png"
-    f.savefig(fname)
+def update_fig(f, artists, summary):
+    plot_bars(summary["bars"], artists["bars"])
+    plot_psych(summary["psych"], artists["psych"])
+    plot_chron(summary["chron"], artists["chron"])
+    plot_vars(summary["vars"], artists["vars"])
+    f.canvas.draw_idle()
 
 
 def get_barplot_data(tph):
@@ -136,14 +142,17 @@ def get_vars_data(tph):
 
 
 # plotters
+TEXT_STYLE = dict(color="black", fontweight="bold", size="x-large")
+BLOCK_COLORS = {0.2: "green", 0.5: "black", 0.8: "blue"}
+STIM_PROBABILITY_LEFT_STYLES = (
+    # index in the psych and chron data, label of the 50/50 block first, drawn under the others
+    (2, "50/50", dict(c="k", marker="o", ls="-", alpha=0.5)),
+    (1, "20/80", dict(c="g", marker="o", ls="-")),
+    (3, "80/20", dict(c="b", marker="o", ls="-")),
+)
 
 
-def plot_bars(bar_data, ax=None):
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-    ax.cla()
-
+def init_bars(ax):
     width = 0.5
     xlabels = [
         "Water\nDelivered\n(µl)",
@@ -151,178 +160,119 @@ def plot_bars(bar_data, ax=None):
         "Current\nBlock",
         "Session\nDuration",
     ]
-    x = range(len(xlabels))  # the x locations for the groups
-    #############################################################
-    ax.barh(3, 0, width, color="black")
-    # ax.barh(0, bar_data['trial_num'], width, color="gray")
-    ax.text(
-        1, 3, str(bar_data["time_from_start"]), color="black", fontweight="bold", size="x-large",
-    )
-    #############################################################
-    if bar_data["stim_pl"] == 0.2:
-        clr = "green"
-    elif bar_data["stim_pl"] == 0.5:
-        clr = "black"
-    elif bar_data["stim_pl"] == 0.8:
-        clr = "blue"
-    ax.barh(2, bar_data["block_len"], width, color=clr, label="Block Length")
-    ax.barh(
-        2, bar_data["block_trial_num"], width, color="gray", label="Trials in current block",
-    )
-    ax.barh(
-        2,
-        bar_data["block_num"],
-        width,
-        left=bar_data["block_len"],
-        color="orange",
-        label="Block number",
-    )
-
-    ax.text(
-        1,
-        2.26,  # bar_data['block_len'] + bar_data['block_num'] +
-        "{} / {} of block #{}".format(
-            bar_data["block_trial_num"], bar_data["block_len"], bar_data["block_num"]
-        ),
-        color="black",
-        fontweight="bold",
-        size="x-large",
-    )
-    #############################################################
-    ax.barh(1, bar_data["ntrials_correct"], width, color="green", label="Correct")
-    ax.barh(
-        1,
-        bar_data["ntrials_err"],
-        width,
-        left=bar_data["ntrials_correct"],
-        color="red",
-        label="Error",
-    )
-
-    left = 0
-    ax.text(
-        left + 1,
-        1.26,
-        str(bar_data["ntrials_correct"]),
-        color="green",
-        fontweight="bold",
-        size="x-large",
-    )
-    left += bar_data["ntrials_correct"]
-    ax.text(
-        left + 1,
-        1.26,  # - (bar_data['ntrials_err'] / 2)
-        str(bar_data["ntrials_err"]),
-        color="red",
-        fontweight="bold",
-        size="x-large",
-    )
-    left += bar_data["ntrials_err"]
-    ax.text(
-        left + 1,
-        1,
-        str(bar_data["ntrials_correct"] + bar_data["ntrials_err"]),
-        color="black",
-        fontweight="bold",
-        size="x-large",
-    )
-
-    #############################################################
-    ax.barh(0, bar_data["water_delivered"], width, color="blue")
-    ax.text(
-        1,
-        0.26,  # bar_data['water_delivered'] +
-        str(bar_data["water_delivered"]),
-        color="blue",
-        fontweight="bold",
-        size="x-large",
-    )
-    #############################################################
-
-    ax.set_yticks([i for i in x])
+    bars = {
+        "block_len": ax.barh(2, 0, width, color="black", label="Block Length")[0],
+        "block_trial_num": ax.barh(2, 0, width, color="gray", label="Trials in current block")[0],
+        "block_num": ax.barh(2, 0, width, color="orange", label="Block number")[0],
+        "correct": ax.barh(1, 0, width, color="green", label="Correct")[0],
+        "error": ax.barh(1, 0, width, color="red", label="Error")[0],
+        "water": ax.barh(0, 0, width, color="blue")[0],
+    }
+    texts = {
+        "duration": ax.text(1, 3, "", **TEXT_STYLE),
+        "block": ax.text(1, 2.26, "", **TEXT_STYLE),
+        "correct": ax.text(1, 1.26, "", **{**TEXT_STYLE, "color": "green"}),
+        "error": ax.text(1, 1.26, "", **{**TEXT_STYLE, "color": "red"}),
+        "outcome_total": ax.text(1, 1, "", **TEXT_STYLE),
+        "water": ax.text(1, 0.26, "", **{**TEXT_STYLE, "color": "blue"}),
+    }
+    ax.set_yticks(range(len(xlabels)))
     ax.set_yticklabels(xlabels, minor=False)
-    # ax.set_xlim([0, 100])
+    ax.set_ylim([-0.5, 3.5])
     ax.legend()
-    ax.figure.canvas.draw_idle()
-
+    return ax, bars, texts
 
-def plot_psych(psych_data, ax=None):
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-    ax.cla()
 
-    x = psych_data[0]
-    y02 = psych_data[1]
-    y05 = psych_data[2]
-    y08 = psych_data[3]
+def plot_bars(bar_data, artists):
+    ax, bars, texts = artists
+    texts["duration"].set_text(str(bar_data["time_from_start"]))
 
-    ax.plot(x, y05, c="k", label="CCW responses 50/50", marker="o", ls="-", alpha=0.5)
-    ax.plot(x, y02, c="g", label="CCW responses 20/80", marker="o", ls="-")
-    ax.plot(x, y08, c="b", label="CCW responses 80/20", marker="o", ls="-")
+    bars["block_len"].set_width(bar_data["block_len"])
+    bars["block_len"].set_color(BLOCK_COLORS.get(bar_data["stim_pl"], "black"))
+    bars["block_trial_num"].set_width(bar_data["block_trial_num"])
+    bars["block_num"].set_x(bar_data["block_len"])
+    bars["block_num"].set_width(bar_data["block_num"])
+    texts["block"].set_text(
+        "{} / {} of block #{}".format(bar_data["block_trial_num"], bar_data["block_len"], bar_data["block_num"])
+    )
 
+    bars["correct"].set_width(bar_data["ntrials_correct"])
+    bars["error"].set_x(bar_data["ntrials_correct"])
+    bars["error"].set_width(bar_data["ntrials_err"])
+    texts["correct"].set_text(str(bar_data["ntrials_correct"]))
+    texts["error"].set_x(bar_data["ntrials_correct"] + 1)
+    texts["error"].set_text(str(bar_data["ntrials_err"]))
+    texts["outcome_total"].set_x(bar_data["ntrials_correct"] + bar_data["ntrials_err"] + 1)
+    texts["outcome_total"].set_text(str(bar_data["ntrials_correct"] + bar_data["ntrials_err"]))
+
+    bars["water"].set_width(bar_data["water_delivered"])
+    texts["water"].set_text(str(bar_data["water_delivered"]))
+    ax.relim()
+    ax.autoscale_view(scaley=False)
+
+
+def _init_lines(ax, label):
+    lines = {
+        i: ax.plot([], [], label=f"{label} {block}", **style)[0] for i, block, style in STIM_PROBABILITY_LEFT_STYLES
+    }
     ax.axhline(0.5, color="gray", ls="--", alpha=0.5)
     ax.axvline(0.0, color="gray", ls="--", alpha=0.5)
-    ax.set_ylim([-0.1, 1.1])
     ax.legend(loc="best")
     ax.grid()
-    ax.figure.canvas.draw_idle()
-    return
+    return ax, lines
 
 
-def plot_chron(chron_data, ax=None):
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-    ax.cla()
+def _update_lines(data, artists):
+    ax, lines = artists
+    for i, line in lines.items():
+        line.set_data(data[0], data[i])
+    ax.relim()
 
-    x = chron_data[0]
-    y02 = chron_data[1]
-    y05 = chron_data[2]
-    y08 = chron_data[3]
 
-    ax.plot(x, y05, c="k", label="Median response time 50/50", marker="o", ls="-", alpha=0.5)
-    ax.plot(x, y02, c="g", label="Median response time 20/80", marker="o", ls="-")
-    ax.plot(x, y08, c="b", label="Median response time 80/20", marker="o", ls="-")
+def init_psych(ax):
+    artists = _init_lines(ax, "CCW responses")
+    ax.set_ylim([-0.1, 1.1])
+    return artists
 
-    ax.axhline(0.5, color="gray", ls="--", alpha=0.5)
-    ax.axvline(0.0, color="gray", ls="--", alpha=0.5)
-    ax.legend(loc="best")
-    ax.grid()
-    ax.figure.canvas.draw_idle()
-    return
 
+def plot_psych(psych_data, artists):
+    _update_lines(psych_data, artists)
+    artists[0].autoscale_view(scaley=False)
 
-def plot_vars(vars_data, ax=None, ax2=None):
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-        ax2 = ax.twinx()
-    if ax2 is None:
-        ax2 = ax.twinx()
 
-    ax.cla()
-    ax2.cla()
+def init_chron(ax):
+    return _init_lines(ax, "Median response time")
 
-    # ax.figure.tight_layout()  # or right y-label is slightly clipped
-    width = 0.5
 
-    x = [0, 1, 2, 3, 4]
-    median_rt = vars_data["median_rt"] / 10
-    prop_correct = vars_data["prop_correct"]
-    temp = vars_data["Temperature_C"]
-    rel_hum = vars_data["RelativeHumidity"] / 100
+def plot_chron(chron_data, artists):
+    _update_lines(chron_data, artists)
+    artists[0].autoscale_view()
 
-    ax.bar(x[0], median_rt, width, color="cyan", label="Median RT (10^1ms)")
-    ax.bar(x[1], temp, width, color="magenta", label="Temperature (ºC)")
 
-    ax2.bar(x[3], rel_hum, width, color="yellow", label="Relative humidity")
-    ax2.bar(x[4], prop_correct, width, color="black", label="Proportion correct")
+def init_vars(ax, ax2):
+    # ax.figure.tight_layout()  # or right y-label is slightly clipped
+    width = 0.5
+    x = [0, 1, 2, 3, 4]
+    bars = {
+        "median_rt": ax.bar(x[0], 0, width, color="cyan", label="Median RT (10^1ms)")[0],
+        "temp": ax.bar(x[1], 0, width, color="magenta", label="Temperature (ºC)")[0],
+        "rel_hum": ax2.bar(x[3], 0, width, color="yellow", label="Relative humidity")[0],
+        "prop_correct": ax2.bar(x[4], 0, width, color="black", label="Proportion correct")[0],
+    }
     ax2.set_ylim([0, 1.1])
     ax.legend(loc="lower left")
     ax2.legend(loc="lower right")
-    ax.figure.canvas.draw_idle()
-    ax2.figure.canvas.draw_idle()
+    return ax, bars
+
+
+def plot_vars(vars_data, artists):
+    ax, bars = artists
+    bars["median_rt"].set_height(vars_data["median_rt"] / 10)
+    bars["temp"].set_height(vars_data["Temperature_C"])
+    bars["rel_hum"].set_height(vars_data["RelativeHumidity"] / 100)
+    bars["prop_correct"].set_height(vars_data["prop_correct"])
+    ax.relim()
+    ax.autoscale_view()
 
 
 if __name__ == "__main__":
@@ -10,8 +10,6 @@ from pathlib import Path
 from sys import platform
 from tkinter import messagebox
 
-from pythonosc import udp_client
-
 import iblrig.adaptive as adaptive
 import iblrig.ambient_sensor as ambient_sensor
 import iblrig.bonsai as bonsai
@@ -20,6 +18,7 @@ import iblrig.iotasks as iotasks
 import iblrig.misc as misc
 import iblrig.sound as sound
 import iblrig.user_input as user_input
+from iblrig.osc_client import BonsaiOscClient
 from iblrig.path_helper import SessionPathCreator
 from iblrig.rotary_encoder import MyRotaryEncoder
 
@@ -48,13 +47,16 @@ class SessionParamHandler(object):
         }
         self.__dict__.update(us)
         self = iotasks.deserialize_pybpod_user_settings(self)
-        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make)
+        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make, previous_session=False)
         self.__dict__.update(spc.__dict__)
         # =====================================================================
         # SETTINGS
         # =====================================================================
         self.RECORD_SOUND = True
         self.RECORD_AMBIENT_SENSOR_DATA = True
+        self.DATA_FSYNC_TRIALS = 10  # Sync the trial data to the disk every n trials
+        self.DATA_FSYNC_SECS = 60  # or at most every n seconds
+        self.DATA_FILE_DELTA = False  # Write the changes from the previous trial, see scripts/convert_task_data.py
 
         self.NTRIALS = 2000  # Number of trials for the current session
         self.USE_AUTOMATIC_STOPPING_CRITERIONS = (
@@ -83,33 +85,8 @@ class SessionParamHandler(object):
         # =====================================================================
         self.OSC_CLIENT_PORT = 7110
         self.OSC_CLIENT_IP = "127.0.0.1"
-        self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
-        # =====================================================================
-        # PREVIOUS DATA FILES
-        # =====================================================================
-        self.LAST_TRIAL_DATA = iotasks.load_data(self.PREVIOUS_SESSION_PATH)
-        self.LAST_SETTINGS_DATA = iotasks.load_settings(self.PREVIOUS_SESSION_PATH)
-        bonsai.start_mic_recording(self)
-        self.IS_MOCK = user_input.ask_is_mock()  # Change to False if mock has its own task
-        # Get pregenerated session num (the num in the filename!)
-        if self.IS_MOCK:
-            self.SESSION_ORDER = None
-            self.SESSION_IDX = None
-            self.PREGENERATED_SESSION_NUM = "mock"
-        else:
-            (self.SESSION_ORDER, self.SESSION_IDX) = iotasks.load_session_order_idx(
-                self.LAST_SETTINGS_DATA
-            )
-            self.SESSION_IDX = user_input.ask_confirm_session_idx(self.SESSION_IDX)
-            self.PREGENERATED_SESSION_NUM = self.SESSION_ORDER[self.SESSION_IDX]
-        # Load session from file
-        (
-            self.POSITIONS,
-            self.CONTRASTS,
-            self.QUIESCENT_PERIOD,
-            self.STIM_PHASE,
-            self.LEN_BLOCKS,
-        ) = iotasks.load_ephys_session_pcqs(self.PREGENERATED_SESSION_NUM)
+        self.OSC_ACK_PORT = None  # port where Bonsai acknowledges the trial info, None for no acknowledgement
+        self.OSC_CLIENT = BonsaiOscClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT, ack_port=self.OSC_ACK_PORT)
         # =====================================================================
         # ADAPTIVE STUFF
         # =====================================================================
@@ -190,6 +167,32 @@ class SessionParamHandler(object):
         self.OUT_NOISE = ("SoftCode", 2) if self.SOFT_SOUND else ("Serial3", 7)
         self.OUT_STOP_SOUND = ("SoftCode", 0) if self.SOFT_SOUND else ("Serial3", ord("X"))
         # =====================================================================
+        # PREVIOUS DATA FILES
+        # =====================================================================
+        # waits for the lookup started by the SessionPathCreator, which ran while the devices were set up
+        self.LAST_TRIAL_DATA, self.LAST_SETTINGS_DATA = iotasks.load_previous_session(self)
+        bonsai.start_mic_recording(self)
+        self.IS_MOCK = user_input.ask_is_mock()  # Change to False if mock has its own task
+        # Get pregenerated session num (the num in the filename!)
+        if self.IS_MOCK:
+            self.SESSION_ORDER = None
+            self.SESSION_IDX = None
+            self.PREGENERATED_SESSION_NUM = "mock"
+        else:
+            (self.SESSION_ORDER, self.SESSION_IDX) = iotasks.load_session_order_idx(
+                self.LAST_SETTINGS_DATA
+            )
+            self.SESSION_IDX = user_input.ask_confirm_session_idx(self.SESSION_IDX)
+            self.PREGENERATED_SESSION_NUM = self.SESSION_ORDER[self.SESSION_IDX]
+        # Load session from file
+        (
+            self.POSITIONS,
+            self.CONTRASTS,
+            self.QUIESCENT_PERIOD,
+            self.STIM_PHASE,
+            self.LEN_BLOCKS,
+        ) = iotasks.load_ephys_session_pcqs(self.PREGENERATED_SESSION_NUM)
+        # =====================================================================
         # PROBES + WEIGHT
         # =====================================================================
         form_data = -1
@@ -6,12 +6,12 @@ import logging
 import math
 
 import numpy as np
-from pythonosc import udp_client
 
 import iblrig.frame2TTL as frame2TTL
 import iblrig.iotasks as iotasks
 import iblrig.user_input as user_input
 from iblrig.misc import make_square_dvamat, checkerboard
+from iblrig.osc_client import BonsaiOscClient
 from iblrig.path_helper import SessionPathCreator
 
 log = logging.getLogger("iblrig")
@@ -43,7 +43,8 @@ class SessionParamHandler(object):
         # =====================================================================
         self.OSC_CLIENT_PORT = 7110
         self.OSC_CLIENT_IP = "127.0.0.1"
-        self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
+        self.OSC_ACK_PORT = None  # port where Bonsai acknowledges the trial info, None for no acknowledgement
+        self.OSC_CLIENT = BonsaiOscClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT, ack_port=self.OSC_ACK_PORT)
         # =====================================================================
         # frame2TTL
         # =====================================================================
@@ -5,6 +5,7 @@
 import logging
 
 import iblrig.bonsai as bonsai
+import iblrig.session_catalog as session_catalog
 import user_settings
 from iblrig.bpod_helper import BpodMessageCreator
 from pybpodapi.protocol import Bpod, StateMachine
@@ -160,7 +161,9 @@ AMBIENT SENSOR DATA:    {as_msg}
     if not ev_bnc1 or not ev_bnc2 or not ev_port1:
         log.warning(warn_msg)
 
+tph.data_file.close()
 bpod.close()
+session_catalog.update_session(sph.SESSION_FOLDER)
 
 
 if __name__ == "__main__":
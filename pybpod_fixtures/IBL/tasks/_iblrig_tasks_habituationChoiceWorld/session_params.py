@@ -7,8 +7,6 @@ import os
 from pathlib import Path
 from sys import platform
 
-from pythonosc import udp_client
-
 import iblrig.adaptive as adaptive
 import iblrig.ambient_sensor as ambient_sensor
 import iblrig.bonsai as bonsai
@@ -17,6 +15,7 @@ import iblrig.iotasks as iotasks
 import iblrig.misc as misc
 import iblrig.sound as sound
 import iblrig.user_input as user
+from iblrig.osc_client import BonsaiOscClient
 from iblrig.path_helper import SessionPathCreator
 from iblrig.rotary_encoder import MyRotaryEncoder
 
@@ -60,7 +59,8 @@ class SessionParamHandler(object):
         # =====================================================================
         self.OSC_CLIENT_PORT = 7110
         self.OSC_CLIENT_IP = "127.0.0.1"
-        self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
+        self.OSC_ACK_PORT = None  # port where Bonsai acknowledges the trial info, None for no acknowledgement
+        self.OSC_CLIENT = BonsaiOscClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT, ack_port=self.OSC_ACK_PORT)
         # =====================================================================
         # frame2TTL
         # =====================================================================
@@ -12,7 +12,7 @@ import iblrig.bonsai as bonsai
 import iblrig.misc as misc
 import numpy as np
 from dateutil import parser
-from iblrig.iotasks import ComplexEncoder
+from iblrig.iotasks import TrialDataWriter
 
 log = logging.getLogger("iblrig")
 
@@ -31,7 +31,9 @@ class TrialParamHandler(object):
         self.task_protocol = sph.PYBPOD_PROTOCOL
         self.elapsed_time = 0
         self.data_file_path = sph.DATA_FILE_PATH
-        self.data_file = open(self.data_file_path, "a")
+        self.data_file = TrialDataWriter(
+            self.data_file_path, fsync_trials=sph.DATA_FSYNC_TRIALS, fsync_secs=sph.DATA_FSYNC_SECS
+        )
         self.position_set = sph.STIM_POSITIONS
         self.contrast_set = sph.CONTRAST_SET
         self.iti_target = sph.ITI
@@ -75,10 +77,7 @@ class TrialParamHandler(object):
         params["init_datetime"] = params["init_datetime"].isoformat()
         params["elapsed_time"] = str(params["elapsed_time"])
 
-        out = json.dumps(params, cls=ComplexEncoder)
-        self.data_file.write(out)
-        self.data_file.write("\n")
-        self.data_file.close()
+        out = self.data_file.write(params)
         # If more than 42 trials save transfer_me.flag
         if self.trial_num == 42:
             misc.create_flags(self.data_file_path, self.poop_count)
@@ -92,7 +91,6 @@ class TrialParamHandler(object):
             # Send next trial info to Bonsai
             bonsai.send_current_trial_info(self)
             return
-        self.data_file = str(self.data_file)
         # Increment trial number
         self.trial_num += 1
         # Update contrast
@@ -105,8 +103,6 @@ class TrialParamHandler(object):
         self.delay_to_stim_center = np.random.normal(self.delay_to_stim_center_mean, 2)
         # Update water delivered
         self.water_delivered += self.reward_amount
-        # Open the data file to append the next trial
-        self.data_file = open(self.data_file_path, "a")
         # Send next trial info to Bonsai
         bonsai.send_current_trial_info(self)
 
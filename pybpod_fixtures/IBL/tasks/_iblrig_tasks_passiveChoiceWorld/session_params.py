@@ -10,14 +10,13 @@ from pathlib import Path
 from sys import platform
 from tkinter import messagebox
 
-from pythonosc import udp_client
-
 import iblrig.adaptive as adaptive
 import iblrig.ambient_sensor as ambient_sensor
 import iblrig.iotasks as iotasks
 import iblrig.misc as misc
 import iblrig.path_helper as ph
 import iblrig.sound as sound
+from iblrig.osc_client import BonsaiOscClient
 
 log = logging.getLogger("iblrig")
 log.setLevel(logging.DEBUG)
@@ -98,7 +97,8 @@ class SessionParamHandler(object):
         # =====================================================================
         self.OSC_CLIENT_IP = "127.0.0.1"
         self.OSC_CLIENT_PORT = 7110
-        self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
+        self.OSC_ACK_PORT = None  # port where Bonsai acknowledges the trial info, None for no acknowledgement
+        self.OSC_CLIENT = BonsaiOscClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT, ack_port=self.OSC_ACK_PORT)
         # =====================================================================
         # PREVIOUS DATA FILES
         # =====================================================================
@@ -6,7 +6,6 @@ from sys import platform
 from tkinter import messagebox
 
 import numpy as np
-from pythonosc import udp_client
 
 import iblrig.adaptive as adaptive
 import iblrig.ambient_sensor as ambient_sensor
@@ -15,6 +14,7 @@ import iblrig.misc as misc
 import iblrig.sound as sound
 import iblrig.user_input as user_input
 from iblrig import path_helper
+from iblrig.osc_client import BonsaiOscClient
 
 log = logging.getLogger("iblrig")
 log.setLevel(logging.DEBUG)
@@ -78,7 +78,8 @@ class SessionParamHandler(object):
         # =====================================================================
         self.OSC_CLIENT_IP = "127.0.0.1"
         self.OSC_CLIENT_PORT = 7110
-        self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
+        self.OSC_ACK_PORT = None  # port where Bonsai acknowledges the trial info, None for no acknowledgement
+        self.OSC_CLIENT = BonsaiOscClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT, ack_port=self.OSC_ACK_PORT)
         # =====================================================================
         # PREVIOUS DATA FILES
         # =====================================================================
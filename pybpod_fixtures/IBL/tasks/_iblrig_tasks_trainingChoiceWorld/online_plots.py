@@ -3,13 +3,15 @@
 # @Author: Niccolò Bonacchi
 # @Date:   2018-02-20 14:46:10
 # matplotlib.use('Qt5Agg')
-from pathlib import Path
-
 import matplotlib.pyplot as plt
 import numpy as np
 
 
-def make_fig(sph):
+def fig_title(sph):
+    return f"{sph.SUBJECT_NAME} - {sph.SUBJECT_WEIGHT}gr - {sph.SESSION_DATETIME}"
+
+
+def make_fig(title):
     plt.ion()
     f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
     ax_bars = plt.subplot2grid((2, 2), (0, 0), rowspan=1, colspan=1)
@@ -17,32 +19,36 @@ def make_fig(sph):
     ax_chron = plt.subplot2grid((2, 2), (1, 0), rowspan=1, colspan=1)
     ax_vars = plt.subplot2grid((2, 2), (1, 1), rowspan=1, colspan=1)
     ax_vars2 = ax_vars.twinx()
+    f.suptitle(title)
+
+    # the artists are created once and updated after each trial
+    artists = {
+        "bars": init_bars(ax_bars),
+        "psych": init_psych(ax_psych),
+        "chron": init_chron(ax_chron),
+        "vars": init_vars(ax_vars, ax_vars2),
+    }
     f.canvas.draw_idle()
     plt.show()
+    return (f, artists)
 
-    f.suptitle(f"{sph.SUBJECT_NAME} - {sph.SUBJECT_WEIGHT}gr - {sph.SESSION_DATETIME}")  # noqa
-
-    axes = (ax_bars, ax_psych, ax_chron, ax_vars, ax_vars2)
-    # plt.pause(0.001)
-    return (f, axes)
-
-
-def update_fig(f, axes, tph):
-    ax_bars, ax_psych, ax_chron, ax_vars, ax_vars2 = axes
 
-    bar_data = get_barplot_data(tph)
-    psych_data = get_psych_data(tph)
-    chron_data = get_chron_data(tph)
-    vars_data = get_vars_data(tph)
+def get_summary(tph):
+    """Data of the plots after a trial, sent to the plotting process"""
+    return {
+        "bars": get_barplot_data(tph),
+        "psych": get_psych_data(tph),
+        "chron": get_chron_data(tph),
+        "vars": get_vars_data(tph),
+    }
 
-    plot_bars(bar_data, ax=ax_bars)
-    plot_psych(psych_data, ax=ax_psych)
-    plot_chron(chron_data, ax=ax_chron)
-    plot_vars(vars_data, ax=ax_vars, ax2=ax_vars2)
-    plt.pause(0.001)
 
-    fname = Path(tph.data_file_path).parent / "online_plot.png"
-    f.savefig(fname)
+def update_fig(f, artists, summary):
+    plot_bars(summary["bars"], artists["bars"])
+    plot_psych(summary["psych"], artists["psych"])
+    plot_chron(summary["chron"], artists["chron"])
+    plot_vars(summary["vars"], artists["vars"])
+    f.canvas.draw_idle()
 
 
 def get_barplot_data(tph):
@@ -98,37 +104,10 @@ def get_vars_data(tph):
 
 
 # plotters
+TEXT_STYLE = dict(color="black", fontweight="bold", size="x-large")
 
 
-def plot_bars(bar_data, ax=None):
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-    ax.cla()
-
-    def make_bar_texts(ax, ypos, vars):
-        left = 0
-        for var in vars:
-            ax.text(
-                left + (var * 0.15),
-                ypos,
-                str(var),
-                color="black",
-                fontweight="bold",
-                size="x-large",
-            )
-            left += var
-        else:
-            ax.text(
-                left + (var * 0.15),
-                ypos,
-                str(left),
-                color="black",
-                fontweight="bold",
-                size="x-large",
-                alpha=0.5,
-            )
-
+def init_bars(ax):
     width = 0.75
     xlabels = [
         "Water\nDelivered\n(µl)",
@@ -136,137 +115,128 @@ def plot_bars(bar_data, ax=None):
         "Trial\nTypes",
         "Session\nDuration",
     ]
+    bars = {
+        "repeated": ax.barh(2, 0, width, color="pink", label="Repeated")[0],
+        "adaptive": ax.barh(2, 0, width, color="orange", label="Adaptive")[0],
+        "correct": ax.barh(1, 0, width, color="green", label="Correct")[0],
+        "error": ax.barh(1, 0, width, color="red", label="Error")[0],
+        "water": ax.barh(0, 0, width, color="blue")[0],
+    }
+    texts = {
+        "duration": ax.text(0, 3, "", **TEXT_STYLE),
+        "repeated": ax.text(0, 2, "", **TEXT_STYLE),
+        "adaptive": ax.text(0, 2, "", **TEXT_STYLE),
+        "types_total": ax.text(0, 2, "", alpha=0.5, **TEXT_STYLE),
+        "correct": ax.text(0, 1, "", **TEXT_STYLE),
+        "error": ax.text(0, 1, "", **TEXT_STYLE),
+        "outcome_total": ax.text(0, 1, "", alpha=0.5, **TEXT_STYLE),
+        "water": ax.text(0, 0, "", **{**TEXT_STYLE, "color": "blue"}),
+    }
+    ax.set_yticks(range(len(xlabels)))
+    ax.set_yticklabels(xlabels, minor=False)
+    ax.set_ylim([-0.5, 3.5])
+    ax.legend()
+    return ax, bars, texts
+
+
+def _update_stacked_bars(bars, texts, names, values, total_name):
+    left = 0
+    for name, value in zip(names, values):
+        bars[name].set_x(left)
+        bars[name].set_width(value)
+        texts[name].set_x(left + (value * 0.15))
+        texts[name].set_text(str(value))
+        left += value
+    texts[total_name].set_x(left + (values[-1] * 0.15))
+    texts[total_name].set_text(str(left))
+
+
+def plot_bars(bar_data, artists):
+    ax, bars, texts = artists
     y = [
         bar_data["trial_num"],
         bar_data["ntrials_correct"],
         bar_data["water_delivered"],
         0,
     ]
-    x = range(len(xlabels))  # the x locations for the groups
-
-    ax.barh(3, 0, width, color="black")
-    # ax.barh(0, bar_data['trial_num'], width, color="gray")
-
-    ax.text(
-        max(y) / 10,
-        3,
-        str(bar_data["time_from_start"]),
-        color="black",
-        fontweight="bold",
-        size="x-large",
-    )
-
-    ax.barh(2, bar_data["ntrials_repeated"], width, color="pink", label="Repeated")
-    ax.barh(
-        2,
-        bar_data["ntrials_adaptive"],
-        width,
-        left=bar_data["ntrials_repeated"],
-        color="orange",
-        label="Adaptive",
+    texts["duration"].set_x(max(y) / 10)
+    texts["duration"].set_text(str(bar_data["time_from_start"]))
+    _update_stacked_bars(
+        bars, texts, ["repeated", "adaptive"],
+        [bar_data["ntrials_repeated"], bar_data["ntrials_adaptive"]], "types_total",
     )
-    make_bar_texts(ax, 2, [bar_data["ntrials_repeated"], bar_data["ntrials_adaptive"]])
-
-    ax.barh(1, bar_data["ntrials_correct"], width, color="green", label="Correct")
-    ax.barh(
-        1,
-        bar_data["ntrials_err"],
-        width,
-        left=bar_data["ntrials_correct"],
-        color="red",
-        label="Error",
+    _update_stacked_bars(
+        bars, texts, ["correct", "error"], [bar_data["ntrials_correct"], bar_data["ntrials_err"]], "outcome_total",
     )
-    make_bar_texts(ax, 1, [bar_data["ntrials_correct"], bar_data["ntrials_err"]])
-
-    ax.barh(0, bar_data["water_delivered"], width, color="blue")
-    ax.text(
-        bar_data["water_delivered"] + 1,
-        0,
-        str(bar_data["water_delivered"]),
-        color="blue",
-        fontweight="bold",
-        size="x-large",
-    )
-
-    ax.set_yticks([i for i in x])
-    ax.set_yticklabels(xlabels, minor=False)
-    ax.set_xlim([0, max(y) + (max(y) * 0.2)])
-    ax.legend()
-    ax.figure.canvas.draw_idle()
-
-
-def plot_psych(psych_data, ax=None):
+    bars["water"].set_width(bar_data["water_delivered"])
+    texts["water"].set_x(bar_data["water_delivered"] + 1)
+    texts["water"].set_text(str(bar_data["water_delivered"]))
+    ax.set_xlim([0, (max(y) + (max(y) * 0.2)) or 1])
 
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-    ax.cla()
-
-    x = psych_data[0]
-    y = psych_data[1]
-    y = [0 if np.isnan(i) else i for i in y]
-
-    ax.plot(x, y, c="k", label="CCW responses", marker="o", ls="-")
 
+def init_psych(ax):
+    (line,) = ax.plot([], [], c="k", label="CCW responses", marker="o", ls="-")
     ax.axhline(0.5, color="gray", ls="--", alpha=0.5)
     ax.axvline(0.0, color="gray", ls="--", alpha=0.5)
     ax.set_ylim([-0.1, 1.1])
     ax.legend(loc="best")
     ax.grid()
-    ax.figure.canvas.draw_idle()
-    return
-
+    return ax, line
 
-def plot_chron(chron_data, ax=None):
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-    ax.cla()
 
-    x = chron_data[0]
-    y = chron_data[1]
+def plot_psych(psych_data, artists):
+    ax, line = artists
+    x = psych_data[0]
+    y = psych_data[1]
     y = [0 if np.isnan(i) else i for i in y]
+    line.set_data(x, y)
+    ax.relim()
+    ax.autoscale_view(scaley=False)
 
-    ax.plot(x, y, c="k", label="Median time to respond", marker="o", ls="-")
 
+def init_chron(ax):
+    (line,) = ax.plot([], [], c="k", label="Median time to respond", marker="o", ls="-")
     ax.axhline(0.5, color="gray", ls="--", alpha=0.5)
     ax.axvline(0.0, color="gray", ls="--", alpha=0.5)
     ax.legend(loc="best")
     ax.grid()
-    ax.figure.canvas.draw_idle()
-    return
+    return ax, line
 
 
-def plot_vars(vars_data, ax=None, ax2=None):
-    if ax is None:
-        # f = plt.figure()  # figsize=(19.2, 10.8), dpi=100)
-        ax = plt.subplot2grid((1, 1), (0, 0), rowspan=1, colspan=1)
-        ax2 = ax.twinx()
-    if ax2 is None:
-        ax2 = ax.twinx()
+def plot_chron(chron_data, artists):
+    ax, line = artists
+    x = chron_data[0]
+    y = chron_data[1]
+    y = [0 if np.isnan(i) else i for i in y]
+    line.set_data(x, y)
+    ax.relim()
+    ax.autoscale_view()
 
-    ax.cla()
-    ax2.cla()
 
+def init_vars(ax, ax2):
     # ax.figure.tight_layout()  # or right y-label is slightly clipped
     width = 0.75
-
     x = [0, 1, 2, 3, 4]
-    median_rt = vars_data["median_rt"] / 10
-    prop_correct = vars_data["prop_correct"]
-    temp = vars_data["Temperature_C"]
-    rel_hum = vars_data["RelativeHumidity"] / 100
-
-    ax.bar(x[0], median_rt, width, color="cyan", label="Median RT (10^1ms)")
-    ax.bar(x[1], temp, width, color="magenta", label="Temperature (ºC)")
-
-    ax2.bar(x[3], rel_hum, width, color="yellow", label="Relative humidity")
-    ax2.bar(x[4], prop_correct, width, color="black", label="Proportion correct")
+    bars = {
+        "median_rt": ax.bar(x[0], 0, width, color="cyan", label="Median RT (10^1ms)")[0],
+        "temp": ax.bar(x[1], 0, width, color="magenta", label="Temperature (ºC)")[0],
+        "rel_hum": ax2.bar(x[3], 0, width, color="yellow", label="Relative humidity")[0],
+        "prop_correct": ax2.bar(x[4], 0, width, color="black", label="Proportion correct")[0],
+    }
     ax2.set_ylim([0, 1.1])
     ax.legend(loc="lower left")
     ax2.legend(loc="lower right")
-    ax.figure.canvas.draw_idle()
-    ax2.figure.canvas.draw_idle()
+    return ax, bars
+
+
+def plot_vars(vars_data, artists):
+    ax, bars = artists
+    bars["median_rt"].set_height(vars_data["median_rt"] / 10)
+    bars["temp"].set_height(vars_data["Temperature_C"])
+    bars["rel_hum"].set_height(vars_data["RelativeHumidity"] / 100)
+    bars["prop_correct"].set_height(vars_data["prop_correct"])
+    ax.relim()
+    ax.autoscale_view()
 
 
 if __name__ == "__main__":
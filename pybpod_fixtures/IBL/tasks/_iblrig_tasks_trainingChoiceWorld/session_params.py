@@ -8,8 +8,6 @@ import os
 from pathlib import Path
 from sys import platform
 
-from pythonosc import udp_client
-
 import iblrig.adaptive as adaptive
 import iblrig.ambient_sensor as ambient_sensor
 import iblrig.bonsai as bonsai
@@ -18,6 +16,7 @@ import iblrig.iotasks as iotasks
 import iblrig.misc as misc
 import iblrig.sound as sound
 import iblrig.user_input as user
+from iblrig.osc_client import BonsaiOscClient
 from iblrig.path_helper import SessionPathCreator
 from iblrig.rotary_encoder import MyRotaryEncoder
 
@@ -50,7 +49,7 @@ class SessionParamHandler(object):
         else:
             make = ["video"]  # besides behavior which folders to create
 
-        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make)
+        spc = SessionPathCreator(self.PYBPOD_SUBJECTS[0], protocol=self.PYBPOD_PROTOCOL, make=make, previous_session=False)
         self.__dict__.update(spc.__dict__)
 
         # =====================================================================
@@ -58,41 +57,13 @@ class SessionParamHandler(object):
         # =====================================================================
         self.OSC_CLIENT_PORT = 7110
         self.OSC_CLIENT_IP = "127.0.0.1"
-        self.OSC_CLIENT = udp_client.SimpleUDPClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT)
-        # =====================================================================
-        # PREVIOUS DATA FILES
-        # =====================================================================
-        self.LAST_TRIAL_DATA = iotasks.load_data(self.PREVIOUS_SESSION_PATH)
-        self.LAST_SETTINGS_DATA = iotasks.load_settings(self.PREVIOUS_SESSION_PATH)
-        # =====================================================================
-        # ADAPTIVE STUFF
-        # =====================================================================
-        self.AR_MIN_VALUE = 1.5 if "Sucrose" in self.REWARD_TYPE else 2.0
-        self.REWARD_AMOUNT = adaptive.init_reward_amount(self)
-        self.CALIB_FUNC = None
-        if self.AUTOMATIC_CALIBRATION:
-            self.CALIB_FUNC = adaptive.init_calib_func()
-        self.CALIB_FUNC_RANGE = adaptive.init_calib_func_range()
-        self.REWARD_VALVE_TIME = adaptive.init_reward_valve_time(self)
-        self.STIM_GAIN = adaptive.init_stim_gain(self)
-        self.IMPULSIVE_CONTROL = "OFF"
-        self = adaptive.impulsive_control(self)
+        self.OSC_ACK_PORT = None  # port where Bonsai acknowledges the trial info, None for no acknowledgement
+        self.OSC_CLIENT = BonsaiOscClient(self.OSC_CLIENT_IP, self.OSC_CLIENT_PORT, ack_port=self.OSC_ACK_PORT)
         # =====================================================================
         # frame2TTL
         # =====================================================================
         self.F2TTL_GET_AND_SET_THRESHOLDS = frame2TTL.get_and_set_thresholds()
         # =====================================================================
-        # ROTARY ENCODER
-        # =====================================================================
-        self.ALL_THRESHOLDS = self.STIM_POSITIONS + self.QUIESCENCE_THRESHOLDS
-        self.ROTARY_ENCODER = MyRotaryEncoder(
-            self.ALL_THRESHOLDS, self.STIM_GAIN, self.PARAMS["COM_ROTARY_ENCODER"]
-        )
-        # =====================================================================
-        # RUN VISUAL STIM
-        # =====================================================================
-        bonsai.start_visual_stim(self)
-        # =====================================================================
         # SOUNDS
         # =====================================================================
         self.SOFT_SOUND = None if "ephys" in self.PYBPOD_BOARD else self.SOFT_SOUND
@@ -131,6 +102,36 @@ class SessionParamHandler(object):
         self.SUBJECT_DISENGAGED_TRIALNUM = None
         self.SUBJECT_PROJECT = None  # user.ask_project(self.PYBPOD_SUBJECTS[0])
         # =====================================================================
+        # PREVIOUS DATA FILES
+        # =====================================================================
+        # waits for the lookup started by the SessionPathCreator, which ran while the devices were set up
+        self.LAST_TRIAL_DATA, self.LAST_SETTINGS_DATA = iotasks.load_previous_session(self)
+        # =====================================================================
+        # ADAPTIVE STUFF
+        # =====================================================================
+        self.AR_MIN_VALUE = 1.5 if "Sucrose" in self.REWARD_TYPE else 2.0
+        self.REWARD_AMOUNT = adaptive.init_reward_amount(self)
+        self.CALIB_FUNC = None
+        if self.AUTOMATIC_CALIBRATION:
+            self.CALIB_FUNC = adaptive.init_calib_func()
+        self.CALIB_FUNC_RANGE = adaptive.init_calib_func_range()
+        self.REWARD_VALVE_TIME = adaptive.init_reward_valve_time(self)
+        self.STIM_GAIN = adaptive.init_stim_gain(self)
+        self.IMPULSIVE_CONTROL = "OFF"
+        self = adaptive.impulsive_control(self)
+        # =====================================================================
+        # ROTARY ENCODER
+        # =====================================================================
+        # configured before Bonsai opens its port, with the gain of the previous session
+        self.ALL_THRESHOLDS = self.STIM_POSITIONS + self.QUIESCENCE_THRESHOLDS
+        self.ROTARY_ENCODER = MyRotaryEncoder(
+            self.ALL_THRESHOLDS, self.STIM_GAIN, self.PARAMS["COM_ROTARY_ENCODER"]
+        )
+        # =====================================================================
+        # RUN VISUAL STIM
+        # =====================================================================
+        bonsai.start_visual_stim(self)
+        # =====================================================================
         # SAVE SETTINGS FILE AND TASK CODE
         # =====================================================================
         if not self.DEBUG:
@@ -78,3 +78,7 @@ AG_MIN_VALUE = 4.0  # (azimuth_degree/mm)
 RESPONSE_BUFFER_LENGTH = 10
 # POOP COUNT LOGGING
 POOP_COUNT = True  # Whether to ask for a poop count at the end of the session
+# TRIAL DATA FILE
+DATA_FSYNC_TRIALS = 10  # Sync the trial data to the disk every n trials
+DATA_FSYNC_SECS = 60  # or at most every n seconds
+DATA_FILE_DELTA = False  # Write the changes from the previous trial, see scripts/convert_task_data.py
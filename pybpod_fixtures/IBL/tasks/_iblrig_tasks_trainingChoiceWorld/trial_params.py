@@ -3,21 +3,20 @@
 # @Author: Niccolò Bonacchi
 # @Date:   2018-02-02 14:06:34
 import datetime
-import json
 import logging
 import math
 import random
 import time
 
 import numpy as np
-import scipy.stats as st
 from dateutil import parser
 
 import iblrig.ambient_sensor as ambient_sensor
 import iblrig.bonsai as bonsai
 import iblrig.misc as misc
+from iblrig.buffers import RingBuffer, RunningMedian
 from iblrig.check_sync_pulses import sync_check
-from iblrig.iotasks import ComplexEncoder
+from iblrig.iotasks import TrialDataWriter
 
 log = logging.getLogger("iblrig")
 
@@ -43,7 +42,7 @@ class AdaptiveContrast(object):
         self.all_contrasts = sph.CONTRAST_SET
         self.init_contrasts = sph.AC_INIT_CONTRASTS
         self.buffer_size = sph.AC_BUFFER_SIZE
-        self.perf_crit = self._min_trials_at(sph.AC_PERF_CRIT, 0.05)
+        self.perf_crit = misc.binomial_criterion(self.buffer_size, sph.AC_PERF_CRIT, 0.05)
         self.ntrials_to_six = sph.AC_NTRIALS_TO_SIX
         self.ntrials_to_zero = sph.AC_NTRIALS_TO_ZERO
         self.ntrials_to_remove_50 = sph.AC_NTRIALS_TO_REMOVE_50
@@ -79,13 +78,19 @@ class AdaptiveContrast(object):
 
         return _contrasts
 
+    def _new_buffer(self):
+        # correct trials of each side and contrast, saved as (2, buffer_size, len(all_contrasts))
+        return RingBuffer(self.buffer_size, shape=(2, len(self.all_contrasts)), axis=1)
+
     def _init_buffer(self):
         if self.previous_session is None or not self.last_trial_data:
-            _buffer = np.zeros((2, self.buffer_size, len(self.all_contrasts))).tolist()
+            _buffer = self._new_buffer()
         else:
             _buffer = self.last_trial_data["ac"]["buffer"]
             if len(_buffer) > 2:
-                _buffer = np.zeros((2, self.buffer_size, len(self.all_contrasts))).tolist()
+                _buffer = self._new_buffer()
+            else:
+                _buffer = RingBuffer.from_list(_buffer, axis=1)
         return _buffer
 
     def _init_contrast(self):
@@ -93,17 +98,12 @@ class AdaptiveContrast(object):
         return _contrast
 
     def _reset_buffer(self):
-        self.buffer = np.zeros((2, self.buffer_size, len(self.all_contrasts))).tolist()
+        self.buffer = self._new_buffer()
 
     def _update_buffer(self, prev_position):
-        _buffer = np.asarray(self.buffer)
         side_idx = 0 if prev_position < 0 else 1
         contrast_idx = self.contrast_set.index(self.value)
-        col = _buffer[side_idx, :, contrast_idx]
-        col = np.roll(col, -1)
-        col[-1] = int(self.trial_correct)
-        _buffer[side_idx, :, contrast_idx] = col
-        self.buffer = _buffer.tolist()
+        self.buffer.append(int(self.trial_correct), index=(side_idx, contrast_idx))
 
     def _update_contrast(self):
         if (self.use_me) and (0 in self.contrast_set):
@@ -122,8 +122,8 @@ class AdaptiveContrast(object):
         # Update counter of how mant trials were performend with 0.125 contrast
         if 0.125 in self.contrast_set:
             self.ntrials_125 += 1
-        # Sum correct left AND right trials for all contrasts
-        _ntrials = np.sum(self.buffer, axis=1)
+        # Correct left AND right trials for all contrasts, counted as the buffer is updated
+        _ntrials = self.buffer.sum()
         # Define crit for next contrast insert
         pass_crit = _ntrials > self.perf_crit
         # Check if both left AND right have passed criterion
@@ -147,9 +147,6 @@ class AdaptiveContrast(object):
         self.contrast_set = sorted(self.contrast_set)
         self.contrast_set.reverse()
 
-    def _min_trials_at(self, prob, alpha):
-        return int(sum(1 - st.binom.cdf(range(self.buffer_size), self.buffer_size, prob) >= alpha))
-
     def trial_completed(self, trial_correct):
         self.ntrials += 1
         self.trial_correct = trial_correct
@@ -216,7 +213,12 @@ class TrialParamHandler(object):
         self.init_datetime = parser.parse(sph.PYBPOD_SESSION)
         self.task_protocol = sph.PYBPOD_PROTOCOL
         self.data_file_path = sph.DATA_FILE_PATH
-        self.data_file = open(self.data_file_path, "a")
+        self.data_file = TrialDataWriter(
+            self.data_file_path,
+            fsync_trials=sph.DATA_FSYNC_TRIALS,
+            fsync_secs=sph.DATA_FSYNC_SECS,
+            delta=sph.DATA_FILE_DELTA,
+        )
         self.position_set = sph.STIM_POSITIONS
         self.repeat_on_error = sph.REPEAT_ON_ERROR
         self.repeat_contrasts = sph.REPEAT_CONTRASTS
@@ -270,7 +272,8 @@ class TrialParamHandler(object):
         self.behavior_data = []
         self.response_time = None
         self.response_time_buffer = []
-        self.response_buffer = [0] * sph.RESPONSE_BUFFER_LENGTH
+        self.response_time_median = RunningMedian(window=20)
+        self.response_buffer = RingBuffer(sph.RESPONSE_BUFFER_LENGTH, dtype=int)
         self.response_side_buffer = []
         self.trial_correct = None
         self.ntrials_correct = 0
@@ -293,15 +296,16 @@ class TrialParamHandler(object):
         # Add trial's response time to the buffer
         self.response_time = misc.get_trial_rt(self.behavior_data)
         self.response_time_buffer.append(self.response_time)
+        self.response_time_median.append(self.response_time)
         # Update response buffer -1 for left, 0 for nogo, and 1 for rightward
         if (correct and self.position < 0) or (error and self.position > 0):
-            self.response_buffer = misc.update_buffer(self.response_buffer, 1)
+            self.response_buffer.append(1)
             self.response_side_buffer.append(1)
         elif (correct and self.position > 0) or (error and self.position < 0):
-            self.response_buffer = misc.update_buffer(self.response_buffer, -1)
+            self.response_buffer.append(-1)
             self.response_side_buffer.append(-1)
         elif no_go:
-            self.response_buffer = misc.update_buffer(self.response_buffer, 0)
+            self.response_buffer.append(0)
             self.response_side_buffer.append(0)
         # Update the trial_correct variable
         self.trial_correct = bool(correct)
@@ -332,10 +336,7 @@ class TrialParamHandler(object):
         params["response_side_buffer"] = ""
         # params['trial_correct_buffer'] = ''
 
-        out = json.dumps(params, cls=ComplexEncoder)
-        self.data_file.write(out)
-        self.data_file.write("\n")
-        self.data_file.close()
+        self.data_file.write(params)
         # If more than 42 trials save transfer_me.flag
         if self.trial_num == 42:
             misc.create_flags(self.data_file_path, self.poop_count)
@@ -344,7 +345,7 @@ class TrialParamHandler(object):
 
     def check_stop_criterions(self):
         return misc.check_stop_criterions(
-            self.init_datetime, self.response_time_buffer, self.trial_num
+            self.init_datetime, self.response_time_median, self.trial_num
         )
 
     def check_sync_pulses(self):
@@ -393,7 +394,6 @@ RELATIVE HUMIDITY:    {self.as_data['RelativeHumidity']} %
             # Send next trial info to Bonsai
             bonsai.send_current_trial_info(self)
             return
-        self.data_file = str(self.data_file)
         # update + next contrast: update buffers/counters + get next contrast
         # This has to happen before self.contrast is pointing to next trials
         self.contrast.next_trial(self.position)  # still prev_position
@@ -416,8 +416,6 @@ RELATIVE HUMIDITY:    {self.as_data['RelativeHumidity']} %
         self.event_reward = self.threshold_events_dict[-self.position]
         # Reset outcome variables for next trial
         self.trial_correct = None
-        # Open the data file to append the next trial
-        self.data_file = open(self.data_file_path, "a")
         # Send next trial info to Bonsai
         bonsai.send_current_trial_info(self)
 
@@ -978,7 +976,7 @@ if __name__ == "__main__":
     next_trial_times = []
     trial_completed_times = []
 
-    f, axes = op.make_fig(sph)
+    f, axes = op.make_fig(op.fig_title(sph))
     plt.pause(1)
 
     for x in range(100):
@@ -991,7 +989,8 @@ if __name__ == "__main__":
             np.random.choice([correct_trial, error_trial, no_go_trial], p=[0.8, 0.1, 0.1])
         )
         # tph = tph.trial_completed(correct_trial)
-        op.update_fig(f, axes, tph)
+        op.update_fig(f, axes, op.get_summary(tph))
+        plt.pause(0.001)
 
         tph.show_trial_log()
         trial_completed_times.append(time.time() - t)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Benchmark of the encoding of trial records, iotasks.to_json against the stdlib encoder
+
+The trials are read from the task data file of a session, or are synthetic trials shaped as the
+ones of trainingChoiceWorld: the parameters of the handler, the growing buffers, the adaptive
+contrast buffer and the state machine data with NaN for the states that were not visited.
+Prints the encoding time per trial of both encoders and checks that their outputs decode to the
+same trials.
+
+Usage: python benchmark_json_encoding.py [session_path]
+"""
+import json
+import sys
+import time
+
+import numpy as np
+
+import iblrig.iotasks as iotasks
+import iblrig.raw_data_loaders as raw
+
+STATES = [
+    "trial_start", "reset_rotary_encoder", "quiescent_period", "stim_on", "interactive_delay",
+    "play_tone", "reset2_rotary_encoder", "closed_loop", "no_go", "freeze_error", "error",
+    "freeze_reward", "reward", "correct", "exit_state",
+]
+EVENTS = ["Tup", "BNC1High", "BNC1Low", "BNC2High", "BNC2Low", "Port1In", "Port1Out",
+          "RotaryEncoder1_2", "RotaryEncoder1_3", "RotaryEncoder1_4"]
+
+
+def synthetic_trials(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    buffers = {k: [] for k in ["position_buffer", "contrast_buffer", "stim_probability_left_buffer"]}
+    trials = []
+    for i in range(n):
+        buffers["position_buffer"].append(int(rng.choice([-35, 35])))
+        buffers["contrast_buffer"].append(float(rng.choice([1.0, 0.5, 0.25, 0.125, 0.0625, 0.0])))
+        buffers["stim_probability_left_buffer"].append(0.5)
+        start = i * 8.0
+        trial = {f"param_{k}": float(rng.uniform()) for k in range(60)}
+        trial.update({k: list(v) for k, v in buffers.items()})
+        trial.update({
+            "trial_num": i + 1,
+            "position": buffers["position_buffer"][-1],
+            "trial_correct": bool(rng.uniform() > 0.2),
+            "elapsed_time": "0:12:34.567890",
+            "contrast": {"buffer": rng.integers(0, 2, (2, 50, 6)).tolist(), "value": 1.0, "ntrials_125": 100},
+            "behavior_data": {
+                "Bpod start timestamp": 0.0,
+                "Trial start timestamp": start,
+                "Trial end timestamp": start + 5.0,
+                "States timestamps": {
+                    s: [[float(x) for x in np.sort(rng.uniform(0, 5, 2))]] if rng.uniform() > 0.3 else [[np.nan, np.nan]]
+                    for s in STATES
+                },
+                "Events timestamps": {e: np.sort(rng.uniform(0, 5, rng.integers(1, 6))).tolist() for e in EVENTS},
+            },
+        })
+        trials.append(trial)
+    return trials
+
+
+def stdlib_to_json(obj):
+    return json.dumps(obj, cls=iotasks.ComplexEncoder, separators=(",", ":"))
+
+
+def time_encoder(encode, trials, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        tstart = time.perf_counter()
+        out = [encode(t) for t in trials]
+        best = min(best, time.perf_counter() - tstart)
+    return best, out
+
+
+if __name__ == "__main__":
+    trials = raw.load_data(sys.argv[1], time="raw") if len(sys.argv) > 1 else synthetic_trials()
+    print(f"{len(trials)} trials, orjson {'installed' if iotasks.orjson else 'not installed'}")
+    t_std, out_std = time_encoder(stdlib_to_json, trials)
+    t_fast, out_fast = time_encoder(iotasks.to_json, trials)
+    # NaN != NaN, the decoded trials are compared once encoded by the same encoder
+    same = all(stdlib_to_json(json.loads(a)) == stdlib_to_json(json.loads(b)) for a, b in zip(out_std, out_fast))
+    identical = sum(a == b for a, b in zip(out_std, out_fast))
+    print(f"stdlib : {t_std / len(trials) * 1e6:8.1f} us per trial")
+    print(f"to_json: {t_fast / len(trials) * 1e6:8.1f} us per trial, {t_std / t_fast:.1f}x")
+    print(f"same decoded trials: {same}, byte identical: {identical}/{len(trials)}")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Benchmark of raw_data_loaders.sync_trials_robust on synthetic pulse trains
+
+Both series are drawn from the same irregular pulse train, the second one with a clock
+offset and drift, jitter, and pulses missing from either side.
+Prints the run time, the fraction of pulses matched and the fitted clock model.
+NB: the matching stops when it loses track of the series, which gets more likely with the
+length of the trains, the drift and the number of missing pulses.
+
+Usage: python benchmark_sync_trials_robust.py [n_pulses ...]
+"""
+import sys
+import time
+
+import numpy as np
+
+import iblrig.raw_data_loaders as raw
+
+
+def drifting_pulse_trains(n, offset=12.3, drift_ppm=5, jitter=2e-6, p_missing=0.02, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.cumsum(rng.uniform(0.05, 1.5, n))
+    t0 = t[rng.uniform(size=n) > p_missing]
+    t1 = t * (1 + drift_ppm * 1e-6) + offset
+    t1 = t1[rng.uniform(size=n) > p_missing]
+    return t0, t1 + rng.normal(0, jitter, t1.size)
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+    for n in sizes:
+        t0, t1 = drifting_pulse_trains(n)
+        tstart = time.perf_counter()
+        s0, s1, model = raw.sync_trials_robust(t0, t1, return_model=True)
+        elapsed = time.perf_counter() - tstart
+        print(
+            f"{n:>9} pulses: {elapsed:8.3f} s, {s0.size / min(t0.size, t1.size):6.1%} matched, "
+            f"offset {model['offset']:.6f} s, drift {model['drift_ppm']:.2f} ppm, "
+            f"residuals std {np.std(model['residuals']) * 1e6:.1f} us"
+        )
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+Convert the task data files of sessions to delta encoded trials, or back to full trials
+
+Usage:
+    python convert_task_data.py <session_path or data file> [<session_path or data file> ...]
+    python convert_task_data.py --full <session_path or data file>
+"""
+import argparse
+import logging
+from pathlib import Path
+
+import iblrig.raw_data_loaders as raw
+
+log = logging.getLogger("iblrig")
+
+
+def main(paths: list, delta: bool = True) -> None:
+    for path in map(Path, paths):
+        file_path = path if path.is_file() else raw._get_task_data_file(path)
+        if not file_path:
+            continue
+        size = file_path.stat().st_size
+        raw.convert_task_data_file(file_path, delta=delta)
+        log.info(f"{file_path}: {size / 2 ** 20:.1f} MB -> {file_path.stat().st_size / 2 ** 20:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert task data files to delta encoded or full trials")
+    parser.add_argument("paths", nargs="+", help="Session paths or _iblrig_taskData.raw.jsonable files")
+    parser.add_argument("--full", action="store_true", help="Write full trials, ex: before extraction by ibllib")
+    args = parser.parse_args()
+    main(args.paths, delta=not args.full)
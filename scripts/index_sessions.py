@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+Add the sessions of the rig computer and of the lab server to the session catalog
+
+Sessions already catalogued and unchanged are skipped, so this can be run again at any time.
+Without arguments, indexes the local and remote Subjects folders of the iblrig parameters.
+
+Usage:
+    python index_sessions.py
+    python index_sessions.py --local <local Subjects folder> --remote <remote Subjects folder>
+"""
+import argparse
+import logging
+
+import iblrig.path_helper as ph
+import iblrig.session_catalog as session_catalog
+
+log = logging.getLogger("iblrig")
+
+
+def main(local_folder: str = None, remote_folder: str = None) -> int:
+    local_folder = local_folder or ph.get_iblrig_local_data_path(subjects=True)
+    remote_folder = remote_folder or ph.get_iblrig_remote_server_data_path(subjects=True)
+    n = session_catalog.index_subjects_folder(local_folder, location="local")
+    if remote_folder is not None:
+        n += session_catalog.index_subjects_folder(remote_folder, location="remote")
+    log.info(f"{n} sessions added to {session_catalog.get_catalog_file()}")
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the existing sessions to the session catalog")
+    parser.add_argument("--local", default=None, help="Local iblrig_data/Subjects folder")
+    parser.add_argument("--remote", default=None, help="Remote iblrig_data/Subjects folder")
+    args = parser.parse_args()
+    main(args.local, args.remote)
@@ -4,22 +4,31 @@
 # @Editor: Michele Fabbri
 # @Edit_Date: 2022-02-01
 import argparse
+import functools
 import logging
 import os
 import shutil
 from pathlib import Path
-from shutil import ignore_patterns as ig
 
+import iblrig.compression as compression
+import iblrig.params as pybpod_params
 import iblrig.raw_data_loaders as raw
+import iblrig.session_catalog as session_catalog
+import iblrig.transfer as transfer
 
 log = logging.getLogger("iblrig")
 
 
-def main(local_folder: str, remote_folder: str, force: bool = False) -> None:
+def main(local_folder: str, remote_folder: str, force: bool = False, max_mb_per_sec: float = None,
+         pause_while_acquiring: bool = False, verify_read_back: bool = False) -> None:
     local_folder = Path(local_folder)
     remote_folder = Path(remote_folder)
 
     src_session_paths = [x.parent for x in local_folder.rglob("transfer_me.flag")]
+    # sessions still to be compressed wait for the next transfer
+    for s in [s for s in src_session_paths if s.joinpath(compression.FLAG_FILE_NAME).exists()]:
+        log.info(f"Session {s} is not compressed yet, not transferring it")
+        src_session_paths.remove(s)
 
     if not src_session_paths:
         log.info("Nothing to transfer, exiting...")
@@ -34,15 +43,23 @@ def main(local_folder: str, remote_folder: str, force: bool = False) -> None:
         d = remote_folder / mouse / date / sess
         dst_session_paths.append(d)
 
+    if force:
+        for dst in dst_session_paths:
+            shutil.rmtree(dst, ignore_errors=True)
+    log.info(f"Copying {len(src_session_paths)} sessions to {remote_folder} ...")
+    results = transfer.transfer_sessions(
+        zip(src_session_paths, dst_session_paths),
+        ignore=["transfer_me.flag", raw.CACHE_FOLDER, f"*{compression.TMP_SUFFIX}.*"],
+        max_bytes_per_sec=max_mb_per_sec * 2 ** 20 if max_mb_per_sec else None,
+        pause_if=functools.partial(transfer.is_acquiring, local_folder) if pause_while_acquiring else None,
+    )
+
     for src, dst in zip(src_session_paths, dst_session_paths):
         src_flag_file = src / "transfer_me.flag"
-        if force:
-            shutil.rmtree(dst, ignore_errors=True)
-        log.info(f"Copying subdirectories from {src} to {dst} ...")
-        try:
-            shutil.copytree(src, dst, ignore=ig(str(src_flag_file.name)))
-        except OSError:
-            log.info("An OS error occurred when attempting ot copy the subdirectories.")
+        copied = results[src]
+        if isinstance(copied, Exception):
+            log.info(f"An error occurred when attempting to copy {src}, it will be resumed next time: {copied}")
+            continue
         # if folder was created, delete the src flag_file and create compress_me.flag
         if dst.exists():
             settings = raw.load_settings(dst)
@@ -53,6 +70,7 @@ def main(local_folder: str, remote_folder: str, force: bool = False) -> None:
                 log.info("Removing raw_session.flag file; ephys behavior rig detected")
                 dst.joinpath("raw_session.flag").unlink()
             log.info(f"Copied to {remote_folder}: Session {src_flag_file.parent}")
+            session_catalog.update_session(dst, location="remote")
             try:
                 src_flag_file.unlink()
             except FileNotFoundError:
@@ -61,34 +79,24 @@ def main(local_folder: str, remote_folder: str, force: bool = False) -> None:
                     + str(src_flag_file)
                 )
 
-        # Cleanup
-        src_video_file = src / "raw_video_data" / "_iblrig_leftCamera.raw.avi"
-        dst_video_file = dst / "raw_video_data" / "_iblrig_leftCamera.raw.avi"
-        src_audio_file = src / "raw_behavior_data" / "_iblrig_micData.raw.wav"
-        dst_audio_file = dst / "raw_behavior_data" / "_iblrig_micData.raw.wav"
-
-        if (
-            src_audio_file.exists()
-            and src_audio_file.stat().st_size == dst_audio_file.stat().st_size
-        ):
-            try:
-                src_audio_file.unlink()
-            except FileNotFoundError:
-                log.info(
-                    "When attempting to delete the following file, it could not be found: "
-                    + str(src_audio_file)
-                )
-
-        if (
-            src_video_file.exists()
-            and src_video_file.stat().st_size == dst_video_file.stat().st_size
-        ):
+        # Cleanup, only files whose copy matches the checksum file of the destination session
+        for rel_path in [
+            "raw_video_data/_iblrig_leftCamera.raw.avi",
+            "raw_video_data/_iblrig_leftCamera.raw.mp4",
+            "raw_behavior_data/_iblrig_micData.raw.wav",
+            "raw_behavior_data/_iblrig_micData.raw.flac",
+        ]:
+            if not src.joinpath(rel_path).exists():
+                continue
+            if not transfer.verify_copy(src, dst, rel_path, read_back=verify_read_back):
+                log.warning(f"Not removing {src.joinpath(rel_path)}, its copy could not be verified")
+                continue
             try:
-                src_video_file.unlink()
+                src.joinpath(rel_path).unlink()
             except FileNotFoundError:
                 log.info(
                     "When attempting to delete the following file, it could not be found: "
-                    + str(src_video_file)
+                    + str(src.joinpath(rel_path))
                 )
 
 
@@ -99,4 +107,15 @@ if __name__ == "__main__":
     args = parser.parse_args()
     scripts_path = Path(__file__).absolute().parent
     os.system(f"python {scripts_path / 'move_passive.py'}")
-    main(args.local_folder, args.remote_folder)
+    compression.compress_sessions(args.local_folder)
+    # sessions of the rig computer that are not in the session catalog yet, ex: run before it existed
+    session_catalog.index_subjects_folder(args.local_folder, location="local")
+    # bandwidth limit, pause while acquiring and read back are set in the .iblrig_params.json file
+    params = pybpod_params.load_params_file()
+    main(
+        args.local_folder,
+        args.remote_folder,
+        max_mb_per_sec=params.get("TRANSFER_MAX_MB_PER_SEC"),
+        pause_while_acquiring=bool(params.get("TRANSFER_PAUSE_WHILE_ACQUIRING")),
+        verify_read_back=bool(params.get("TRANSFER_VERIFY_READ_BACK")),
+    )
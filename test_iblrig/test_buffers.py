@@ -0,0 +1,71 @@
+import json
+import unittest
+
+import numpy as np
+
+from iblrig.buffers import RingBuffer, RunningMedian
+from iblrig.iotasks import ComplexEncoder
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_append(self):
+        # same values as rolling a list and replacing its last value
+        expected = [0] * 10
+        buffer = RingBuffer(10, dtype=int)
+        for v in np.random.default_rng(0).integers(-1, 2, 25):
+            expected = np.roll(expected, -1).tolist()
+            expected[-1] = int(v)
+            buffer.append(int(v))
+            self.assertEqual(buffer.tolist(), expected)
+        self.assertEqual(len(buffer), 10)
+        self.assertEqual(buffer.count, 25)
+        self.assertEqual(list(buffer), expected)
+        self.assertEqual(json.dumps(buffer, cls=ComplexEncoder), json.dumps(expected))
+
+    def test_stacked_buffers(self):
+        # adaptive contrast buffer, (side, trial, contrast)
+        expected = np.zeros((2, 5, 3))
+        buffer = RingBuffer(5, shape=(2, 3), axis=1)
+        rng = np.random.default_rng(1)
+        for _ in range(40):
+            side, contrast, correct = rng.integers(0, 2), rng.integers(0, 3), rng.integers(0, 2)
+            col = np.roll(expected[side, :, contrast], -1)
+            col[-1] = correct
+            expected[side, :, contrast] = col
+            buffer.append(int(correct), index=(side, contrast))
+        np.testing.assert_array_equal(buffer.to_numpy(), expected)
+        np.testing.assert_array_equal(buffer.sum(), np.sum(expected, axis=1))
+        # reloaded from the data file of the previous session
+        reloaded = RingBuffer.from_list(buffer.tolist(), axis=1)
+        self.assertEqual(reloaded.tolist(), expected.tolist())
+        reloaded.append(1, index=(0, 0))
+        expected[0, :, 0] = np.r_[expected[0, 1:, 0], 1]
+        self.assertEqual(reloaded.tolist(), expected.tolist())
+
+
+class TestRunningMedian(unittest.TestCase):
+    def test_median(self):
+        rt = RunningMedian(window=20)
+        self.assertTrue(np.isnan(rt.median()))
+        self.assertTrue(np.isnan(rt.median(last=20)))
+        values = np.random.default_rng(2).exponential(2, 101).tolist()
+        for i, v in enumerate(values):
+            rt.append(v)
+            self.assertEqual(rt.median(), np.median(values[: i + 1]))
+            self.assertEqual(rt.median(last=20), np.median(values[max(0, i - 19): i + 1]))
+            self.assertEqual(rt.median(last=5), np.median(values[max(0, i - 4): i + 1]))
+        self.assertEqual(len(rt), 101)
+        self.assertEqual(rt.reprJSON(), {"count": 101, "median": np.median(values)})
+        with self.assertRaises(ValueError):
+            rt.median(last=21)
+
+    def test_nan(self):
+        rt = RunningMedian(window=3)
+        for v in [1.0, np.nan, 2.0, 3.0, 4.0]:
+            rt.append(v)
+        self.assertTrue(np.isnan(rt.median()))
+        self.assertEqual(rt.median(last=3), 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False, verbosity=2)
@@ -0,0 +1,54 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from iblrig import compression
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.subjects_folder = Path(self.tdir.name)
+        self.session_path = self.subjects_folder.joinpath("subject", "2022-01-01", "001")
+        self.session_path.joinpath("raw_video_data").mkdir(parents=True)
+        self.video_file = self.session_path.joinpath("raw_video_data", "_iblrig_leftCamera.raw.avi")
+        self.session_path.joinpath(compression.FLAG_FILE_NAME).touch()
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def _age_session(self):
+        for f in self.session_path.rglob("*"):
+            os.utime(f, (time.time() - 3600,) * 2)
+
+    def test_compress_sessions_without_ffmpeg(self):
+        self.video_file.write_bytes(b"0" * 10)
+        # the session is still being written
+        self.assertEqual(compression.compress_sessions(self.subjects_folder), [])
+        self.assertTrue(self.session_path.joinpath(compression.FLAG_FILE_NAME).exists())
+        self._age_session()
+        with mock.patch("shutil.which", return_value=None):
+            self.assertEqual(compression.compress_sessions(self.subjects_folder), [])
+        self.assertFalse(self.session_path.joinpath(compression.FLAG_FILE_NAME).exists())
+        self.assertTrue(self.video_file.exists())
+
+    @unittest.skipIf(shutil.which("ffmpeg") is None, "ffmpeg not installed")
+    def test_compress_sessions(self):
+        cmd = ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=size=64x48:rate=30", "-frames:v", "30",
+               "-codec:v", "rawvideo", str(self.video_file)]
+        subprocess.run(cmd, check=True)
+        self._age_session()
+        compressed = compression.compress_sessions(self.subjects_folder, max_workers=1)
+        self.assertEqual(compressed, [self.video_file.with_suffix(".mp4")])
+        self.assertFalse(self.video_file.exists())
+        self.assertEqual(compression.count_frames(compressed[0]), 30)
+        self.assertFalse(self.session_path.joinpath(compression.FLAG_FILE_NAME).exists())
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
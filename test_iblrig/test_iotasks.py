@@ -0,0 +1,134 @@
+import datetime
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+import iblrig.iotasks as iotasks
+from iblrig.iotasks import TrialDataWriter, recover_jsonable
+
+
+def _read_jsonable(file_path):
+    with open(file_path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestTrialDataWriter(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.file_path = Path(self.tdir.name).joinpath("raw_behavior_data", "_iblrig_taskData.raw.jsonable")
+        self.file_path.parent.mkdir()
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def test_write(self):
+        with mock.patch("iblrig.iotasks.os.fsync") as fsync:
+            writer = TrialDataWriter(self.file_path, fsync_trials=3, fsync_secs=3600)
+            for i in range(7):
+                line = writer.write({"trial_num": i + 1, "data_file": writer})
+                self.assertEqual(json.loads(line)["trial_num"], i + 1)
+            # records are flushed every trial, synced every 3 trials
+            self.assertEqual(len(self.file_path.read_text().splitlines()), 7)
+            self.assertEqual(fsync.call_count, 2)
+            writer.close()
+            self.assertEqual(fsync.call_count, 3)
+        data = _read_jsonable(self.file_path)
+        self.assertEqual([d["trial_num"] for d in data], list(range(1, 8)))
+        self.assertEqual(data[0]["data_file"], str(self.file_path))
+        # the sessions of one writer append to the same file
+        writer = TrialDataWriter(self.file_path, fsync_secs=0)
+        writer.write({"trial_num": 8})
+        writer.close()
+        self.assertEqual(len(self.file_path.read_text().splitlines()), 8)
+
+    def test_recover_jsonable(self):
+        self.assertEqual(recover_jsonable(self.file_path), 0)
+        # complete last line missing its newline
+        self.file_path.write_text('{"trial_num": 1}\n{"trial_num": 2}')
+        self.assertEqual(recover_jsonable(self.file_path), 0)
+        self.assertEqual(self.file_path.read_text(), '{"trial_num": 1}\n{"trial_num": 2}\n')
+        # truncated last line
+        self.file_path.write_text('{"trial_num": 1}\n{"trial_num": 2}\n{"trial_nu')
+        writer = TrialDataWriter(self.file_path)
+        writer.write({"trial_num": 3})
+        writer.close()
+        self.assertEqual([d["trial_num"] for d in _read_jsonable(self.file_path)], [1, 2, 3])
+        # a single truncated line longer than the search block
+        self.file_path.write_text('{"position_buffer": [' + "35, " * 30000)
+        self.assertEqual(recover_jsonable(self.file_path), 4 * 30000 + 21)
+        self.assertEqual(self.file_path.stat().st_size, 0)
+
+
+class _Contrast(object):
+    def __init__(self):
+        self.buffer = [[[1, 0], [0, 1]], [[1, 1], [0, 0]]]
+        self.value = 0.25
+
+    def reprJSON(self):
+        return self.__dict__
+
+
+class TestToJson(unittest.TestCase):
+    def setUp(self):
+        nan = float("nan")
+        self.trial = {
+            "trial_num": 3,
+            "contrast": _Contrast(),
+            "threshold_events_dict": {-35: "RotaryEncoder1_1", 35: "RotaryEncoder1_2"},
+            "position_buffer": [-35, 35, 35],
+            "response_time_buffer": [0.5, nan, float("inf"), -float("inf")],
+            "stim_phase": np.float64(1.5),
+            "position": np.int64(35),
+            "quiescent_period": np.float32(0.25),
+            "wheel": np.array([[0.0, 1.0], [2.0, np.nan]]),
+            "init_datetime": datetime.datetime(2022, 1, 1, 12, 30, 15, 123456),
+            "trial_correct": None,
+            "subject": "Nicc\u00f2",
+            "behavior_data": {"States timestamps": {"error": [[nan, nan]], "reward": [[1.25, 1.5]]}},
+        }
+        self.expected = (
+            '{"trial_num":3,"contrast":{"buffer":[[[1,0],[0,1]],[[1,1],[0,0]]],"value":0.25},'
+            '"threshold_events_dict":{"-35":"RotaryEncoder1_1","35":"RotaryEncoder1_2"},'
+            '"position_buffer":[-35,35,35],"response_time_buffer":[0.5,NaN,Infinity,-Infinity],'
+            '"stim_phase":1.5,"position":35,"quiescent_period":0.25,"wheel":[[0.0,1.0],[2.0,NaN]],'
+            '"init_datetime":"2022-01-01T12:30:15.123456","trial_correct":null,"subject":"Nicc\\u00f2",'
+            '"behavior_data":{"States timestamps":{"error":[[NaN,NaN]],"reward":[[1.25,1.5]]}}}'
+        )
+
+    def test_to_json(self):
+        out = iotasks.to_json(self.trial)
+        if iotasks.orjson is None:
+            self.assertEqual(out, self.expected)
+        # orjson may format floats differently and writes strings as UTF-8, the decoded values are the same
+        self.assertEqual(json.dumps(json.loads(out)), json.dumps(json.loads(self.expected)))
+        self.assertEqual(iotasks.to_json(self.trial), out)
+        # the values are not modified in place
+        self.assertTrue(np.isnan(self.trial["behavior_data"]["States timestamps"]["error"][0][0]))
+
+    def test_float32_arrays(self):
+        # float32 and float16 arrays are written with the float64 value of their elements, as by the stdlib encoder
+        for dtype in (np.float32, np.float16):
+            obj = {"a": np.array([0.1, 1.5], dtype), "b": np.array([[0.3, np.nan]], dtype), "c": dtype(0.1)}
+            expected = json.dumps(obj, cls=iotasks.ComplexEncoder, separators=(",", ":"))
+            self.assertEqual(iotasks.to_json(obj), expected)
+        self.assertEqual(iotasks.to_json(np.array([0.1], np.float32)), "[0.10000000149011612]")
+        # and so are the numpy scalars of lists, which are not converted to lists of floats
+        obj = {"a": [np.float32(0.1), np.float32(0.2)], "b": [[np.float32(0.1), 1.5]], "c": [np.float64(0.1), np.int64(2)]}
+        self.assertEqual(iotasks.to_json(obj), json.dumps(obj, cls=iotasks.ComplexEncoder, separators=(",", ":")))
+        self.assertEqual(iotasks.to_json([np.float32(0.1)]), "[0.10000000149011612]")
+
+    def test_stdlib_fallback(self):
+        with mock.patch("iblrig.iotasks.orjson", None):
+            self.assertEqual(iotasks.to_json(self.trial), self.expected)
+        # objects orjson does not support are left to the stdlib encoder
+        self.assertEqual(iotasks.to_json({"n": 2 ** 70}), '{"n":%d}' % 2 ** 70)
+        with self.assertRaises(TypeError):
+            iotasks.to_json({"elapsed_time": datetime.timedelta(seconds=1)})
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,91 @@
+import socket
+import threading
+import unittest
+
+import numpy as np
+from pythonosc import osc_bundle, osc_message_builder
+
+from iblrig.osc_client import BonsaiOscClient
+
+
+class TestBonsaiOscClient(unittest.TestCase):
+    def setUp(self):
+        # stands for the Bonsai workflow
+        self.workflow = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.workflow.bind(("127.0.0.1", 0))
+        self.workflow.settimeout(2)
+        self.port = self.workflow.getsockname()[1]
+
+    def tearDown(self):
+        self.workflow.close()
+
+    def _free_port(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def test_send_bundle(self):
+        client = BonsaiOscClient("127.0.0.1", self.port)
+        seqs = [client.send_bundle({"/t": i, "/p": -35, "/c": 0.5}) for i in range(1, 3)]
+        self.assertEqual(seqs, [1, 2])
+        for seq in seqs:
+            bundle = osc_bundle.OscBundle(self.workflow.recv(4096))  # one datagram per trial
+            messages = [(msg.address, msg.params[0]) for msg in bundle]
+            self.assertEqual(messages, [("/q", seq), ("/t", seq), ("/p", -35), ("/c", 0.5)])
+        self.assertIsNone(client.wait_ack(1))
+        # without acknowledgement channel the send times are not kept
+        self.assertEqual(client.sent, {})
+
+    def test_acknowledgement(self):
+        ack_port = self._free_port()
+        client = BonsaiOscClient("127.0.0.1", self.port, ack_port=ack_port)
+
+        def acknowledge():
+            # acknowledges the first bundle only
+            bundle = osc_bundle.OscBundle(self.workflow.recv(4096))
+            msg = osc_message_builder.OscMessageBuilder(address="/ack")
+            msg.add_arg(next(iter(bundle)).params[0])
+            self.workflow.sendto(msg.build().dgram, ("127.0.0.1", ack_port))
+
+        thread = threading.Thread(target=acknowledge)
+        thread.start()
+        seq = client.send_bundle({"/t": 1})
+        latency = client.wait_ack(seq, timeout=2)
+        thread.join()
+        self.assertGreater(latency, 0)
+        # the latency is only kept in the statistics once waited for
+        self.assertEqual(client.latencies, {})
+        self.assertEqual(client.latency_stats(), {"count": 1, "mean": latency, "max": latency, "median": latency})
+        with self.assertLogs("iblrig", level="WARNING"):
+            self.assertIsNone(client.wait_ack(client.send_bundle({"/t": 2}), timeout=0.05))
+        self.assertEqual(client.latency_stats()["count"], 1)
+        # the bundles not acknowledged in time are forgotten
+        self.assertEqual(client.sent, {})
+
+    def test_latency_window(self):
+        ack_port = self._free_port()
+        client = BonsaiOscClient("127.0.0.1", self.port, ack_port=ack_port, latency_window=3)
+
+        def acknowledge():
+            for _ in range(5):
+                bundle = osc_bundle.OscBundle(self.workflow.recv(4096))
+                msg = osc_message_builder.OscMessageBuilder(address="/ack")
+                msg.add_arg(next(iter(bundle)).params[0])
+                self.workflow.sendto(msg.build().dgram, ("127.0.0.1", ack_port))
+
+        thread = threading.Thread(target=acknowledge)
+        thread.start()
+        latencies = [client.wait_ack(client.send_bundle({"/t": i}), timeout=2) for i in range(5)]
+        thread.join()
+        stats = client.latency_stats()
+        self.assertEqual(stats["count"], 5)
+        self.assertAlmostEqual(stats["mean"], np.mean(latencies))
+        self.assertEqual(stats["max"], max(latencies))
+        # the median of the latest latencies only
+        self.assertEqual(stats["median"], np.median(latencies[-3:]))
+        self.assertEqual((client.sent, client.latencies), ({}, {}))
+        self.assertTrue(np.isnan(BonsaiOscClient("127.0.0.1", self.port).latency_stats()["median"]))
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -1,8 +1,13 @@
+import json
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-from iblrig import path_helper
+from iblrig import path_helper, raw_data_loaders, session_catalog
 
 
 class TestPathHelper(unittest.TestCase):
@@ -152,6 +157,128 @@ class TestPathHelper(unittest.TestCase):
         self.assertTrue(isinstance(test_previous_session_folders, list))
         self.assertTrue(not test_previous_session_folders)  # returned list should be empty
 
+    def test_get_previous_session(self):
+        test_subject_name = "_iblrig_test_previous_session_mouse"
+        remote_dir = tempfile.TemporaryDirectory()
+        remote_subjects_folder = Path(remote_dir.name) / "Subjects"
+
+        def create_session(date, number, protocol, ntrials):
+            raw_folder = remote_subjects_folder / test_subject_name / date / number / "raw_behavior_data"
+            raw_folder.mkdir(parents=True)
+            with open(raw_folder / "_iblrig_taskSettings.raw.json", "w") as f:
+                json.dump({"PYBPOD_PROTOCOL": protocol}, f)
+            with open(raw_folder / "_iblrig_taskData.raw.jsonable", "w") as f:
+                for i in range(ntrials):
+                    trial = {"trial_num": i + 1, "behavior_data": {
+                        "Bpod start timestamp": 0, "Trial start timestamp": i, "Trial end timestamp": i + 1,
+                        "States timestamps": {}, "Events timestamps": {}}}
+                    f.write(json.dumps(trial) + "\n")
+            return str(raw_folder.parent)
+
+        expected = create_session("2022-01-01", "001", "_iblrig_tasks_trainingChoiceWorld", 3)
+        create_session("2022-01-02", "001", "_iblrig_tasks_habituationChoiceWorld", 2)
+        create_session("2022-01-02", "002", "_iblrig_tasks_trainingChoiceWorld", 0)
+        current = str(remote_subjects_folder / test_subject_name / "2022-01-03" / "001")
+        previous = path_helper.get_previous_session(
+            "trainingChoiceWorld", test_subject_name, current, remote_subject_folder=str(remote_subjects_folder))
+        self.assertEqual(previous["session_path"], expected)
+        self.assertEqual(Path(previous["data_file"]).parent.parent, Path(expected))
+        self.assertEqual(previous["last_trial_data"]["trial_num"], 3)
+        self.assertEqual(previous["settings_data"]["PYBPOD_PROTOCOL"], "_iblrig_tasks_trainingChoiceWorld")
+        self.assertTrue(previous["remote_consulted"])
+        # the result is kept for the process, changes of the returned dict do not leak into the cache
+        previous["last_trial_data"]["trial_num"] = 0
+        create_session("2022-01-02", "003", "_iblrig_tasks_trainingChoiceWorld", 1)
+        previous = path_helper.get_previous_session(
+            "trainingChoiceWorld", test_subject_name, current, remote_subject_folder=str(remote_subjects_folder))
+        self.assertEqual(previous["session_path"], expected)
+        self.assertEqual(previous["last_trial_data"]["trial_num"], 3)
+        remote_dir.cleanup()
+
+    def test_get_previous_session_catalog(self):
+        test_subject_name = "_iblrig_test_catalog_mouse"
+        tdir = tempfile.TemporaryDirectory()
+        subjects_folder = Path(tdir.name) / "Subjects"
+        subject_folder = subjects_folder / test_subject_name
+
+        behavior_data = {"Bpod start timestamp": 0.0, "Trial start timestamp": 0.0, "Trial end timestamp": 1.0,
+                         "Events timestamps": {}, "States timestamps": {}}
+
+        def make_session(date, protocol, ntrials):
+            raw_folder = subject_folder / date / "001" / "raw_behavior_data"
+            raw_folder.mkdir(parents=True)
+            with open(raw_folder / "_iblrig_taskSettings.raw.json", "w") as f:
+                json.dump({"PYBPOD_PROTOCOL": protocol}, f)
+            with open(raw_folder / "_iblrig_taskData.raw.jsonable", "w") as f:
+                f.writelines(json.dumps({"trial_num": i + 1, "behavior_data": behavior_data}) + "\n" for i in range(ntrials))
+            return str(subject_folder / date / "001")
+
+        sessions = [make_session("2021-12-31", "_iblrig_tasks_trainingChoiceWorld", 1),
+                    make_session("2022-01-01", "_iblrig_tasks_trainingChoiceWorld", 3),
+                    make_session("2022-01-02", "_iblrig_tasks_habituationChoiceWorld", 2)]
+        catalog_file = Path(tdir.name) / "catalog.db"
+        current = str(subject_folder / "2022-01-04" / "001")
+        args = ("trainingChoiceWorld", test_subject_name, current, str(subjects_folder))
+        with mock.patch("iblrig.session_catalog.get_catalog_file", return_value=catalog_file), \
+                mock.patch("iblrig.path_helper.raw_data_loaders.load_settings",
+                           wraps=raw_data_loaders.load_settings) as load_settings:
+            session_catalog.index_subjects_folder(subjects_folder, location="remote")
+            load_settings.reset_mock()
+            previous = path_helper.get_previous_session(*args)
+            self.assertEqual(previous["session_path"], sessions[1])
+            self.assertEqual(previous["last_trial_data"]["trial_num"], 3)
+            self.assertEqual(previous["settings_data"]["PYBPOD_PROTOCOL"], "_iblrig_tasks_trainingChoiceWorld")
+            # the catalog does not keep the behavior data
+            self.assertNotIn("behavior_data", previous["last_trial_data"])
+            # only the settings of the catalogued session and of the more recent sessions are read
+            self.assertEqual(sorted(c.args[0] for c in load_settings.call_args_list), sessions[1:])
+            # a session run on another rig, not in the catalog, is found in the subject folders
+            other_rig = make_session("2022-01-03", "_iblrig_tasks_trainingChoiceWorld", 5)
+            previous = path_helper._find_previous_session(*args)
+            self.assertEqual(previous["session_path"], other_rig)
+            self.assertEqual(previous["last_trial_data"], {"trial_num": 5, "behavior_data": behavior_data})
+            # only the rig computer sessions of the catalog when the lab server is given up
+            self.assertIsNone(path_helper._catalog_previous_session(*args[:3], local_only=True))
+            # no match in the catalog, the folders are walked
+            previous = path_helper._find_previous_session("habituationChoiceWorld", *args[1:])
+            self.assertEqual(previous["session_path"], sessions[2])
+        tdir.cleanup()
+
+    def test_set_previous_session(self):
+        previous = {"data_file": "data", "settings_file": "settings", "session_path": "session",
+                    "last_trial_data": None, "settings_data": None, "remote_consulted": False}
+        sph = SimpleNamespace(_PROTOCOL="_iblrig_tasks_trainingChoiceWorld", SUBJECT_NAME="subject",
+                              SESSION_FOLDER="session_folder")
+        with mock.patch("iblrig.path_helper.get_previous_session", return_value=previous) as get_previous:
+            self.assertEqual(path_helper.set_previous_session(sph), previous)
+        get_previous.assert_called_once_with("_iblrig_tasks_trainingChoiceWorld", "subject", "session_folder")
+        self.assertEqual(
+            [sph.PREVIOUS_DATA_FILE, sph.PREVIOUS_SETTINGS_FILE, sph.PREVIOUS_SESSION_PATH],
+            ["data", "settings", "session"])
+        # written to the settings file of the session
+        self.assertFalse(sph.PREVIOUS_SESSION_REMOTE_CONSULTED)
+
+    def test_get_previous_session_timeout(self):
+        release = threading.Event()
+        get_previous_session_folders = path_helper.get_previous_session_folders
+
+        def slow_remote(subject_name, session_folder, remote_subject_folder=None, local_only=False):
+            if not local_only:
+                release.wait(10)
+            return get_previous_session_folders(subject_name, session_folder, remote_subject_folder, local_only)
+
+        args = ("trainingChoiceWorld", "_iblrig_test_timeout_mouse", "1900-01-01")
+        with mock.patch("iblrig.path_helper.get_previous_session_folders", side_effect=slow_remote):
+            path_helper.prefetch_previous_session(*args)
+            t0 = time.time()
+            previous = path_helper.get_previous_session(*args, timeout=0.2)
+            self.assertLess(time.time() - t0, 5)
+            release.set()
+        self.assertFalse(previous["remote_consulted"])
+        self.assertIsNone(previous["session_path"])
+        # the decision holds for the rest of the process
+        self.assertFalse(path_helper.get_previous_session(*args)["remote_consulted"])
+
     def tearDown(self):
         pass
 
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from iblrig.plot_process import PlotProcess
+
+ONLINE_PLOTS = """
+import matplotlib.pyplot as plt
+
+
+def make_fig(title):
+    f = plt.figure()
+    f.suptitle(title)
+    (line,) = plt.gca().plot([], [])
+    return f, line
+
+
+def update_fig(f, line, summary):
+    line.set_data(summary["x"], summary["y"])
+    with open(summary["log"], "a") as fp:
+        fp.write(f"{summary['trial']}\\n")
+"""
+
+
+class TestPlotProcess(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.plotter_file = Path(self.tdir.name).joinpath("online_plots.py")
+        self.plotter_file.write_text(ONLINE_PLOTS)
+        self.png_file = Path(self.tdir.name).joinpath("online_plot.png")
+        self.log_file = Path(self.tdir.name).joinpath("drawn.txt")
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    @mock.patch.dict(os.environ, {"MPLBACKEND": "Agg"})
+    def test_plot_process(self):
+        plots = PlotProcess(self.plotter_file, "subject", self.png_file, snapshot_secs=60)
+        t0 = time.perf_counter()
+        for i in range(20):
+            plots.update({"trial": i, "x": np.arange(i), "y": np.arange(i) ** 2, "log": str(self.log_file)})
+        plots.set_facecolor("xkcd:red")
+        # queuing never waits on the plotting process
+        self.assertLess(time.perf_counter() - t0, 0.5)
+        plots.close()
+        self.assertEqual(plots.process.returncode, 0)
+        # the last snapshot is saved on close, intermediate summaries may be skipped but not the last one
+        self.assertTrue(self.png_file.exists())
+        self.assertEqual(self.log_file.read_text().split()[-1], "19")
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,405 @@
+import json
+import shutil
+import subprocess
+import tempfile
+import unittest
+import wave
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import iblrig.iotasks as iotasks
+import iblrig.raw_data_loaders as raw
+
+
+def _fake_trial(i):
+    return {
+        "trial_num": i + 1,
+        "behavior_data": {
+            "Bpod start timestamp": 0.0,
+            "Trial start timestamp": float(i * 10),
+            "Trial end timestamp": float(i * 10 + 5),
+            "Events timestamps": {"Tup": [0.1, 0.5], "BNC1High": [0.2], "BNC1Low": [0.3]},
+            "States timestamps": {"trial_start": [[0.0, 0.1]], "exit_state": [[0.5, 1.0]]},
+        },
+    }
+
+
+class TestJsonable(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.session_path = Path(self.tdir.name).joinpath("subject", "2022-01-01", "001")
+        self.session_path.joinpath("raw_behavior_data").mkdir(parents=True)
+        self.file = self.session_path.joinpath("raw_behavior_data", "_iblrig_taskData.raw.jsonable")
+        self.trials = [_fake_trial(i) for i in range(50)]
+        raw.jsonable.write(self.file, self.trials)
+
+    def test_iter_read(self):
+        self.assertEqual(raw.jsonable.read(self.file), self.trials)
+        self.assertEqual(list(raw.jsonable.iter(self.file)), self.trials)
+
+    def test_iter_resume_offset(self):
+        it = raw.jsonable.iter(self.file, return_offset=True)
+        first = [next(it) for _ in range(10)]
+        offset = first[-1][1]
+        resumed = list(raw.jsonable.iter(self.file, offset=offset))
+        self.assertEqual([t for t, _ in first] + resumed, self.trials)
+        # appending to the file, the previous offset picks up the new trials only
+        raw.jsonable.append(self.file, [_fake_trial(50)])
+        self.assertEqual(list(raw.jsonable.iter(self.file, offset=offset))[-1], _fake_trial(50))
+
+    def test_tail(self):
+        self.assertEqual(raw.jsonable.tail(self.file), self.trials[-1:])
+        self.assertEqual(raw.jsonable.tail(self.file, n=5), self.trials[-5:])
+        self.assertEqual(raw.jsonable.tail(self.file, n=500), self.trials)
+        # small chunks force several reads backwards
+        self.assertEqual(raw.jsonable.tail(self.file, n=3, chunk_size=7), self.trials[-3:])
+
+    def test_incomplete_last_line(self):
+        with open(self.file, "a") as f:
+            f.write(json.dumps(_fake_trial(50))[:20])
+        self.assertEqual(raw.jsonable.read(self.file), self.trials)
+        self.assertEqual(raw.jsonable.tail(self.file, n=2), self.trials[-2:])
+
+    def test_load_data(self):
+        data = raw.load_data(self.session_path)
+        self.assertEqual(len(data), 50)
+        last = raw.load_data(self.session_path, last=1)
+        self.assertEqual(last, data[-1:])
+        self.assertEqual(list(raw.iter_data(self.session_path)), data)
+
+    def test_cache(self):
+        table = raw.load_data(self.session_path, format="columnar", cache=True)
+        cache_folder = self.session_path.joinpath(raw.CACHE_FOLDER)
+        self.assertTrue(cache_folder.exists())
+        cached = raw.load_data(self.session_path, format="columnar", cache=True)
+        self.assertIsInstance(cached["events_times"], np.memmap)
+        for k in table:
+            np.testing.assert_array_equal(table[k], cached[k])
+        # the cache is rebuilt when the source file changes
+        raw.jsonable.append(self.file, [_fake_trial(50)])
+        cached = raw.load_data(self.session_path, format="columnar", cache=True)
+        self.assertEqual(cached["trials_start"].size, 51)
+        self.assertEqual(raw.read_cache(self.file, "trials_absolute")["trials_start"].size, 51)
+
+    def test_cache_dataframe(self):
+        df = pd.DataFrame({"re_ts": np.arange(5.), "bns_ts": [f"2022-01-01T00:00:0{i}" for i in range(5)]})
+        raw.write_cache(self.file, "test", df)
+        cached = raw.read_cache(self.file, "test")
+        pd.testing.assert_frame_equal(df, cached)
+        self.assertIsNone(raw.read_cache(self.file, "other"))
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+
+class TestTrialDeltas(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.session_path = Path(self.tdir.name).joinpath("subject", "2022-01-01", "001")
+        self.session_path.joinpath("raw_behavior_data").mkdir(parents=True)
+        self.file = self.session_path.joinpath("raw_behavior_data", "_iblrig_taskData.raw.jsonable")
+        # trials as dumped by the task: constants, a buffer growing in place and the trial outcome
+        self.trials, position_buffer = [], []
+        writer = iotasks.TrialDataWriter(self.file, delta=True)
+        for i in range(200):
+            position_buffer.append(35 if i % 2 else -35)
+            trial = _fake_trial(i)
+            trial["position_set"] = [-35, 35]
+            trial["threshold_events_dict"] = {-35: "RotaryEncoder1_1", 35: "RotaryEncoder1_2"}
+            trial["position_buffer"] = position_buffer
+            if i != 100:
+                trial["trial_correct"] = i % 3 != 0
+            writer.write(trial)
+            # the trial as read from a file of full trials
+            self.trials.append(json.loads(json.dumps(trial)))
+        writer.close()
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def test_load_data(self):
+        self.assertEqual(raw.load_data(self.session_path, time="raw"), self.trials)
+        self.assertEqual(raw.load_data(self.session_path, time="raw", last=3), self.trials[-3:])
+        absolute = [raw.trial_times_to_times(json.loads(json.dumps(t))) for t in self.trials]
+        self.assertEqual(raw.load_data(self.session_path), absolute)
+        self.assertEqual(raw.load_data(self.session_path, last=1), absolute[-1:])
+        # only the first trial is written in full
+        records = raw.jsonable.read(self.file)
+        self.assertEqual(records[0], self.trials[0])
+        self.assertEqual(records[1][raw.DELTA_KEY]["extend"], {"position_buffer": [35]})
+        self.assertEqual(records[100][raw.DELTA_KEY]["remove"], ["trial_correct"])
+        full_size = sum(len(json.dumps(t, separators=(",", ":"))) + 1 for t in self.trials)
+        self.assertLess(self.file.stat().st_size, full_size / 2)
+
+    def test_iter_data_resume(self):
+        it = raw.iter_data(self.session_path, time="raw", return_offset=True)
+        first = [next(it) for _ in range(10)]
+        previous, offset = first[-1]
+        resumed = list(raw.iter_data(self.session_path, time="raw", offset=offset, previous=previous))
+        self.assertEqual([t for t, _ in first] + resumed, self.trials)
+        with self.assertRaises(ValueError):
+            list(raw.iter_data(self.session_path, time="raw", offset=offset))
+
+    def test_encoder_lists(self):
+        encoder = raw.TrialDeltaEncoder()
+        buffer, trials, records = [], [], []
+        for i in range(20):
+            buffer.append(i)
+            contrast_set = [1.0, 0.5, 0.25] if i < 10 else [1.0, 0.25, 0.125, 0.0625]
+            ac_buffer = [[0, 0], [0, 0]] if i < 15 else [[1, 0], [0, 0]]
+            trial = {"buffer": buffer, "contrast_set": contrast_set, "ac_buffer": ac_buffer}
+            records.append(encoder.encode(trial))
+            trials.append(json.loads(json.dumps(trial)))
+            if i == 0:
+                previous_buffer = encoder.previous["buffer"]
+        # the grown buffer is extended in place, the records kept are not changed by the next trials
+        self.assertIs(encoder.previous["buffer"], previous_buffer)
+        self.assertEqual(records[0], {"buffer": [0], "contrast_set": [1.0, 0.5, 0.25], "ac_buffer": [[0, 0], [0, 0]]})
+        self.assertEqual(records[5][raw.DELTA_KEY], {"extend": {"buffer": [5]}})
+        # a list that grew with a changed item, a list of the same length with a changed item
+        self.assertEqual(records[10][raw.DELTA_KEY]["set"], {"contrast_set": [1.0, 0.25, 0.125, 0.0625]})
+        self.assertEqual(records[15][raw.DELTA_KEY]["set"], {"ac_buffer": [[1, 0], [0, 0]]})
+        self.assertEqual(list(raw.decode_trial_deltas(records)), trials)
+
+    def test_convert_task_data_file(self):
+        full_file = raw.convert_task_data_file(self.file, delta=False, out_file=self.file.with_name("full.jsonable"))
+        self.assertEqual(raw.jsonable.read(full_file), self.trials)
+        raw.convert_task_data_file(full_file)
+        self.assertEqual(list(raw.decode_trial_deltas(raw.jsonable.iter(full_file))), self.trials)
+        self.assertEqual(full_file.stat().st_size, self.file.stat().st_size)
+
+
+class TestEncoderSSV(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.file = Path(self.tdir.name).joinpath("_iblrig_encoderPositions.raw.ssv")
+
+    def test_read_ge5(self):
+        lines = "100 1 \n200 2 \n\n200 2 \n300 x \n400 4 5 6\n500\n-600 -6 \r\n700 7 \n"
+        lines += "".join(f"{800 + i} {i} \n" for i in range(100)) + "2000 9"
+        self.file.write_text(lines)
+        for chunk_size in (7, 2 ** 16):
+            df = raw._read_encoder_ssv_file(
+                self.file, ["re_ts", "re_pos", "_"], ["re_ts", "re_pos"], chunk_size=chunk_size)
+            # blank line: no row, duplicated row 2, non numeric row 3, missing field row 5
+            np.testing.assert_array_equal(df.index[:6], [0, 1, 4, 6, 7, 8])
+            np.testing.assert_array_equal(df["re_ts"][:5], [100, 200, 400, -600, 700])
+            # as for read_csv, columns with missing values are float
+            self.assertEqual(df["re_ts"].dtype, np.int64)
+            self.assertEqual(df["re_pos"].dtype, np.float64)
+            self.assertEqual(df["re_pos"].iloc[-1], 9)
+            self.assertEqual(df.shape, (106, 2))
+
+    def test_read_lt5(self):
+        bns = "2019-02-13T14:24:59.3945123+00:00"
+        self.file.write_text(f"Position 1708861234 -78 {bns} \nPosition 1708862576 -80 {bns} \n")
+        df = raw._load_encoder_positions_file_lt5(self.file)
+        np.testing.assert_array_equal(df["re_ts"], [1708861234, 1708862576])
+        np.testing.assert_array_equal(df["re_pos"], [-78, -80])
+        self.assertEqual(df["bns_ts"].tolist(), [bns] * 2)
+
+    def test_encoder_positions_cache(self):
+        # the repair report is the same whether the data is parsed or served from the cache
+        session_path = Path(self.tdir.name).joinpath("subject", "2022-01-01", "001")
+        session_path.joinpath("raw_behavior_data").mkdir(parents=True)
+        ts = [5000, 100, 300, 200] + list(range(400, 2000, 100))
+        session_path.joinpath("raw_behavior_data", "_iblrig_encoderPositions.raw.ssv").write_text(
+            "".join(f"{t} {i} 0\n" for i, t in enumerate(ts)))
+        settings = {"IBLRIG_VERSION_TAG": "6.0.0"}
+        parsed = raw.load_encoder_positions(session_path, settings=settings)
+        self.assertEqual(parsed.attrs["repairs"], {"corrupt_first": 1, "wraps": 0, "swaps": 1, "unsorted": 0})
+        for _ in range(2):
+            cached = raw.load_encoder_positions(session_path, settings=settings, cache=True)
+            self.assertEqual(cached.attrs, parsed.attrs)
+            np.testing.assert_array_equal(cached["re_ts"], parsed["re_ts"])
+        self.assertIsInstance(cached["re_ts"].values, np.memmap)
+
+    def test_repair_wheel_timestamps(self):
+        ts = np.arange(20, dtype=float) * 100
+        ts[0] = 5000  # corrupt first sample
+        ts[5], ts[6] = ts[6], ts[5]  # swap
+        ts[10:] -= 2 ** 32 - 50  # uint32 wraparound
+        ts[15] = ts[14] - 150  # corrupt sample
+        re_ts, order, drop_first, report = raw.repair_wheel_timestamps(ts)
+        self.assertEqual(report, {"corrupt_first": 1, "wraps": 1, "swaps": 1, "unsorted": 1})
+        self.assertEqual(drop_first, 0)
+        np.testing.assert_array_equal(order[3:7], [4, 6, 5, 7])
+        self.assertTrue(np.all(np.diff(re_ts) >= 0))
+        self.assertEqual(order[12], 15)
+        # clean timestamps are not touched
+        re_ts, order, drop_first, report = raw.repair_wheel_timestamps(np.arange(10))
+        self.assertIsNone(order)
+        self.assertFalse(drop_first)
+        self.assertEqual(sum(report.values()), 0)
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+
+class TestCameraFrameData(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.session_path = Path(self.tdir.name)
+        self.session_path.joinpath("raw_video_data").mkdir()
+        n = 100
+        self.gpio = np.zeros((n, 4), dtype=bool)
+        self.gpio[10:20, 0] = True
+        self.gpio[50:, 3] = True
+        gpio = np.sum(self.gpio * (2 ** np.arange(31, 27, -1)), axis=1)
+        ts = 10 ** 12 + np.arange(n) * 66666
+        data = np.c_[ts, np.arange(n) * 4096 * 533, np.arange(n) + 25, gpio].astype(np.float64)
+        data.tofile(self.session_path.joinpath("raw_video_data", "_iblrig_leftCamera.frameData.bin"))
+
+    def test_read_camera_frame_data(self):
+        frame_data = raw.read_camera_frame_data(self.session_path, "left")
+        np.testing.assert_array_equal(frame_data["embeddedFrameCounter"], np.arange(100))
+        np.testing.assert_allclose(frame_data["Timestamp"][1], 0.0066666)
+        np.testing.assert_array_equal(raw.unpack_gpio(frame_data["embeddedGPIOPinState"]), self.gpio)
+        self.assertIsInstance(raw.read_camera_frame_data(self.session_path, "left", raw=True), np.memmap)
+        # the dataframe keeps one array per frame
+        df = raw.load_camera_frame_data(self.session_path, "left")
+        np.testing.assert_array_equal(np.stack(df["embeddedGPIOPinState"]), self.gpio)
+
+    def test_load_embedded_frame_data(self):
+        count, gpio = raw.load_embedded_frame_data(self.session_path, "left")
+        np.testing.assert_array_equal(count, np.arange(100))
+        np.testing.assert_array_equal(gpio[0]["indices"], [10, 20])
+        np.testing.assert_array_equal(gpio[0]["polarities"], [1, -1])
+        self.assertIsNone(gpio[1])
+        np.testing.assert_array_equal(gpio[3]["indices"], [50])
+
+    def test_load_all_cameras(self):
+        video_path = self.session_path.joinpath("raw_video_data")
+        video_path.joinpath("_iblrig_bodyCamera.frameData.bin").write_bytes(
+            video_path.joinpath("_iblrig_leftCamera.frameData.bin").read_bytes())
+        cameras = raw.load_all_cameras(self.session_path)
+        self.assertEqual(list(cameras.keys()), ["left", "right", "body"])
+        self.assertIsNone(cameras["right"])
+        count, gpio = raw.load_embedded_frame_data(self.session_path, "body")
+        np.testing.assert_array_equal(cameras["body"]["count"], count)
+        np.testing.assert_array_equal(cameras["body"]["gpio"][3]["indices"], gpio[3]["indices"])
+        times = raw.load_camera_ssv_times(self.session_path, "left")
+        np.testing.assert_array_equal(cameras["left"]["bonsai_times"], times[0])
+        np.testing.assert_array_equal(cameras["left"]["camera_times"], times[1])
+        self.assertEqual(list(raw.load_all_cameras(self.session_path, "left").keys()), ["left"])
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+
+class TestMic(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.session_path = Path(self.tdir.name)
+        self.session_path.joinpath("raw_behavior_data").mkdir()
+        self.wav_file = self.session_path.joinpath("raw_behavior_data", "_iblrig_micData.raw.wav")
+        self.data = np.random.default_rng(0).integers(-2 ** 15, 2 ** 15, (1000, 2), dtype=np.int16)
+        with wave.open(str(self.wav_file), "wb") as fp:
+            fp.setnchannels(2)
+            fp.setsampwidth(2)
+            fp.setframerate(44100)
+            fp.writeframes(self.data.tobytes())
+
+    def test_load_mic(self):
+        np.testing.assert_array_equal(raw.load_mic(self.session_path), self.data)
+
+    @unittest.skipIf(shutil.which("ffmpeg") is None, "ffmpeg not installed")
+    def test_load_mic_flac(self):
+        # as compressed by the compression stage, the flac file replaces the wav file
+        subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-i", str(self.wav_file), "-codec:a", "flac",
+                        str(self.wav_file.with_suffix(".flac"))], check=True)
+        self.wav_file.unlink()
+        np.testing.assert_array_equal(raw.load_mic(self.session_path), self.data)
+
+    def test_load_mic_flac_no_ffmpeg(self):
+        self.wav_file.rename(self.wav_file.with_suffix(".flac"))
+        with mock.patch("shutil.which", return_value=None), self.assertLogs("iblrig", level="ERROR"):
+            self.assertIsNone(raw.load_mic(self.session_path))
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+
+class TestSyncTrialsRobust(unittest.TestCase):
+    def test_sync_trials_robust(self):
+        rng = np.random.default_rng(42)
+        t = np.cumsum(rng.uniform(0.05, 1.5, 500))
+        i0 = np.setdiff1d(np.arange(500), [10, 11, 200])
+        i1 = np.setdiff1d(np.arange(500), [50, 300, 301, 302])
+        t0, t1 = t[i0], t[i1] * (1 + 20e-6) + 3.5
+        s0, s1, ind0, ind1, model = raw.sync_trials_robust(t0, t1, return_index=True, return_model=True)
+        # matched pulses are the same pulses
+        np.testing.assert_array_equal(i0[ind0], i1[ind1])
+        self.assertGreater(s0.size, 480)
+        np.testing.assert_allclose(model["offset"], 3.5, atol=1e-9)
+        np.testing.assert_allclose(model["drift_ppm"], 20, atol=1e-6)
+        np.testing.assert_allclose(model["residuals"], 0, atol=1e-9)
+        self.assertEqual(len(raw.sync_trials_robust(t0, t1)), 2)
+
+
+def _legacy_fronts(data, channel, suffixes=("High", "Low")):
+    # per trial implementation the vectorized loader replaces
+    fronts = np.array([[np.nan, np.nan]])
+    for tr in data:
+        for suffix, pol in zip(suffixes, (1, -1)):
+            ts = tr["behavior_data"]["Events timestamps"].get(channel + suffix, [np.nan])
+            fronts = np.append(fronts, np.array([[x, pol] for x in ts]), axis=0)
+    fronts = fronts[1:, :]
+    fronts = fronts[fronts[:, 0].argsort()]
+    return {"times": fronts[:, 0], "polarities": fronts[:, 1]}
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.trials = [_fake_trial(i) for i in range(20)]
+        # some trials are missing events or have extra states
+        self.trials[3]["behavior_data"]["Events timestamps"].pop("BNC1High")
+        self.trials[5]["behavior_data"]["Events timestamps"]["Port1In"] = [0.15, 0.45]
+        self.trials[7]["behavior_data"]["States timestamps"]["error"] = [[float("nan")] * 2]
+
+    def test_trials_to_columnar(self):
+        table = raw.trials_to_columnar(json.loads(json.dumps(self.trials)))
+        dicts = [raw.trial_times_to_times(t) for t in json.loads(json.dumps(self.trials))]
+        # events: same times per trial and name as the per trial conversion
+        for i, tr in enumerate(dicts):
+            for k, v in tr["behavior_data"]["Events timestamps"].items():
+                mask = (table["events_trial"] == i) & (table["event_names"][table["events_name"]] == k)
+                np.testing.assert_array_equal(table["events_times"][mask], v)
+            for k, v in tr["behavior_data"]["States timestamps"].items():
+                mask = (table["states_trial"] == i) & (table["state_names"][table["states_name"]] == k)
+                np.testing.assert_array_equal(table["states_start"][mask], np.array(v)[:, 0])
+                np.testing.assert_array_equal(table["states_stop"][mask], np.array(v)[:, 1])
+        np.testing.assert_array_equal(
+            table["trials_start"], [t["behavior_data"]["Trial start timestamp"] for t in dicts])
+        # loaders accept the table
+        self.assertEqual(raw.get_port_events(table, "BNC1"),
+                         sorted(sum([raw.get_port_events(t, "BNC1") for t in dicts], [])))
+        for a, b in zip(raw.load_bpod_fronts(None, data=table), raw.load_bpod_fronts(None, data=dicts)):
+            np.testing.assert_array_equal(a["times"], b["times"])
+            # the order of the NaN placeholders of trials without fronts is arbitrary
+            finite = np.isfinite(b["times"])
+            np.testing.assert_array_equal(a["polarities"][finite], b["polarities"][finite])
+            self.assertEqual(np.sum(a["polarities"]), np.sum(b["polarities"]))
+
+    def test_load_bpod_fronts(self):
+        self.trials[2]["behavior_data"]["Events timestamps"]["Wire1High"] = [0.25]
+        dicts = [raw.trial_times_to_times(t) for t in json.loads(json.dumps(self.trials))]
+        channels = ("Port1", "BNC1", "BNC2", "Wire1")
+        fronts = raw.load_bpod_fronts(None, data=dicts, channels=channels)
+        self.assertEqual(len(fronts), 4)
+        for ch, a in zip(channels, fronts):
+            b = _legacy_fronts(dicts, ch, ("In", "Out") if ch == "Port1" else ("High", "Low"))
+            np.testing.assert_array_equal(a["times"], b["times"])
+            finite = np.isfinite(b["times"])
+            np.testing.assert_array_equal(a["polarities"][finite], b["polarities"][finite])
+            self.assertEqual(np.sum(a["polarities"]), np.sum(b["polarities"]))
+        # the port events of trial 5 are fronts
+        np.testing.assert_array_equal(fronts[0]["times"][:2], [50.15, 50.45])
+        np.testing.assert_array_equal(fronts[0]["polarities"][:1], [1])
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
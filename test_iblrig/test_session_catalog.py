@@ -0,0 +1,65 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from iblrig import session_catalog
+
+
+class TestSessionCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.subjects_folder = Path(self.tdir.name).joinpath("Subjects")
+        self.db_file = Path(self.tdir.name).joinpath("catalog.db")
+        self.sessions = [
+            self._make_session("2022-01-01", "001", "_iblrig_tasks_trainingChoiceWorld6.4.2", 10),
+            self._make_session("2022-01-02", "001", "_iblrig_tasks_trainingChoiceWorld6.4.2", 20),
+            self._make_session("2022-01-02", "002", "_iblrig_tasks_habituationChoiceWorld6.4.2", 30),
+            self._make_session("2022-01-03", "001", "_iblrig_tasks_trainingChoiceWorld6.4.2", 0),
+        ]
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def _make_session(self, date, number, protocol, ntrials):
+        session_path = self.subjects_folder.joinpath("subject", date, number)
+        raw_folder = session_path.joinpath("raw_behavior_data")
+        raw_folder.mkdir(parents=True)
+        with open(raw_folder.joinpath("_iblrig_taskSettings.raw.json"), "w") as f:
+            json.dump({"PYBPOD_PROTOCOL": protocol, "SESSION_DATETIME": f"{date}T10:00:00"}, f)
+        with open(raw_folder.joinpath("_iblrig_taskData.raw.jsonable"), "w") as f:
+            for i in range(ntrials):
+                f.write(json.dumps({"trial_num": i + 1, "contrast": 0.5, "behavior_data": {}}) + "\n")
+        return session_path
+
+    def test_index_and_query(self):
+        self.assertEqual(session_catalog.index_subjects_folder(self.subjects_folder, db_file=self.db_file), 4)
+        # nothing changed, nothing to index
+        self.assertEqual(session_catalog.index_subjects_folder(self.subjects_folder, db_file=self.db_file), 0)
+        sessions = session_catalog.get_previous_sessions("subject", db_file=self.db_file)
+        # the empty session is left out, most recent first
+        self.assertEqual([s["session_path"] for s in sessions], [str(s) for s in self.sessions[2::-1]])
+        self.assertEqual(sessions[0]["ntrials"], 30)
+        self.assertEqual(sessions[0]["last_trial"], {"trial_num": 30, "contrast": 0.5})
+        last = session_catalog.get_last_session("subject", protocol="trainingChoiceWorld", db_file=self.db_file)
+        self.assertEqual(last["session_path"], str(self.sessions[1]))
+        last = session_catalog.get_last_session(
+            "subject", protocol="trainingChoiceWorld", exclude=self.sessions[1], db_file=self.db_file)
+        self.assertEqual(last["session_path"], str(self.sessions[0]))
+        self.assertIsNone(session_catalog.get_last_session("other_subject", db_file=self.db_file))
+
+    def test_update_session(self):
+        self.assertIsNone(
+            session_catalog.get_last_session("subject", protocol="trainingChoiceWorld", db_file=self.db_file))
+        # the session ends
+        with open(self.sessions[3].joinpath("raw_behavior_data", "_iblrig_taskData.raw.jsonable"), "w") as f:
+            f.write(json.dumps({"trial_num": 1, "behavior_data": {}}) + "\n")
+        record = session_catalog.update_session(self.sessions[3], db_file=self.db_file)
+        self.assertEqual(record["ntrials"], 1)
+        last = session_catalog.get_last_session("subject", protocol="trainingChoiceWorld", db_file=self.db_file)
+        self.assertEqual(last["session_path"], str(self.sessions[3]))
+        self.assertIsNone(session_catalog.update_session(self.subjects_folder, db_file=self.db_file))
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
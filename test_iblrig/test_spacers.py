@@ -1,5 +1,8 @@
-import numpy as np
+import tempfile
 import unittest
+from pathlib import Path
+
+import numpy as np
 
 from iblrig.spacer import Spacer
 
@@ -32,3 +35,31 @@ class TestSpacer(unittest.TestCase):
             signal[int(start_time * fs): int(start_time * fs) + template.size] = template
         spacer_times = spacer.find_spacers(signal, fs=fs)
         np.testing.assert_allclose(spacer_times, start_times)
+
+    def test_find_spacers_chunks(self):
+        """
+        The chunked FFT correlation of a memory mapped signal finds the same spacers as a
+        direct correlation, with noise and spacers across chunks
+        """
+        fs = 1000
+        spacer = Spacer()
+        template = spacer.generate_template(fs)
+        start_times = [0.5, 20.003, 41.2]
+        signal = np.random.default_rng(0).uniform(0, 0.3, int(50 * fs))
+        for start_time in start_times:
+            signal[int(round(start_time * fs)): int(round(start_time * fs)) + template.size] += template
+        # peaks of the direct correlation
+        xcor = np.correlate(signal, template, mode="full") / np.sum(template)
+        idetect = np.flatnonzero(xcor > 0.9)
+        groups = np.split(idetect, np.flatnonzero(np.diff(idetect) > 1) + 1)
+        expected = [(g[np.argmax(xcor[g])] - template.size + 1) / fs for g in groups]
+        with tempfile.TemporaryDirectory() as td:
+            file = Path(td).joinpath("signal.bin")
+            signal.tofile(file)
+            mmap = np.memmap(file, dtype=np.float64, mode="r")
+            spacer_times = spacer.find_spacers(mmap, fs=fs, chunk_size=3000)
+            del mmap
+        # the interpolated times are within half a sample of the peaks
+        np.testing.assert_allclose(spacer_times, expected, atol=0.5 / fs)
+        np.testing.assert_allclose(spacer_times, start_times, atol=1 / fs)
+        np.testing.assert_array_equal(spacer.find_spacers(np.zeros(10000), fs=fs), [])
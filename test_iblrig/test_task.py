@@ -1,12 +1,19 @@
 """
 Unit tests for task logic functions
 """
+import json
+import subprocess
+import sys
 import unittest
 
 import numpy as np
 import pandas as pd
+import scipy.stats as st
+from iblutil.util import Bunch
 
-from iblrig import session_creator
+from iblrig import misc, session_creator
+from iblrig.fake_trial_params import AdaptiveContrast
+from iblrig.iotasks import ComplexEncoder, to_json
 
 pc, lb = session_creator.make_ephysCW_pc()
 
@@ -39,3 +46,112 @@ class TestsBiasedBlocksGeneration(unittest.TestCase):
         c = self.count_contrasts(pc)
         c[4] /= 2
         assert np.all(np.abs(1 - c * 10) <= 0.2)
+
+
+class ScipyAdaptiveContrast(AdaptiveContrast):
+    """Adaptive contrast with the list buffer and the scipy criterion, as before the ring buffer"""
+
+    def __init__(self, sph):
+        super().__init__(sph)
+        self.perf_crit = int(sum(1 - st.binom.cdf(range(self.buffer_size), self.buffer_size, sph.AC_PERF_CRIT) >= 0.05))
+
+    def _new_buffer(self):
+        return np.zeros((2, self.buffer_size, len(self.all_contrasts))).tolist()
+
+    def _init_buffer(self):
+        if self.previous_session is None or not self.last_trial_data:
+            return self._new_buffer()
+        return self.last_trial_data["ac"]["buffer"]
+
+    def _update_buffer(self, prev_position):
+        _buffer = np.asarray(self.buffer)
+        side_idx = 0 if prev_position < 0 else 1
+        contrast_idx = self.contrast_set.index(self.value)
+        col = _buffer[side_idx, :, contrast_idx]
+        col = np.roll(col, -1)
+        col[-1] = int(self.trial_correct)
+        _buffer[side_idx, :, contrast_idx] = col
+        self.buffer = _buffer.tolist()
+
+    def _update_contrast_set(self):
+        if 0.125 in self.contrast_set:
+            self.ntrials_125 += 1
+        _ntrials = np.sum(self.buffer, axis=1)
+        pass_crit = _ntrials > self.perf_crit
+        pass_idx = np.bitwise_and(pass_crit[0], pass_crit[1])
+        if pass_idx[0] and pass_idx[1] and 0.25 not in self.contrast_set:
+            self.contrast_set.append(0.25)
+        if pass_idx[2] and 0.125 not in self.contrast_set:
+            self.contrast_set.append(0.125)
+        if self.ntrials_125 >= self.ntrials_to_six and 0.0625 not in self.contrast_set:
+            self.contrast_set.append(0.0625)
+        if self.ntrials_125 >= self.ntrials_to_zero and 0.0 not in self.contrast_set:
+            self.contrast_set.append(0.0)
+        if self.ntrials_125 >= self.ntrials_to_remove_50 and 0.5 in self.contrast_set:
+            self.contrast_set.pop(1)
+        self.contrast_set = sorted(self.contrast_set)
+        self.contrast_set.reverse()
+
+
+class TestsAdaptiveContrast(unittest.TestCase):
+    def setUp(self):
+        self.sph = Bunch(
+            ADAPTIVE_CONTRAST=True,
+            CONTRAST_SET=[1.0, 0.5, 0.25, 0.125, 0.0625, 0.0],
+            AC_INIT_CONTRASTS=[1.0, 0.5],
+            AC_BUFFER_SIZE=50,
+            AC_PERF_CRIT=0.7,
+            AC_NTRIALS_TO_SIX=200,
+            AC_NTRIALS_TO_ZERO=400,
+            AC_NTRIALS_TO_REMOVE_50=600,
+            PREVIOUS_DATA_FILE=None,
+            LAST_TRIAL_DATA=None,
+        )
+
+    def test_binomial_criterion(self):
+        for (n, prob, alpha), crit in misc.BINOMIAL_CRITERIA.items():
+            self.assertEqual(crit, int(sum(1 - st.binom.cdf(range(n), n, prob) >= alpha)))
+        for n, prob, alpha in [(50, 0.72, 0.05), (25, 0.7, 0.01), (7, 0.5, 0.1)]:
+            self.assertEqual(misc.binomial_criterion(n, prob, alpha),
+                             int(sum(1 - st.binom.cdf(range(n), n, prob) >= alpha)))
+
+    def test_session_start_imports(self):
+        # the modules imported by the session_params.py of the tasks do not import scipy.stats
+        code = (
+            "import importlib, sys\n"
+            "for m in ['adaptive', 'ambient_sensor', 'bonsai', 'frame2TTL', 'iotasks', 'misc',\n"
+            "          'osc_client', 'path_helper', 'rotary_encoder', 'sound', 'user_input']:\n"
+            "    try:\n"
+            "        importlib.import_module('iblrig.' + m)\n"
+            "    except ModuleNotFoundError as e:\n"
+            "        if e.name.startswith(('iblrig', 'scipy')):\n"
+            "            raise\n"
+            "print('scipy.stats' in sys.modules)\n"
+        )
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "False")
+
+    def replay(self, ac_class, encode, sessions):
+        """Contrast sets and contrasts of consecutive sessions, the outcomes are the same for all classes"""
+        np.random.seed(1)
+        rng = np.random.default_rng(2)
+        sph, out = Bunch(self.sph), []
+        for ntrials, p_correct in sessions:
+            ac = ac_class(sph)
+            for _ in range(ntrials):
+                ac.trial_completed(bool(rng.uniform() < p_correct))
+                ac.next_trial(int(rng.choice([-35, 35])))
+                out.append((list(ac.contrast_set), float(ac.value)))
+            sph.PREVIOUS_DATA_FILE = "_iblrig_taskData.raw.jsonable"
+            sph.LAST_TRIAL_DATA = json.loads(encode({"ac": ac}))
+        return out, sph.LAST_TRIAL_DATA["ac"]
+
+    def test_replay(self):
+        sessions = [(400, 0.7), (500, 0.8), (800, 0.9), (400, 0.9)]
+        expected, ac_expected = self.replay(ScipyAdaptiveContrast, lambda x: json.dumps(x, cls=ComplexEncoder), sessions)
+        out, ac_out = self.replay(AdaptiveContrast, to_json, sessions)
+        # the staircase went all the way to 0% contrast
+        self.assertEqual(expected[-1][0], [1.0, 0.25, 0.125, 0.0625, 0.0])
+        self.assertEqual(out, expected)
+        self.assertEqual(ac_out["buffer"], ac_expected["buffer"])
+        self.assertEqual(ac_out["perf_crit"], ac_expected["perf_crit"])
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from iblrig import transfer
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tdir = tempfile.TemporaryDirectory()
+        self.src = Path(self.tdir.name).joinpath("local", "subject", "2022-01-01", "001")
+        self.dst = Path(self.tdir.name).joinpath("remote", "subject", "2022-01-01", "001")
+        self.src.joinpath("raw_video_data").mkdir(parents=True)
+        self.src.joinpath("raw_behavior_data").mkdir(parents=True)
+        self.video = np.random.default_rng(0).bytes(10_000)
+        self.src.joinpath("raw_video_data", "_iblrig_leftCamera.raw.avi").write_bytes(self.video)
+        self.src.joinpath("raw_behavior_data", "_iblrig_taskSettings.raw.json").write_text("{}")
+        self.src.joinpath("transfer_me.flag").touch()
+
+    def tearDown(self):
+        self.tdir.cleanup()
+
+    def test_copy_file_resume(self):
+        src_file = self.src.joinpath("raw_video_data", "_iblrig_leftCamera.raw.avi")
+        dst_file = self.dst.joinpath("raw_video_data", "_iblrig_leftCamera.raw.avi")
+        digest = transfer.copy_file(src_file, dst_file, chunk_size=1024)
+        chunks = [hashlib.blake2b(self.video[i:i + 1024]).hexdigest() for i in range(0, len(self.video), 1024)]
+        self.assertEqual(digest, hashlib.blake2b("".join(chunks).encode()).hexdigest())
+        self.assertEqual(dst_file.read_bytes(), self.video)
+        # interrupted copy: 3 chunks recorded, a 4th one partially written and a corrupt 5th one
+        manifest_file = dst_file.with_name(dst_file.name + transfer.MANIFEST_SUFFIX)
+        manifest = json.loads(manifest_file.read_text())
+        manifest.update(chunks=manifest["chunks"][:3], digest=None)
+        manifest_file.write_text(json.dumps(manifest))
+        part_file = dst_file.with_name(dst_file.name + transfer.PART_SUFFIX)
+        part_file.write_bytes(self.video[:3500] + b"\0" * 1500)
+        dst_file.unlink()
+        self.assertEqual(transfer.copy_file(src_file, dst_file, chunk_size=1024), digest)
+        self.assertEqual(dst_file.read_bytes(), self.video)
+        self.assertFalse(part_file.exists())
+        # a complete copy is not done again
+        self.assertEqual(transfer.copy_file(src_file, dst_file, chunk_size=1024), digest)
+
+    def test_transfer_sessions(self):
+        results = transfer.transfer_sessions([(self.src, self.dst)], ignore=["transfer_me.flag"], chunk_size=1024)
+        self.assertEqual(
+            set(results[self.src]),
+            {"raw_video_data/_iblrig_leftCamera.raw.avi", "raw_behavior_data/_iblrig_taskSettings.raw.json"},
+        )
+        self.assertFalse(self.dst.joinpath("transfer_me.flag").exists())
+        # no manifest left behind once the session is copied, the digests are in the checksum file
+        self.assertEqual(sorted(f.name for f in self.dst.rglob("*") if f.is_file()),
+                         sorted([transfer.CHECKSUM_FILE_NAME, "_iblrig_leftCamera.raw.avi", "_iblrig_taskSettings.raw.json"]))
+        checksums = transfer.load_checksums(self.dst)
+        for rel_path, digest in results[self.src].items():
+            stat = self.src.joinpath(rel_path).stat()
+            self.assertEqual(checksums[rel_path], {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                                   "digest": digest, "chunk_size": 1024})
+
+    def test_verify_copy(self):
+        video = "raw_video_data/_iblrig_leftCamera.raw.avi"
+        # no checksum file yet
+        transfer.copy_file(self.src / video, self.dst / video, chunk_size=1024)
+        self.assertFalse(transfer.verify_copy(self.src, self.dst, video))
+        transfer.transfer_sessions([(self.src, self.dst)], ignore=["transfer_me.flag"], chunk_size=1024)
+        # verified from the digests computed during the copy, the copy is not read
+        with mock.patch("iblrig.transfer.file_digest") as digest:
+            self.assertTrue(transfer.verify_copy(self.src, self.dst, video))
+        digest.assert_not_called()
+        self.assertTrue(transfer.verify_copy(self.src, self.dst, video, read_back=True))
+        # same size, corrupt content at the destination: only detected by reading it back
+        corrupt = bytearray(self.video)
+        corrupt[5000] ^= 0xFF
+        self.dst.joinpath(video).write_bytes(bytes(corrupt))
+        self.assertFalse(transfer.verify_copy(self.src, self.dst, video, read_back=True))
+        # truncated at the destination
+        self.dst.joinpath(video).write_bytes(self.video[:5000])
+        self.assertFalse(transfer.verify_copy(self.src, self.dst, video))
+        # source modified since its copy
+        self.dst.joinpath(video).write_bytes(self.video)
+        self.assertTrue(transfer.verify_copy(self.src, self.dst, video))
+        stat = self.src.joinpath(video).stat()
+        os.utime(self.src.joinpath(video), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertFalse(transfer.verify_copy(self.src, self.dst, video))
+
+    def test_copy_file_fsync_before_manifest(self):
+        src_file = self.src.joinpath("raw_video_data", "_iblrig_leftCamera.raw.avi")
+        dst_file = self.dst.joinpath("raw_video_data", "_iblrig_leftCamera.raw.avi")
+        manifest_file = dst_file.with_name(dst_file.name + transfer.MANIFEST_SUFFIX)
+        part_file = dst_file.with_name(dst_file.name + transfer.PART_SUFFIX)
+        synced = []
+
+        def fsync(fd):
+            if part_file.exists() and os.fstat(fd).st_ino == part_file.stat().st_ino:
+                nchunks = len(json.loads(manifest_file.read_text())["chunks"]) if manifest_file.exists() else 0
+                synced.append((part_file.stat().st_size, nchunks))
+
+        with mock.patch("iblrig.transfer.os.fsync", side_effect=fsync), \
+                mock.patch("iblrig.transfer._write_json", wraps=transfer._write_json) as write_json:
+            transfer.copy_file(src_file, dst_file, chunk_size=1024, manifest_chunks=4)
+        # every 4 chunks and at the end, the chunks are synced before the manifest lists them
+        self.assertEqual(synced, [(4096, 0), (8192, 4), (10000, 8)])
+        # 3 manifest updates and the last one with the file digest once the copy is complete
+        self.assertEqual(write_json.call_count, 4)
+        self.assertIsNotNone(json.loads(manifest_file.read_text())["digest"])
+
+    def test_monitor_throttle_and_pause(self):
+        src_file = self.src.joinpath("raw_video_data", "_iblrig_leftCamera.raw.avi")
+        pauses = [True, False]
+        monitor = transfer.TransferMonitor(
+            {src_file: len(self.video)}, max_bytes_per_sec=40_000, pause_if=lambda: pauses.pop(0),
+            pause_check_secs=0.05)
+        self.assertEqual(monitor.stats()["queue_depth"], 1)
+        monitor.file_started(src_file)
+        t0 = time.monotonic()
+        transfer.copy_file(src_file, self.dst / "copy.avi", chunk_size=1000, on_chunk=monitor.on_chunk)
+        # 10 kB at 40 kB/s, the first 40 kB of the bucket are already there: no wait
+        self.assertLess(time.monotonic() - t0, 0.5)
+        stats = monitor.stats()
+        self.assertEqual(stats["bytes_done"], len(self.video))
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertIn(str(src_file), stats["files"])
+        self.assertEqual(pauses, [])  # paused once, then resumed
+        monitor.file_done(src_file)
+        self.assertEqual(monitor.stats()["eta_secs"], 0)
+        bucket = transfer.TokenBucket(100_000)
+        bucket.consume(100_000)
+        self.assertAlmostEqual(bucket.consume(20_000), 0.2, delta=0.05)
+
+    def test_is_acquiring(self):
+        subjects_folder = Path(self.tdir.name).joinpath("local")
+        today = self.src.parent.with_name(time.strftime("%Y-%m-%d"))
+        self.assertFalse(transfer.is_acquiring(subjects_folder))
+        self.src.parent.rename(today)
+        self.assertFalse(transfer.is_acquiring(subjects_folder))  # session with a transfer_me.flag
+        today.joinpath("001", "transfer_me.flag").unlink()
+        self.assertTrue(transfer.is_acquiring(subjects_folder))
+        self.assertFalse(transfer.is_acquiring(subjects_folder, idle_secs=0))
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)
@@ -0,0 +1,43 @@
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from iblrig.trial_timing import TIMING_FILE_NAME, TrialTimer
+
+
+class TestTrialTimer(unittest.TestCase):
+    def test_timer(self):
+        timer = TrialTimer(phases=("next_trial", "run_state_machine", "update_fig"))
+        for i in range(3):
+            with timer.span("next_trial"):
+                time.sleep(0.01)
+            with timer.span("run_state_machine"):
+                pass
+            # a phase run twice in a trial adds up, a phase not run is NaN
+            if i > 0:
+                for _ in range(2):
+                    with timer.span("update_fig"):
+                        time.sleep(0.01)
+            timer.end_trial()
+        timing = timer.to_numpy()
+        self.assertEqual(timing.shape, (3,))
+        self.assertEqual(timing.dtype.names, ("next_trial", "run_state_machine", "update_fig"))
+        self.assertTrue(np.all(timing["next_trial"] >= 0.01))
+        self.assertTrue(np.isnan(timing["update_fig"][0]))
+        self.assertTrue(np.all(timing["update_fig"][1:] >= 0.02))
+        with tempfile.TemporaryDirectory() as td:
+            file_path = timer.save(td)
+            self.assertEqual(file_path.name, TIMING_FILE_NAME)
+            loaded = np.load(file_path)
+            for name in timing.dtype.names:
+                np.testing.assert_array_equal(loaded[name], timing[name])
+        summary = timer.summary()
+        self.assertIn("over 3 trials", summary)
+        self.assertIn("inter-trial overhead", summary)
+        self.assertEqual(len(summary.splitlines()), 6)
+
+
+if __name__ == "__main__":
+    unittest.main(exit=False)